@@ -8,7 +8,8 @@ hiddenimports = [
     'uvicorn.protocols', 'uvicorn.protocols.http', 'uvicorn.protocols.http.auto',
     'uvicorn.protocols.websockets', 'uvicorn.protocols.websockets.auto',
     'uvicorn.lifespan', 'uvicorn.lifespan.on',
-    'meshtastic', 'meshtastic.serial_interface', 'meshtastic.tcp_interface',
+    'meshtastic', 'meshtastic.serial_interface', 'meshtastic.tcp_interface', 'meshtastic.ble_interface',
+    'server', 'daemon',
     'aiosqlite', 'websockets', 'websockets.legacy', 'websockets.legacy.server',
 ]
 
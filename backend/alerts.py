@@ -0,0 +1,417 @@
+"""Keyword / regex alerts on incoming text messages.
+
+All rules are compiled together, so a text is scanned a fixed number of times
+however many rules there are. Keywords go into Aho-Corasick automata (one
+case-sensitive, one case-insensitive). A regex that can only match where some
+literal occurs ("mayday", "code" or "sos" in `(code|sos)\s*\d+`) puts those
+literals into the same automata and only runs when one of them is found.
+The remaining regexes are joined into one pattern, each rule in its own
+optional lookahead, so rules matching at the same or overlapping positions
+all fire from one pass.
+
+Rules come from ALERT_RULES (a JSON list) and ALERT_RULES_FILE. The file is
+re-read when it changes, and reload() rebuilds the rules on demand.
+"""
+import json
+import logging
+import os
+import re
+import time
+from collections import deque
+from pathlib import Path
+from typing import Any, Dict, Iterable, Iterator, List, Optional, Set, Tuple
+
+from schemas import AlertRule
+from settings import settings
+
+logger = logging.getLogger(__name__)
+
+# How often the dispatcher thread looks at the rules file's mtime
+RELOAD_CHECK_INTERVAL = 5.0
+
+
+class AhoCorasick:
+    """Finds every occurrence of many keywords in one pass over the text."""
+
+    def __init__(self, keywords: Iterable[Tuple[str, Any]]):
+        self._goto: List[Dict[str, int]] = [{}]
+        self._fail: List[int] = [0]
+        # Per state: (keyword length, value) of every keyword ending there
+        self._out: List[List[Tuple[int, Any]]] = [[]]
+
+        for word, value in keywords:
+            state = 0
+            for ch in word:
+                next_state = self._goto[state].get(ch)
+                if next_state is None:
+                    next_state = len(self._goto)
+                    self._goto[state][ch] = next_state
+                    self._goto.append({})
+                    self._fail.append(0)
+                    self._out.append([])
+                state = next_state
+            self._out[state].append((len(word), value))
+
+        # Failure links in BFS order, so a state's fallback is final before its children
+        queue = deque(self._goto[0].values())
+        while queue:
+            state = queue.popleft()
+            for ch, child in self._goto[state].items():
+                queue.append(child)
+                fallback = self._fail[state]
+                while fallback and ch not in self._goto[fallback]:
+                    fallback = self._fail[fallback]
+                self._fail[child] = self._goto[fallback].get(ch, 0)
+                self._out[child] += self._out[self._fail[child]]
+
+    def iter_matches(self, text: str) -> Iterator[Tuple[int, int, Any]]:
+        """(start, end, value) of every keyword occurrence, overlaps included."""
+        goto, fail, out = self._goto, self._fail, self._out
+        state = 0
+        for i, ch in enumerate(text):
+            while state and ch not in goto[state]:
+                state = fail[state]
+            state = goto[state].get(ch, 0)
+            for length, value in out[state]:
+                yield i + 1 - length, i + 1, value
+
+
+def _without_captures(pattern: str) -> Optional[str]:
+    """The pattern with its capturing groups made non-capturing.
+
+    None when it refers back to its groups (backreferences, conditionals),
+    such a rule can't join the combined pattern and is run on its own.
+    """
+    out = []
+    i, n = 0, len(pattern)
+    in_class = False
+    while i < n:
+        ch = pattern[i]
+        if ch == "\\":
+            if not in_class and pattern[i + 1:i + 2].isdigit() and pattern[i + 1] != "0":
+                return None
+            out.append(pattern[i:i + 2])
+            i += 2
+            continue
+        if in_class:
+            in_class = ch != "]"
+        elif ch == "[":
+            in_class = True
+            # A "]" right after "[" or "[^" is a literal
+            j = i + 1 + (pattern[i + 1:i + 2] == "^")
+            if pattern[j:j + 1] == "]":
+                out.append(pattern[i:j + 1])
+                i = j + 1
+                continue
+        elif ch == "(":
+            if pattern.startswith("(?P=", i) or pattern.startswith("(?(", i):
+                return None
+            if pattern.startswith("(?P<", i):
+                out.append("(?:")
+                i = pattern.index(">", i) + 1
+                continue
+            if not pattern.startswith("(?", i):
+                out.append("(?:")
+                i += 1
+                continue
+        out.append(ch)
+        i += 1
+    return "".join(out)
+
+
+_QUANTIFIER = re.compile(r"[?*+]|\{(\d*)(,\d*)?\}")
+# Characters that re.IGNORECASE equates with something str.lower() doesn't
+# (dotless i, Kelvin sign, long s, ...), never used as case-insensitive literals
+_UNSAFE_FOLDED = set("iks")
+
+
+def _skip_class(pattern: str, i: int) -> int:
+    """Index after the character class starting at pattern[i] == "["."""
+    i += 1 + (pattern[i + 1:i + 2] == "^")
+    if pattern[i:i + 1] == "]":
+        i += 1
+    while pattern[i] != "]":
+        i += 2 if pattern[i] == "\\" else 1
+    return i + 1
+
+
+def _required_literals(pattern: str, fold: bool) -> Optional[List[str]]:
+    """Literals of which every match of the pattern contains at least one.
+
+    None when no such set is found, the rule then has to run on every text.
+    With fold the literals are lower-cased, to look for in text.lower().
+    """
+    try:
+        literals, i = _alternation_literals(pattern, 0, fold)
+    except (IndexError, ValueError):
+        return None
+    return literals if i == len(pattern) else None
+
+
+def _alternation_literals(pattern: str, i: int, fold: bool) -> Tuple[Optional[List[str]], int]:
+    literals: Optional[List[str]] = []
+    while True:
+        branch, i = _branch_literals(pattern, i, fold)
+        if branch is None or literals is None:
+            literals = None
+        else:
+            literals += [literal for literal in branch if literal not in literals]
+        if pattern[i:i + 1] != "|":
+            return literals, i
+        i += 1
+
+
+def _branch_literals(pattern: str, i: int, fold: bool) -> Tuple[Optional[List[str]], int]:
+    # Each candidate is a list of literals one of which every match contains
+    candidates: List[List[str]] = []
+    run = ""
+    n = len(pattern)
+    while i < n and pattern[i] not in "|)":
+        ch = pattern[i]
+        literal = group = None
+        if ch == "\\":
+            if pattern[i + 1] in "xuUN0123456789":
+                # Character codes and backreferences, not worth decoding here
+                raise ValueError(pattern)
+            if not pattern[i + 1].isalnum():
+                literal = pattern[i + 1]
+            i += 2
+        elif ch == "[":
+            i = _skip_class(pattern, i)
+        elif ch == "(":
+            if pattern.startswith("(?#", i):
+                i = pattern.index(")", i) + 1
+                continue
+            if pattern.startswith("(?P=", i):
+                i = pattern.index(")", i) + 1
+            else:
+                plain = True
+                if pattern.startswith("(?P<", i):
+                    i = pattern.index(">", i) + 1
+                elif pattern.startswith("(?:", i) or pattern.startswith("(?>", i):
+                    i += 3
+                elif pattern.startswith("(?(", i):
+                    i, plain = pattern.index(")", i) + 1, False
+                elif pattern.startswith("(?", i):
+                    # Lookarounds and scoped flags: matched text isn't a plain sequence
+                    i, plain = pattern.index(":", i) + 1 if pattern[i + 2] not in "=!<" else i + 3, False
+                    i += pattern[i - 1] == "<"
+                else:
+                    i += 1
+                inner, i = _alternation_literals(pattern, i, fold)
+                if pattern[i] != ")":
+                    raise ValueError(pattern)
+                i += 1
+                group = inner if plain else None
+        elif ch in ".^$":
+            i += 1
+        else:
+            literal = ch
+            i += 1
+        if literal is not None and fold:
+            literal = literal.lower() if literal.isascii() and literal.lower() not in _UNSAFE_FOLDED else None
+
+        quantifier = _QUANTIFIER.match(pattern, i)
+        if quantifier and quantifier.group() == "{}":
+            quantifier = None
+        minimum = 1
+        if quantifier:
+            i = quantifier.end()
+            if pattern[i:i + 1] in ("?", "+"):
+                i += 1
+            token = quantifier.group()
+            minimum = 0 if token in "?*" else 1 if token == "+" else int(quantifier.group(1) or 0)
+
+        if literal is not None and minimum:
+            run += literal
+            if not quantifier:
+                continue
+        if run:
+            candidates.append([run])
+            run = ""
+        if group and minimum:
+            candidates.append(group)
+    if run:
+        candidates.append([run])
+    if not candidates:
+        return None, i
+    return max(candidates, key=lambda literals: min(len(literal) for literal in literals)), i
+
+
+def _is_word_boundary(text: str, start: int, end: int) -> bool:
+    return (start == 0 or not text[start - 1].isalnum()) and (end == len(text) or not text[end].isalnum())
+
+
+class CompiledAlerts:
+    """Immutable matcher for one rule set, swapped as a whole on reload."""
+
+    def __init__(self, rules: List[AlertRule]):
+        self.rules = rules
+        # Values are (rule, whole_word), or (rule, None) for a regex's literal
+        exact: List[Tuple[str, Tuple[int, Optional[bool]]]] = []
+        folded: List[Tuple[str, Tuple[int, Optional[bool]]]] = []
+        # Regexes run only when one of their literals was found
+        self._gated: Dict[int, re.Pattern] = {}
+        # Regexes without literals but with backreferences, run on their own
+        self._separate: List[Tuple[int, re.Pattern]] = []
+        combined: List[Tuple[int, str]] = []
+        for i, rule in enumerate(rules):
+            for keyword in rule.keywords:
+                if rule.case_sensitive:
+                    exact.append((keyword, (i, rule.whole_word)))
+                else:
+                    folded.append((keyword.lower(), (i, rule.whole_word)))
+            if not rule.regex:
+                continue
+            literals = _required_literals(rule.regex, not rule.case_sensitive)
+            body = _without_captures(rule.regex)
+            if literals:
+                (exact if rule.case_sensitive else folded).extend((literal, (i, None)) for literal in literals)
+                self._gated[i] = re.compile(rule.regex, 0 if rule.case_sensitive else re.IGNORECASE)
+            elif body is None:
+                self._separate.append((i, re.compile(rule.regex, 0 if rule.case_sensitive else re.IGNORECASE)))
+            else:
+                combined.append((i, body if rule.case_sensitive else f"(?i:{body})"))
+        self._exact = AhoCorasick(exact) if exact else None
+        self._folded = AhoCorasick(folded) if folded else None
+        # The leading alternation finds positions where some rule matches (one
+        # scan, with sre's first-character skipping); the optional lookaheads
+        # then capture every rule that matches there, overlaps included
+        self._regex = re.compile(
+            "(?=" + "|".join(f"(?:{body})" for _, body in combined) + ")"
+            + "".join(f"(?:(?=(?P<r{i}>{body}))|)" for i, body in combined)
+        ) if combined else None
+
+    def _scan(self, automaton: Optional[AhoCorasick], text: str, original: str,
+              found: Dict[int, List[str]], gated: Set[int]):
+        if automaton is None:
+            return
+        for start, end, (rule, whole_word) in automaton.iter_matches(text):
+            if whole_word is None:
+                gated.add(rule)
+            elif not whole_word or _is_word_boundary(text, start, end):
+                self._add_term(found, rule, original[start:end])
+
+    @staticmethod
+    def _add_term(found: Dict[int, List[str]], rule: int, term: str):
+        terms = found.setdefault(rule, [])
+        if term not in terms:
+            terms.append(term)
+
+    def match(self, text: str, channel: int, sender: Optional[str]) -> List[Dict[str, Any]]:
+        found: Dict[int, List[str]] = {}
+        gated: Set[int] = set()
+        self._scan(self._exact, text, text, found, gated)
+        if self._folded is not None:
+            folded = text.lower()
+            # lower() can change the length of a few exotic characters, offsets then point into folded
+            self._scan(self._folded, folded, text if len(folded) == len(text) else folded, found, gated)
+        for i in sorted(gated):
+            for m in self._gated[i].finditer(text):
+                if m.group():
+                    self._add_term(found, i, m.group())
+        if self._regex is not None:
+            # Matches of one rule don't overlap, like a finditer of that rule alone
+            ends: Dict[str, int] = {}
+            for m in self._regex.finditer(text):
+                for name, term in m.groupdict().items():
+                    if term and m.start(name) >= ends.get(name, 0):
+                        ends[name] = m.end(name)
+                        self._add_term(found, int(name[1:]), term)
+        for i, pattern in self._separate:
+            for m in pattern.finditer(text):
+                if m.group():
+                    self._add_term(found, i, m.group())
+
+        alerts = []
+        for i in sorted(found):
+            rule = self.rules[i]
+            if rule.channels and channel not in rule.channels:
+                continue
+            if rule.nodes and sender not in rule.nodes:
+                continue
+            alerts.append({"rule": rule.name or f"rule{i}", "severity": rule.severity, "matches": found[i]})
+        return alerts
+
+
+def load_rules() -> List[AlertRule]:
+    raw = list(settings.alert_rules)
+    if settings.alert_rules_file:
+        raw += json.loads(Path(settings.alert_rules_file).read_text(encoding="utf-8"))
+    return [AlertRule.model_validate(rule) for rule in raw]
+
+
+def _rules_file_mtime() -> Optional[float]:
+    if not settings.alert_rules_file:
+        return None
+    try:
+        return os.stat(settings.alert_rules_file).st_mtime
+    except OSError:
+        return None
+
+
+class AlertEngine:
+    """Runs on the packet dispatcher thread; reload() may come from any thread.
+
+    A reload builds a new CompiledAlerts and publishes it with one assignment,
+    so matching never sees a half-built rule set. A rules file that fails to
+    parse is logged and the previous rules stay active.
+    """
+
+    def __init__(self, rules: Optional[List[AlertRule]] = None):
+        self._compiled = CompiledAlerts(rules or [])
+        self._file_mtime = _rules_file_mtime()
+        self._next_check = time.monotonic() + RELOAD_CHECK_INTERVAL
+        self.texts = 0
+        self.alerts = 0
+        self.reloads = 0
+        self.reload_errors = 0
+        self.busy_seconds = 0.0
+
+    def reload(self) -> int:
+        """Re-read the rules, returns how many are active. Raises on invalid rules."""
+        self._file_mtime = _rules_file_mtime()
+        compiled = CompiledAlerts(load_rules())
+        self._compiled = compiled
+        self.reloads += 1
+        logger.info(f"Loaded {len(compiled.rules)} alert rules")
+        return len(compiled.rules)
+
+    def _check_rules_file(self, now: float):
+        self._next_check = now + RELOAD_CHECK_INTERVAL
+        mtime = _rules_file_mtime()
+        if mtime == self._file_mtime:
+            return
+        try:
+            self.reload()
+        except Exception as e:
+            # Keep the old rules; the mtime is remembered so a broken file isn't re-parsed every check
+            self._file_mtime = mtime
+            self.reload_errors += 1
+            logger.error(f"Alert rules reload failed, keeping previous rules: {e}")
+
+    def match(self, text: str, channel: int, sender: Optional[str]) -> List[Dict[str, Any]]:
+        started = time.monotonic()
+        if started >= self._next_check:
+            self._check_rules_file(started)
+        compiled = self._compiled
+        if not compiled.rules or not text:
+            return []
+        alerts = compiled.match(text, channel, sender)
+        self.texts += 1
+        self.alerts += len(alerts)
+        self.busy_seconds += time.monotonic() - started
+        return alerts
+
+    def get_rules(self) -> List[Dict[str, Any]]:
+        return [rule.model_dump() for rule in self._compiled.rules]
+
+    def get_stats(self) -> Dict[str, Any]:
+        return {
+            "rules": len(self._compiled.rules),
+            "texts": self.texts,
+            "alerts": self.alerts,
+            "reloads": self.reloads,
+            "reload_errors": self.reload_errors,
+            "avg_us": round(self.busy_seconds / self.texts * 1e6, 1) if self.texts else None,
+        }
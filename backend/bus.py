@@ -0,0 +1,226 @@
+"""Local IPC bus between the radio-owner process and web workers.
+
+Frames are a 4-byte big-endian length followed by a JSON object. The owner
+publishes every event it broadcasts and answers RPC calls; workers relay the
+events to their WebSocket clients and forward radio operations as calls.
+The bus listens on a Unix socket path, or on host:port for a TCP loopback
+stand-in (Windows, tests).
+"""
+import asyncio
+import itertools
+import json
+import logging
+import os
+import struct
+from typing import Any, Awaitable, Callable, Dict, Optional, Set
+
+logger = logging.getLogger(__name__)
+
+_HEADER = struct.Struct(">I")
+MAX_FRAME = 64 * 1024 * 1024
+# Drop a worker that stops reading instead of buffering events without bound
+MAX_WRITE_BUFFER = 16 * 1024 * 1024
+
+
+def _is_tcp(address: str) -> bool:
+    host, sep, port = address.rpartition(":")
+    return bool(sep) and port.isdigit() and "/" not in address and "\\" not in address
+
+
+async def _open(address: str):
+    if _is_tcp(address):
+        host, _, port = address.rpartition(":")
+        return await asyncio.open_connection(host, int(port))
+    return await asyncio.open_unix_connection(address)
+
+
+def _encode(frame: Dict[str, Any]) -> bytes:
+    data = json.dumps(frame, default=str).encode("utf-8")
+    return _HEADER.pack(len(data)) + data
+
+
+async def _read_frame(reader: asyncio.StreamReader) -> Dict[str, Any]:
+    header = await reader.readexactly(_HEADER.size)
+    (length,) = _HEADER.unpack(header)
+    if length > MAX_FRAME:
+        raise ValueError(f"Bus frame too large: {length}")
+    return json.loads(await reader.readexactly(length))
+
+
+class BusServer:
+    """Runs in the radio-owner process."""
+
+    def __init__(
+        self,
+        handler: Callable[[str, list], Awaitable[Any]],
+        hello: Callable[[], Dict[str, Any]],
+    ):
+        self._handler = handler
+        self._hello = hello
+        self._server: Optional[asyncio.AbstractServer] = None
+        self._writers: Set[asyncio.StreamWriter] = set()
+        self.published = 0
+        self.calls = 0
+        self.dropped_workers = 0
+
+    async def start(self, address: str):
+        if _is_tcp(address):
+            host, _, port = address.rpartition(":")
+            self._server = await asyncio.start_server(self._serve, host, int(port))
+        else:
+            # A socket file left behind by a killed owner would fail the bind
+            if os.path.exists(address):
+                os.unlink(address)
+            self._server = await asyncio.start_unix_server(self._serve, address)
+        logger.info(f"Event bus listening on {address}")
+
+    async def stop(self):
+        for writer in list(self._writers):
+            writer.close()
+        if self._server:
+            self._server.close()
+            await self._server.wait_closed()
+            self._server = None
+
+    def publish(self, event: Dict[str, Any]):
+        """Send an event to every worker. Called on the event loop thread."""
+        if not self._writers:
+            return
+        frame = _encode({"op": "event", "event": event})
+        for writer in list(self._writers):
+            if writer.transport.get_write_buffer_size() > MAX_WRITE_BUFFER:
+                logger.warning("Bus worker is not reading, disconnecting it")
+                self.dropped_workers += 1
+                self._writers.discard(writer)
+                writer.close()
+                continue
+            writer.write(frame)
+        self.published += 1
+
+    async def _serve(self, reader: asyncio.StreamReader, writer: asyncio.StreamWriter):
+        writer.write(_encode({"op": "hello", **self._hello()}))
+        self._writers.add(writer)
+        try:
+            while True:
+                frame = await _read_frame(reader)
+                if frame.get("op") == "call":
+                    asyncio.create_task(self._call(writer, frame))
+        except (asyncio.IncompleteReadError, ConnectionError):
+            pass
+        except Exception as e:
+            logger.warning(f"Bus connection error: {e}")
+        finally:
+            self._writers.discard(writer)
+            writer.close()
+
+    async def _call(self, writer: asyncio.StreamWriter, frame: Dict[str, Any]):
+        self.calls += 1
+        try:
+            result = await self._handler(frame["method"], frame.get("args", []))
+            reply = {"op": "result", "id": frame["id"], "result": result}
+        except Exception as e:
+            reply = {"op": "error", "id": frame["id"], "error": str(e)}
+        if not writer.is_closing():
+            writer.write(_encode(reply))
+
+    def get_stats(self) -> Dict[str, Any]:
+        return {
+            "workers": len(self._writers),
+            "published": self.published,
+            "calls": self.calls,
+            "dropped_workers": self.dropped_workers,
+        }
+
+
+class BusClient:
+    """Runs in each web worker, reconnects to the owner until stopped."""
+
+    def __init__(
+        self,
+        on_event: Callable[[Dict[str, Any]], Awaitable[None]],
+        on_hello: Callable[[Dict[str, Any]], None],
+    ):
+        self._on_event = on_event
+        self._on_hello = on_hello
+        self._writer: Optional[asyncio.StreamWriter] = None
+        self._connected = asyncio.Event()
+        self._pending: Dict[int, asyncio.Future] = {}
+        self._ids = itertools.count(1)
+        self._task: Optional[asyncio.Task] = None
+        # Event deliveries in flight, one task per event like broadcast_sync
+        self._deliveries: Set[asyncio.Task] = set()
+        self.received = 0
+        self.disconnects = 0
+
+    def start(self, address: str):
+        self._task = asyncio.create_task(self._run(address))
+
+    async def stop(self):
+        if self._task:
+            self._task.cancel()
+            self._task = None
+        if self._writer:
+            self._writer.close()
+
+    async def _run(self, address: str):
+        while True:
+            try:
+                reader, writer = await _open(address)
+            except OSError:
+                await asyncio.sleep(1)
+                continue
+
+            self._writer = writer
+            self._connected.set()
+            try:
+                while True:
+                    frame = await _read_frame(reader)
+                    op = frame.get("op")
+                    if op == "event":
+                        self.received += 1
+                        # Never awaited here: a slow WebSocket client would stall the
+                        # reader, and with it every event and RPC result behind it
+                        delivery = asyncio.create_task(self._on_event(frame["event"]))
+                        self._deliveries.add(delivery)
+                        delivery.add_done_callback(self._deliveries.discard)
+                    elif op == "hello":
+                        self._on_hello(frame)
+                    elif op in ("result", "error"):
+                        future = self._pending.pop(frame["id"], None)
+                        if future and not future.done():
+                            if op == "result":
+                                future.set_result(frame.get("result"))
+                            else:
+                                future.set_exception(RuntimeError(frame.get("error")))
+            except (asyncio.IncompleteReadError, ConnectionError):
+                logger.warning("Lost connection to the radio owner, reconnecting")
+            finally:
+                self._connected.clear()
+                self._writer = None
+                writer.close()
+                for future in self._pending.values():
+                    if not future.done():
+                        future.set_exception(ConnectionError("Radio owner disconnected"))
+                self._pending.clear()
+                self.disconnects += 1
+            await asyncio.sleep(1)
+
+    async def call(self, method: str, *args, timeout: float = 30) -> Any:
+        await asyncio.wait_for(self._connected.wait(), timeout)
+        call_id = next(self._ids)
+        future = asyncio.get_running_loop().create_future()
+        self._pending[call_id] = future
+        self._writer.write(_encode({"op": "call", "id": call_id, "method": method, "args": list(args)}))
+        try:
+            return await asyncio.wait_for(future, timeout)
+        finally:
+            self._pending.pop(call_id, None)
+
+    def get_stats(self) -> Dict[str, Any]:
+        return {
+            "connected": self._connected.is_set(),
+            "received": self.received,
+            "disconnects": self.disconnects,
+            "pending_calls": len(self._pending),
+            "pending_deliveries": len(self._deliveries),
+        }
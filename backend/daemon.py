@@ -0,0 +1,129 @@
+"""Headless process modes: radio owner, ingest-only recorder and CLI commands.
+
+None of these import the web stack.
+"""
+import asyncio
+import logging
+from typing import Optional
+
+from meshtastic_manager import mesh_manager
+from websocket_manager import ws_manager
+from bus import BusServer
+from radio import LocalRadio, restore_connection
+from settings import get_bus_address
+from message_io import open_import_stream, iter_ndjson_batches
+import database as db
+import maintenance
+
+logger = logging.getLogger(__name__)
+
+
+async def _start():
+    await db.init_db()
+    await mesh_manager.load_state()
+    loop = asyncio.get_running_loop()
+    ws_manager.set_loop(loop)
+    mesh_manager.set_loop(loop)
+
+
+async def _run_forever():
+    """Run retention (if enabled) and presence sweeps until the process is stopped."""
+    maintenance_task = None
+    if maintenance.retention_enabled():
+        maintenance_task = asyncio.create_task(maintenance.maintenance_loop())
+    presence_task = asyncio.create_task(mesh_manager.presence_loop())
+    try:
+        await asyncio.Event().wait()
+    finally:
+        presence_task.cancel()
+        if maintenance_task:
+            maintenance_task.cancel()
+
+
+async def run_radio_owner():
+    """Own the device connection and serve web workers over the event bus.
+
+    Used when uvicorn runs several workers: each of them would otherwise open
+    its own connection to the radio.
+    """
+    await _start()
+    local = LocalRadio()
+    server = BusServer(
+        lambda method, args: local.call(method, *args),
+        hello=lambda: {"epoch": ws_manager.epoch, "seq": ws_manager.seq},
+    )
+    await server.start(get_bus_address())
+    ws_manager.add_listener(server.publish)
+
+    await restore_connection()
+    try:
+        await _run_forever()
+    finally:
+        await server.stop()
+        mesh_manager.shutdown()
+        await db.close_db()
+
+
+async def run_ingest(
+    serial: Optional[str] = None,
+    tcp: Optional[str] = None,
+    ble: Optional[str] = None,
+) -> bool:
+    """Record packets to the database with no web server.
+
+    Connects to the given device, or to the last one saved by the web UI.
+    """
+    await _start()
+    # Nobody listens for events here, handlers that only broadcast are skipped
+    mesh_manager.handlers.broadcast_enabled = False
+    local = LocalRadio()
+    if serial:
+        await local.call("connect_serial", serial)
+    elif tcp:
+        host, _, port = tcp.partition(":")
+        await local.call("connect_tcp", host, int(port) if port else 4403)
+    elif ble:
+        await local.call("connect_ble", ble)
+    else:
+        await restore_connection()
+
+    try:
+        if not mesh_manager.connected:
+            logger.error("No radio connected: pass --serial, --tcp or --ble, or connect once from the web UI")
+            return False
+        logger.info(f"Ingesting from {mesh_manager.connection_type}://{mesh_manager.address}")
+        await _run_forever()
+        return True
+    finally:
+        mesh_manager.shutdown()
+        await db.close_db()
+
+
+async def import_files(paths: list[str]):
+    await db.init_db()
+    try:
+        for path in paths:
+            with open(path, "rb") as f:
+                stream = open_import_stream(f)
+                result = await db.import_messages(
+                    iter_ndjson_batches(stream, db.IMPORT_COLUMNS), offline=True
+                )
+            print(
+                f"{path}: read {result['read']}, inserted {result['inserted']}, "
+                f"skipped {result['skipped']} duplicate(s)"
+            )
+    finally:
+        await db.close_db()
+
+
+async def vacuum_database():
+    await db.init_db()
+    try:
+        if await db.auto_vacuum_mode() == 2:
+            print("Already in incremental auto-vacuum mode")
+            return
+        print("Converting to incremental auto-vacuum (full VACUUM, this can take a while)...")
+        await db.convert_auto_vacuum()
+        print("Done")
+    finally:
+        await db.close_db()
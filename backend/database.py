@@ -1,7 +1,20 @@
 import aiosqlite
 import asyncio
-from typing import Optional
-from settings import DB_PATH
+import json
+import time
+from typing import Optional, List, Tuple, Dict, AsyncIterator, Iterable, Iterator
+from message_cache import MessagePageCache, PageKey
+from settings import DB_PATH, settings
+
+
+# Conversation a message belongs to: a broadcast channel or a DM partner
+CONVERSATION_KEY_SQL = """
+    CASE
+        WHEN receiver IS NULL THEN 'channel:' || channel
+        WHEN is_outgoing THEN 'dm:' || receiver
+        ELSE 'dm:' || sender
+    END
+"""
 
 
 _db: Optional[aiosqlite.Connection] = None
@@ -14,6 +27,8 @@ async def get_db() -> aiosqlite.Connection:
         if _db is None:
             _db = await aiosqlite.connect(DB_PATH)
             _db.row_factory = aiosqlite.Row
+            # Web workers and the radio owner share the file, wait out each other's writes
+            await _db.execute("PRAGMA busy_timeout = 5000")
         return _db
 
 
@@ -25,8 +40,68 @@ async def close_db():
             _db = None
 
 
+# Text DATETIME (or ISO 8601) column to integer epoch milliseconds
+TEXT_TO_MS_SQL = "CAST(ROUND((julianday({column}) - 2440587.5) * 86400000) AS INTEGER)"
+
+# Secondary indexes on messages.
+# Conversation lookups end in rx_time_ms so history comes out of the index in order.
+MESSAGE_INDEXES = {
+    "idx_messages_channel_rx_time": "CREATE INDEX IF NOT EXISTS idx_messages_channel_rx_time ON messages(channel, rx_time_ms)",
+    "idx_messages_sender_receiver_rx_time": "CREATE INDEX IF NOT EXISTS idx_messages_sender_receiver_rx_time ON messages(sender, receiver, rx_time_ms)",
+    "idx_messages_packet_id": "CREATE INDEX IF NOT EXISTS idx_messages_packet_id ON messages(packet_id)",
+    "idx_messages_reply_id": "CREATE INDEX IF NOT EXISTS idx_messages_reply_id ON messages(reply_id)",
+    # Whole-history export and age-based retention
+    "idx_messages_rx_time": "CREATE INDEX IF NOT EXISTS idx_messages_rx_time ON messages(rx_time_ms)",
+}
+
+# Index used for deduplication, so offline imports keep it while the others are rebuilt
+_IMPORT_KEEP_INDEXES = {"idx_messages_packet_id"}
+
+# Imported rows inserted per transaction (online imports), bounds how long live writes wait
+IMPORT_CHUNK = 10000
+# Pause between import transactions. SQLite's busy handler retries at most
+# every 100 ms, so waiting writers get their turn instead of being starved.
+IMPORT_PAUSE = 0.15
+
+IMPORT_COLUMNS = (
+    "packet_id",
+    "sender",
+    "receiver",
+    "channel",
+    "text",
+    "timestamp",
+    "ack_status",
+    "is_outgoing",
+    "reply_id",
+    "rx_time_ms",
+)
+
+# Rows migrated per transaction when backfilling new columns
+BACKFILL_CHUNK = 10000
+
+# Bound parameters per IN (...) lookup, well under SQLITE_MAX_VARIABLE_NUMBER
+LOOKUP_CHUNK = 500
+# Reply chains deeper than this are cut off (also stops reply_id cycles)
+MAX_THREAD_DEPTH = 100
+# Parent fields embedded into replies by get_messages(with_parents=True)
+PARENT_COLUMNS = ("id", "packet_id", "sender", "text", "timestamp", "rx_time_ms", "is_outgoing")
+
+
+def now_ms() -> int:
+    return int(time.time() * 1000)
+
+
 async def init_db():
     db = await get_db()
+
+    # Incremental auto-vacuum lets retention reclaim pages in small steps. It
+    # only takes effect on a new database: existing ones need a full VACUUM,
+    # far too long a lock for startup, so that is left to `main.py vacuum`.
+    await db.execute("PRAGMA auto_vacuum = INCREMENTAL")
+
+    # WAL lets web workers read while the radio owner writes
+    await db.execute("PRAGMA journal_mode = WAL")
+
     await db.execute(
         """
         CREATE TABLE IF NOT EXISTS messages (
@@ -39,7 +114,9 @@ async def init_db():
             timestamp DATETIME DEFAULT CURRENT_TIMESTAMP,
             ack_status TEXT DEFAULT 'pending',
             is_outgoing INTEGER DEFAULT 0,
-            reply_id INTEGER
+            reply_id INTEGER,
+            rx_time_ms INTEGER,
+            inserted_ms INTEGER
         )
     """
     )
@@ -48,6 +125,7 @@ async def init_db():
         await db.execute("ALTER TABLE messages ADD COLUMN reply_id INTEGER")
     except:
         pass
+    await _migrate_epoch_columns(db)
 
     await db.execute(
         """
@@ -59,27 +137,204 @@ async def init_db():
     )
     await db.execute(
         """
-        CREATE INDEX IF NOT EXISTS idx_messages_channel ON messages(channel)
+        CREATE TABLE IF NOT EXISTS topology_edges (
+            source TEXT NOT NULL,
+            target TEXT NOT NULL,
+            snr REAL,
+            last_seen REAL NOT NULL,
+            observations INTEGER DEFAULT 1,
+            PRIMARY KEY (source, target)
+        )
     """
     )
     await db.execute(
         """
-        CREATE INDEX IF NOT EXISTS idx_messages_sender_receiver ON messages(sender, receiver)
+        CREATE TABLE IF NOT EXISTS waypoints (
+            id INTEGER PRIMARY KEY,
+            sender TEXT,
+            name TEXT,
+            description TEXT,
+            icon INTEGER,
+            latitude REAL,
+            longitude REAL,
+            expire INTEGER DEFAULT 0,
+            locked_to INTEGER,
+            updated DATETIME DEFAULT CURRENT_TIMESTAMP
+        )
     """
     )
+    # Polygon geofences, polygon is a JSON list of [lat, lon], nodes a JSON list of node ids
     await db.execute(
         """
-        CREATE INDEX IF NOT EXISTS idx_messages_packet_id ON messages(packet_id)
+        CREATE TABLE IF NOT EXISTS geofences (
+            id INTEGER PRIMARY KEY AUTOINCREMENT,
+            name TEXT NOT NULL,
+            polygon TEXT NOT NULL,
+            nodes TEXT NOT NULL DEFAULT '[]',
+            updated DATETIME DEFAULT CURRENT_TIMESTAMP
+        )
     """
     )
+    # Keyword / regex alert hits on incoming messages, matches is a JSON list
     await db.execute(
         """
-        CREATE INDEX IF NOT EXISTS idx_messages_reply_id ON messages(reply_id)
+        CREATE TABLE IF NOT EXISTS alerts (
+            id INTEGER PRIMARY KEY AUTOINCREMENT,
+            rule TEXT NOT NULL,
+            severity TEXT NOT NULL,
+            matches TEXT NOT NULL,
+            packet_id INTEGER,
+            sender TEXT,
+            receiver TEXT,
+            channel INTEGER,
+            text TEXT,
+            rx_time_ms INTEGER
+        )
     """
     )
+    # One row per channel / DM with the last message and counters, kept in step
+    # with messages so the chat list is a single read. Unread for a client is
+    # incoming_count minus what it has read; read_base covers history that was
+    # imported or backfilled, which nobody should see as new.
+    await db.execute(
+        """
+        CREATE TABLE IF NOT EXISTS conversations (
+            key TEXT PRIMARY KEY,
+            last_message_id INTEGER,
+            last_packet_id INTEGER,
+            last_sender TEXT,
+            last_text TEXT,
+            last_timestamp DATETIME,
+            last_ack_status TEXT,
+            last_is_outgoing INTEGER DEFAULT 0,
+            last_rx_time_ms INTEGER,
+            message_count INTEGER DEFAULT 0,
+            incoming_count INTEGER DEFAULT 0,
+            read_base INTEGER DEFAULT 0
+        )
+    """
+    )
+    try:
+        await db.execute("ALTER TABLE conversations ADD COLUMN last_rx_time_ms INTEGER")
+        await db.execute(
+            """UPDATE conversations SET last_rx_time_ms = (
+                   SELECT rx_time_ms FROM messages WHERE id = last_message_id
+               )"""
+        )
+    except aiosqlite.OperationalError:
+        pass
+    await db.execute(
+        """
+        CREATE TABLE IF NOT EXISTS conversation_reads (
+            client_id TEXT NOT NULL,
+            key TEXT NOT NULL,
+            last_read_id INTEGER,
+            read_count INTEGER DEFAULT 0,
+            PRIMARY KEY (client_id, key)
+        )
+    """
+    )
+    await db.execute("DROP INDEX IF EXISTS idx_conversations_last_timestamp")
+    await db.execute(
+        "CREATE INDEX IF NOT EXISTS idx_conversations_last_rx_time ON conversations(last_rx_time_ms)"
+    )
+    # Replaced by the rx_time_ms composites
+    await db.execute("DROP INDEX IF EXISTS idx_messages_channel")
+    await db.execute("DROP INDEX IF EXISTS idx_messages_sender_receiver")
+    for ddl in MESSAGE_INDEXES.values():
+        await db.execute(ddl)
+
+    cursor = await db.execute("SELECT EXISTS (SELECT 1 FROM conversations)")
+    if not (await cursor.fetchone())[0]:
+        # First start with this table: summarize the existing history
+        await _apply_conversations(db, 0, historical=True)
     await db.commit()
 
 
+async def _migrate_epoch_columns(db: aiosqlite.Connection):
+    """Add integer rx_time_ms / inserted_ms columns and backfill them from `timestamp`.
+
+    Rows are converted BACKFILL_CHUNK at a time, each chunk in its own
+    transaction, so a large history doesn't hold one huge write lock.
+    """
+    for column in ("rx_time_ms", "inserted_ms"):
+        try:
+            await db.execute(f"ALTER TABLE messages ADD COLUMN {column} INTEGER")
+        except aiosqlite.OperationalError:
+            pass
+    await db.commit()
+
+    # Unparseable timestamps become 0 so every row leaves the backfill set
+    converted = f"COALESCE({TEXT_TO_MS_SQL.format(column='timestamp')}, 0)"
+    while True:
+        cursor = await db.execute(
+            f"""UPDATE messages SET rx_time_ms = {converted}, inserted_ms = {converted}
+                WHERE id IN (SELECT id FROM messages WHERE rx_time_ms IS NULL LIMIT ?)""",
+            (BACKFILL_CHUNK,),
+        )
+        await db.commit()
+        if cursor.rowcount < BACKFILL_CHUNK:
+            break
+
+
+def _take_if_newer(column: str) -> str:
+    return (
+        f"{column} = CASE WHEN conversations.last_message_id IS NULL"
+        f" OR excluded.last_rx_time_ms >= conversations.last_rx_time_ms"
+        f" THEN excluded.{column} ELSE conversations.{column} END"
+    )
+
+
+_LAST_COLUMNS = (
+    "last_message_id",
+    "last_packet_id",
+    "last_sender",
+    "last_text",
+    "last_timestamp",
+    "last_ack_status",
+    "last_is_outgoing",
+    "last_rx_time_ms",
+)
+
+
+async def _apply_conversations(
+    db: aiosqlite.Connection, after_id: int, historical: bool = False, until_id: Optional[int] = None
+):
+    """Fold messages with after_id < id (<= until_id) into the conversations table.
+
+    Runs inside the caller's transaction. Historical rows (imports, backfill)
+    update previews and counts but are not reported as unread. until_id keeps
+    rows of concurrent saves on the shared connection out, they fold themselves.
+    """
+    await db.execute(
+        f"""
+        INSERT INTO conversations (key, {", ".join(_LAST_COLUMNS)},
+                                   message_count, incoming_count, read_base)
+        SELECT key, id, packet_id, sender, text, timestamp, ack_status, is_outgoing, rx_time_ms,
+               total, incoming, CASE WHEN ? THEN incoming ELSE 0 END
+        FROM (
+            SELECT {CONVERSATION_KEY_SQL} AS key, id, packet_id, sender, text, timestamp,
+                   ack_status, is_outgoing, rx_time_ms,
+                   COUNT(*) OVER conversation AS total,
+                   SUM(is_outgoing = 0) OVER conversation AS incoming,
+                   ROW_NUMBER() OVER (
+                       PARTITION BY {CONVERSATION_KEY_SQL} ORDER BY rx_time_ms DESC, id DESC
+                   ) AS rn
+            FROM messages
+            WHERE id > ? AND id <= ?
+            WINDOW conversation AS (PARTITION BY {CONVERSATION_KEY_SQL})
+        )
+        WHERE rn = 1
+        ON CONFLICT(key) DO UPDATE SET
+            {", ".join(_take_if_newer(column) for column in _LAST_COLUMNS)},
+            message_count = conversations.message_count + excluded.message_count,
+            incoming_count = conversations.incoming_count + excluded.incoming_count,
+            read_base = conversations.read_base + excluded.read_base
+        """,
+        (int(historical), after_id, until_id if until_id is not None else 2**63 - 1),
+    )
+
+
 async def save_message(
     packet_id: Optional[int],
     sender: str,
@@ -89,23 +344,34 @@ async def save_message(
     is_outgoing: bool = False,
     ack_status: str = "pending",
     reply_id: Optional[int] = None,
+    rx_time: Optional[float] = None,
 ) -> int:
+    """rx_time is the packet's rxTime in epoch seconds, insert time when unknown"""
     db = await get_db()
+    inserted_ms = now_ms()
+    message = {
+        "packet_id": packet_id,
+        "sender": sender,
+        "receiver": receiver,
+        "channel": channel,
+        "text": text,
+        # Same format as CURRENT_TIMESTAMP, so the cached row matches the stored one
+        "timestamp": time.strftime("%Y-%m-%d %H:%M:%S", time.gmtime(inserted_ms / 1000)),
+        "ack_status": ack_status,
+        "is_outgoing": int(is_outgoing),
+        "reply_id": reply_id,
+        "rx_time_ms": int(rx_time * 1000) if rx_time else inserted_ms,
+        "inserted_ms": inserted_ms,
+    }
+    message_cache.begin_write()
     cursor = await db.execute(
-        """INSERT INTO messages (packet_id, sender, receiver, channel, text, is_outgoing, ack_status, reply_id)
-           VALUES (?, ?, ?, ?, ?, ?, ?, ?)""",
-        (
-            packet_id,
-            sender,
-            receiver,
-            channel,
-            text,
-            int(is_outgoing),
-            ack_status,
-            reply_id,
-        ),
+        f"""INSERT INTO messages ({", ".join(message)})
+            VALUES ({", ".join("?" for _ in message)})""",
+        tuple(message.values()),
     )
+    await _apply_conversations(db, cursor.lastrowid - 1, until_id=cursor.lastrowid)
     await db.commit()
+    message_cache.insert({"id": cursor.lastrowid, **message})
     return cursor.lastrowid
 
 
@@ -115,7 +381,56 @@ async def update_message_ack(packet_id: int, ack_status: str):
         "UPDATE messages SET ack_status = ? WHERE packet_id = ?",
         (ack_status, packet_id),
     )
+    await db.execute(
+        "UPDATE conversations SET last_ack_status = ? WHERE last_packet_id = ?",
+        (ack_status, packet_id),
+    )
     await db.commit()
+    message_cache.update_ack(packet_id, ack_status)
+
+
+def _conversation_filter(
+    channel: Optional[int] = None,
+    dm_partner: Optional[str] = None,
+    my_node_id: Optional[str] = None,
+) -> Tuple[str, tuple]:
+    """WHERE clause (or empty string) selecting one conversation's messages."""
+    if dm_partner and my_node_id:
+        return (
+            """WHERE channel = 0 AND (
+                   (sender = ? AND receiver = ?) OR
+                   (sender = ? AND receiver = ?)
+               )""",
+            (my_node_id, dm_partner, dm_partner, my_node_id),
+        )
+    if dm_partner:
+        return (
+            "WHERE (sender = ? OR receiver = ?) AND channel = 0",
+            (dm_partner, dm_partner),
+        )
+    if channel is not None:
+        return "WHERE channel = ?", (channel,)
+    return "", ()
+
+
+def _conversation_matches(key: PageKey, message: dict) -> bool:
+    """Python twin of _conversation_filter, for keeping cached pages current."""
+    channel, dm_partner, my_node_id = key
+    if dm_partner and my_node_id:
+        return message["channel"] == 0 and (
+            (message["sender"], message["receiver"]) in ((my_node_id, dm_partner), (dm_partner, my_node_id))
+        )
+    if dm_partner:
+        return message["channel"] == 0 and dm_partner in (message["sender"], message["receiver"])
+    if channel is not None:
+        return message["channel"] == channel
+    return True
+
+
+message_cache = MessagePageCache(
+    settings.message_cache_bytes if settings.process_role != "worker" else 0,
+    _conversation_matches,
+)
 
 
 async def get_messages(
@@ -123,36 +438,580 @@ async def get_messages(
     dm_partner: Optional[str] = None,
     my_node_id: Optional[str] = None,
     limit: int = 100,
+    with_parents: bool = False,
 ):
+    """Latest `limit` messages, oldest first.
+
+    Served from message_cache when the conversation's latest page is cached;
+    the returned dicts are shared with the cache and must not be modified.
+    With with_parents every reply gets a `reply_to` dict (or None when the
+    parent isn't stored). Parents on the page are used directly, the rest are
+    resolved with one batched lookup.
+    """
+    key = (channel, dm_partner, my_node_id)
+    messages = message_cache.get(key, limit)
+    if messages is None:
+        version = message_cache.version
+        db = await get_db()
+        where, params = _conversation_filter(channel, dm_partner, my_node_id)
+        cursor = await db.execute(
+            f"SELECT * FROM messages {where} ORDER BY rx_time_ms DESC, id DESC LIMIT ?",
+            (*params, limit),
+        )
+        rows = await cursor.fetchall()
+        messages = [dict(row) for row in reversed(rows)]
+        message_cache.put(key, limit, messages, version)
+    if with_parents:
+        parents = {m["packet_id"]: m for m in messages if m["packet_id"] is not None}
+        parents.update(await get_messages_by_packet_id(
+            {m["reply_id"] for m in messages if m["reply_id"] is not None} - parents.keys()
+        ))
+        embedded = []
+        for message in messages:
+            parent = parents.get(message["reply_id"])
+            reply_to = {k: parent[k] for k in PARENT_COLUMNS} if parent else None
+            embedded.append({**message, "reply_to": reply_to})
+        messages = embedded
+    return messages
+
+
+async def get_messages_by_packet_id(packet_ids: Iterable[int]) -> Dict[int, dict]:
+    """packet_id -> latest stored message with that packet id."""
+    packet_ids = list(packet_ids)
+    result: Dict[int, dict] = {}
+    if not packet_ids:
+        return result
     db = await get_db()
-    if dm_partner and my_node_id:
+    for start in range(0, len(packet_ids), LOOKUP_CHUNK):
+        chunk = packet_ids[start:start + LOOKUP_CHUNK]
         cursor = await db.execute(
-            """SELECT * FROM messages
-               WHERE channel = 0 AND (
-                   (sender = ? AND receiver = ?) OR
-                   (sender = ? AND receiver = ?)
-               )
-               ORDER BY timestamp DESC LIMIT ?""",
-            (my_node_id, dm_partner, dm_partner, my_node_id, limit),
+            f"""SELECT * FROM messages WHERE id IN (
+                    SELECT MAX(id) FROM messages
+                    WHERE packet_id IN ({", ".join("?" for _ in chunk)})
+                    GROUP BY packet_id
+                )""",
+            chunk,
         )
-    elif dm_partner:
+        for row in await cursor.fetchall():
+            result[row["packet_id"]] = dict(row)
+    return result
+
+
+async def get_thread(packet_id: int) -> List[dict]:
+    """The whole reply chain around a message, oldest first.
+
+    Walks reply_id up to the root, then collects every reply below it. Each
+    message carries its `depth` below the root. Empty if the packet is unknown.
+    """
+    db = await get_db()
+    cursor = await db.execute(
+        """WITH RECURSIVE
+               ancestors(packet_id, reply_id, depth) AS (
+                   SELECT packet_id, reply_id, 0 FROM messages
+                   WHERE id = (SELECT MAX(id) FROM messages WHERE packet_id = ?)
+                   UNION
+                   SELECT m.packet_id, m.reply_id, a.depth + 1
+                   FROM messages m JOIN ancestors a ON m.packet_id = a.reply_id
+                   WHERE a.depth < ?
+               ),
+               root(packet_id) AS (
+                   SELECT packet_id FROM ancestors ORDER BY depth DESC LIMIT 1
+               ),
+               thread(id, packet_id, depth) AS (
+                   SELECT m.id, m.packet_id, 0 FROM messages m JOIN root r ON m.packet_id = r.packet_id
+                   UNION
+                   SELECT m.id, m.packet_id, t.depth + 1
+                   FROM messages m JOIN thread t ON m.reply_id = t.packet_id
+                   WHERE t.depth < ?
+               )
+           SELECT m.*, MIN(t.depth) AS depth
+           FROM thread t JOIN messages m ON m.id = t.id
+           GROUP BY m.id
+           ORDER BY m.rx_time_ms, m.id""",
+        (packet_id, MAX_THREAD_DEPTH, MAX_THREAD_DEPTH),
+    )
+    rows = await cursor.fetchall()
+    return [dict(row) for row in rows]
+
+
+async def get_dm_partners(limit: int = 20) -> List[str]:
+    """DM partners ordered by most recent activity."""
+    db = await get_db()
+    cursor = await db.execute(
+        """SELECT CASE WHEN is_outgoing THEN receiver ELSE sender END AS partner,
+                  MAX(rx_time_ms) AS last_rx_time_ms, MAX(id) AS last_id
+           FROM messages
+           WHERE receiver IS NOT NULL
+           GROUP BY partner
+           ORDER BY last_rx_time_ms DESC, last_id DESC LIMIT ?""",
+        (limit,),
+    )
+    rows = await cursor.fetchall()
+    return [row["partner"] for row in rows]
+
+
+async def iter_messages(
+    channel: Optional[int] = None,
+    dm_partner: Optional[str] = None,
+    my_node_id: Optional[str] = None,
+    chunk_size: int = 1000,
+) -> AsyncIterator[List[dict]]:
+    """Yield a conversation's messages oldest first, `chunk_size` rows at a time.
+
+    Same order as get_messages (rx_time_ms, then id). Uses keyset pagination,
+    so no read transaction stays open between chunks and writers are never
+    blocked by a slow consumer.
+    """
+    db = await get_db()
+    where, params = _conversation_filter(channel, dm_partner, my_node_id)
+    keyset = "(rx_time_ms, id) > (?, ?)"
+    where = f"{where} AND {keyset}" if where else f"WHERE {keyset}"
+    last = (-(2**63), 0)
+    while True:
         cursor = await db.execute(
-            """SELECT * FROM messages
-               WHERE (sender = ? OR receiver = ?) AND channel = 0
-               ORDER BY timestamp DESC LIMIT ?""",
-            (dm_partner, dm_partner, limit),
+            f"SELECT * FROM messages {where} ORDER BY rx_time_ms, id LIMIT ?",
+            (*params, *last, chunk_size),
+        )
+        rows = await cursor.fetchall()
+        await cursor.close()
+        if not rows:
+            return
+        last = (rows[-1]["rx_time_ms"], rows[-1]["id"])
+        yield [dict(row) for row in rows]
+
+
+async def prepare_retention(max_rows: Optional[int]):
+    """Snapshot the per-conversation max_rows cutoffs for get_expired_messages.
+
+    One ranking pass per retention run, in history order (rx_time_ms, then
+    id): the cutoff is the newest row that no longer fits, so it stays valid
+    while older rows are deleted and new ones arrive.
+    """
+    db = await get_db()
+    await db.execute("DROP TABLE IF EXISTS temp.retention_cutoffs")
+    await db.execute(
+        """CREATE TEMP TABLE retention_cutoffs (
+               key TEXT PRIMARY KEY, rx_time_ms INTEGER NOT NULL, id INTEGER NOT NULL
+           )"""
+    )
+    if max_rows is not None:
+        await db.execute(
+            f"""INSERT INTO temp.retention_cutoffs (key, rx_time_ms, id)
+                SELECT key, rx_time_ms, id FROM (
+                    SELECT {CONVERSATION_KEY_SQL} AS key, rx_time_ms, id, ROW_NUMBER() OVER (
+                        PARTITION BY {CONVERSATION_KEY_SQL} ORDER BY rx_time_ms DESC, id DESC
+                    ) AS rn FROM messages
+                ) WHERE rn = ?""",
+            (max_rows + 1,),
         )
-    elif channel is not None:
+    await db.commit()
+
+
+async def get_expired_messages(
+    max_age_days: Optional[int] = None,
+    max_rows: Optional[int] = None,
+    after_id: int = 0,
+    limit: int = 1000,
+) -> List[dict]:
+    """Return up to `limit` messages with id > after_id that fall outside the retention policy.
+
+    max_rows uses the cutoffs taken by prepare_retention. Pass the last
+    returned id as after_id, so a run reads the table once; the scan follows
+    ids while the cutoff compares in history order.
+    """
+    conditions = []
+    params: list = []
+    if max_rows is not None:
+        conditions.append("(messages.rx_time_ms, messages.id) <= (cutoff.rx_time_ms, cutoff.id)")
+    if max_age_days is not None:
+        conditions.append("messages.rx_time_ms < ?")
+        params.append(now_ms() - max_age_days * 86400000)
+    if not conditions:
+        return []
+
+    db = await get_db()
+    join = (
+        f"LEFT JOIN temp.retention_cutoffs AS cutoff ON cutoff.key = {CONVERSATION_KEY_SQL}"
+        if max_rows is not None else ""
+    )
+    cursor = await db.execute(
+        f"""SELECT messages.* FROM messages {join}
+            WHERE messages.id > ? AND ({" OR ".join(conditions)})
+            ORDER BY messages.id LIMIT ?""",
+        (after_id, *params, limit),
+    )
+    rows = await cursor.fetchall()
+    return [dict(row) for row in rows]
+
+
+async def delete_messages(ids: List[int]):
+    """Delete messages and take them out of their conversations in the same transaction.
+
+    Counters are decremented (retention deletes the oldest rows, so they
+    were the first ones read: read counts shift down with them). A preview
+    whose message is gone is rebuilt from what is left, and conversations
+    left empty are dropped.
+    """
+    db = await get_db()
+    selected = json.dumps(ids)
+    cursor = await db.execute(
+        f"""SELECT key, COUNT(*) AS total, SUM(is_outgoing = 0) AS incoming FROM (
+                SELECT {CONVERSATION_KEY_SQL} AS key, is_outgoing FROM messages
+                WHERE id IN (SELECT value FROM json_each(?))
+            ) GROUP BY key""",
+        (selected,),
+    )
+    removed = [(row["total"], row["incoming"], row["key"]) for row in await cursor.fetchall()]
+    await db.execute("DELETE FROM messages WHERE id IN (SELECT value FROM json_each(?))", (selected,))
+    await db.executemany(
+        """UPDATE conversations SET
+               message_count = MAX(0, message_count - ?1),
+               incoming_count = MAX(0, incoming_count - ?2),
+               read_base = MAX(0, read_base - ?2)
+           WHERE key = ?3""",
+        removed,
+    )
+    await db.executemany(
+        "UPDATE conversation_reads SET read_count = MAX(0, read_count - ?2) WHERE key = ?3",
+        removed,
+    )
+    keys = json.dumps([key for _, _, key in removed])
+    # Only when a conversation's newest message expired, e.g. by age
+    await db.execute(
+        f"""UPDATE conversations SET ({", ".join(_LAST_COLUMNS)}) = (
+                SELECT id, packet_id, sender, text, timestamp, ack_status, is_outgoing, rx_time_ms
+                FROM messages WHERE {CONVERSATION_KEY_SQL} = conversations.key
+                ORDER BY rx_time_ms DESC, id DESC LIMIT 1
+            )
+            WHERE key IN (SELECT value FROM json_each(?))
+              AND NOT EXISTS (SELECT 1 FROM messages WHERE id = conversations.last_message_id)""",
+        (keys,),
+    )
+    for table in ("conversation_reads", "conversations"):
+        await db.execute(
+            f"""DELETE FROM {table} WHERE key IN (
+                    SELECT key FROM conversations
+                    WHERE key IN (SELECT value FROM json_each(?)) AND last_message_id IS NULL
+                )""",
+            (keys,),
+        )
+    await db.commit()
+    message_cache.clear()
+
+
+async def auto_vacuum_mode() -> int:
+    """0 none, 1 full, 2 incremental."""
+    db = await get_db()
+    cursor = await db.execute("PRAGMA auto_vacuum")
+    row = await cursor.fetchone()
+    return row[0]
+
+
+async def convert_auto_vacuum() -> bool:
+    """Switch an existing database to incremental auto-vacuum, False if it already is.
+
+    Rewrites the whole file under an exclusive lock: run it while nothing
+    else uses the database.
+    """
+    if await auto_vacuum_mode() == 2:
+        return False
+    db = await get_db()
+    await db.execute("PRAGMA auto_vacuum = INCREMENTAL")
+    await db.execute("VACUUM")
+    return True
+
+
+async def incremental_vacuum(pages: int) -> int:
+    """Free up to `pages` unused pages, returns how many free pages remain."""
+    db = await get_db()
+    cursor = await db.execute(f"PRAGMA incremental_vacuum({int(pages)})")
+    await cursor.fetchall()
+    cursor = await db.execute("PRAGMA freelist_count")
+    row = await cursor.fetchone()
+    return row[0]
+
+
+async def _insert_import_rows(db: aiosqlite.Connection, first: int, last: int, imported_ms: int) -> int:
+    """Insert import_rows with first < rowid <= last that aren't stored yet, inside the caller's transaction."""
+    columns = ", ".join(IMPORT_COLUMNS)
+    cursor = await db.execute("SELECT COALESCE(MAX(id), 0) FROM messages")
+    last_id = (await cursor.fetchone())[0]
+    cursor = await db.execute(
+        f"""INSERT INTO messages ({columns}, inserted_ms)
+            SELECT packet_id, sender, receiver, COALESCE(channel, 0), text,
+                   COALESCE(timestamp, CURRENT_TIMESTAMP),
+                   COALESCE(ack_status, 'received'), COALESCE(is_outgoing, 0), reply_id,
+                   COALESCE(rx_time_ms, {TEXT_TO_MS_SQL.format(column='timestamp')}, ?),
+                   ?
+            FROM import_rows s
+            WHERE s.rowid > ? AND s.rowid <= ?
+            AND (
+                (s.packet_id IS NOT NULL AND NOT EXISTS (
+                    SELECT 1 FROM messages m
+                    WHERE m.packet_id = s.packet_id AND m.sender = s.sender
+                ))
+                OR (s.packet_id IS NULL AND NOT EXISTS (
+                    SELECT 1 FROM messages m
+                    WHERE m.packet_id IS NULL AND m.sender = s.sender
+                      AND m.timestamp = s.timestamp AND m.text = s.text
+                ))
+            )
+            ORDER BY s.rowid""",
+        (imported_ms, imported_ms, first, last),
+    )
+    # Nobody else can insert while this transaction holds the write lock
+    await _apply_conversations(db, last_id, historical=True)
+    return cursor.rowcount
+
+
+async def import_messages(batches: Iterator[List[tuple]], offline: bool = False) -> dict:
+    """Bulk insert message rows (tuples in IMPORT_COLUMNS order).
+
+    Rows are loaded into a temp staging table with executemany and
+    deduplicated within the file there, without touching the history, then
+    inserted skipping rows already stored (packet_id, sender).
+
+    Online (the API, next to live writes) they go in IMPORT_CHUNK rows per
+    transaction with a pause in between, so live writes wait for one chunk
+    at most. Offline (`main.py import`, nothing else writing) everything goes
+    in one transaction with the secondary indexes dropped and rebuilt once.
+    """
+    columns = ", ".join(IMPORT_COLUMNS)
+    placeholders = ", ".join("?" for _ in IMPORT_COLUMNS)
+    read = 0
+    inserted = 0
+
+    async with aiosqlite.connect(DB_PATH, timeout=30) as db:
+        await db.execute(
+            """CREATE TEMP TABLE import_staging (
+                   packet_id INTEGER, sender TEXT, receiver TEXT, channel INTEGER,
+                   text TEXT, timestamp DATETIME, ack_status TEXT,
+                   is_outgoing INTEGER, reply_id INTEGER, rx_time_ms INTEGER
+               )"""
+        )
+        while True:
+            # File reading and parsing happens off the event loop
+            batch = await asyncio.to_thread(next, batches, None)
+            if batch is None:
+                break
+            await db.executemany(
+                f"INSERT INTO import_staging ({columns}) VALUES ({placeholders})",
+                batch,
+            )
+            read += len(batch)
+        # One row per message, rowids numbered in insert order
+        await db.execute(
+            f"""CREATE TEMP TABLE import_rows AS
+                SELECT {columns} FROM import_staging
+                WHERE rowid IN (
+                    SELECT MIN(rowid) FROM import_staging
+                    GROUP BY packet_id, sender,
+                             CASE WHEN packet_id IS NULL THEN timestamp || text END
+                )
+                ORDER BY timestamp, rowid"""
+        )
+        await db.execute("DROP TABLE import_staging")
+        await db.commit()
+        cursor = await db.execute("SELECT COALESCE(MAX(rowid), 0) FROM import_rows")
+        total = (await cursor.fetchone())[0]
+
+        imported_ms = now_ms()
+        if offline:
+            try:
+                await db.execute("BEGIN IMMEDIATE")
+                for name in MESSAGE_INDEXES.keys() - _IMPORT_KEEP_INDEXES:
+                    await db.execute(f"DROP INDEX IF EXISTS {name}")
+                inserted = await _insert_import_rows(db, 0, total, imported_ms)
+                for ddl in MESSAGE_INDEXES.values():
+                    await db.execute(ddl)
+                await db.commit()
+            except Exception:
+                await db.rollback()
+                raise
+            message_cache.clear()
+        else:
+            for first in range(0, total, IMPORT_CHUNK):
+                try:
+                    await db.execute("BEGIN IMMEDIATE")
+                    inserted += await _insert_import_rows(db, first, first + IMPORT_CHUNK, imported_ms)
+                    await db.commit()
+                except Exception:
+                    await db.rollback()
+                    raise
+                message_cache.clear()
+                await asyncio.sleep(IMPORT_PAUSE)
+
+    return {"read": read, "inserted": inserted, "skipped": read - inserted}
+
+
+async def get_conversations(client_id: str) -> List[dict]:
+    """Chat list with last message and unread count for one client, newest first."""
+    db = await get_db()
+    cursor = await db.execute(
+        """
+        SELECT c.key, c.last_message_id, c.last_packet_id, c.last_sender, c.last_text,
+               c.last_timestamp, c.last_ack_status, c.last_is_outgoing, c.last_rx_time_ms,
+               c.message_count,
+               MAX(0, c.incoming_count - MAX(c.read_base, COALESCE(r.read_count, 0))) AS unread,
+               r.last_read_id
+        FROM conversations c
+        LEFT JOIN conversation_reads r ON r.key = c.key AND r.client_id = ?
+        ORDER BY c.last_rx_time_ms DESC
+        """,
+        (client_id,),
+    )
+    return [dict(row) for row in await cursor.fetchall()]
+
+
+async def mark_conversation_read(client_id: str, key: str) -> bool:
+    """Mark everything currently in the conversation as read by the client."""
+    db = await get_db()
+    cursor = await db.execute(
+        """
+        INSERT INTO conversation_reads (client_id, key, last_read_id, read_count)
+        SELECT ?, key, last_message_id, incoming_count FROM conversations WHERE key = ?
+        ON CONFLICT(client_id, key) DO UPDATE SET
+            last_read_id = excluded.last_read_id,
+            read_count = excluded.read_count
+        """,
+        (client_id, key),
+    )
+    await db.commit()
+    return cursor.rowcount > 0
+
+
+async def get_topology_edges() -> List[tuple]:
+    db = await get_db()
+    cursor = await db.execute(
+        "SELECT source, target, snr, last_seen, observations FROM topology_edges"
+    )
+    return [tuple(row) for row in await cursor.fetchall()]
+
+
+async def save_topology_edges(rows: List[tuple], ttl: int):
+    """Upsert changed edges and drop those older than ttl seconds."""
+    db = await get_db()
+    await db.executemany(
+        """
+        INSERT OR REPLACE INTO topology_edges (source, target, snr, last_seen, observations)
+        VALUES (?, ?, ?, ?, ?)
+        """,
+        rows,
+    )
+    await db.execute(
+        "DELETE FROM topology_edges WHERE last_seen < strftime('%s', 'now') - ?", (ttl,)
+    )
+    await db.commit()
+
+
+async def save_waypoint(waypoint: dict):
+    db = await get_db()
+    await db.execute(
+        """
+        INSERT OR REPLACE INTO waypoints
+            (id, sender, name, description, icon, latitude, longitude, expire, locked_to)
+        VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?)
+        """,
+        (
+            waypoint["id"],
+            waypoint["from"],
+            waypoint["name"],
+            waypoint["description"],
+            waypoint["icon"],
+            waypoint["latitude"],
+            waypoint["longitude"],
+            waypoint["expire"],
+            waypoint["locked_to"],
+        ),
+    )
+    await db.commit()
+
+
+async def save_alert(alert: dict):
+    db = await get_db()
+    await db.execute(
+        """
+        INSERT INTO alerts (rule, severity, matches, packet_id, sender, receiver, channel, text, rx_time_ms)
+        VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?)
+        """,
+        (
+            alert["rule"],
+            alert["severity"],
+            json.dumps(alert["matches"]),
+            alert["packet_id"],
+            alert["sender"],
+            alert["receiver"],
+            alert["channel"],
+            alert["text"],
+            alert["rx_time_ms"],
+        ),
+    )
+    await db.commit()
+
+
+async def get_alerts(limit: int = 100) -> List[dict]:
+    """Latest alerts, newest first"""
+    db = await get_db()
+    cursor = await db.execute("SELECT * FROM alerts ORDER BY id DESC LIMIT ?", (limit,))
+    alerts = [dict(row) for row in await cursor.fetchall()]
+    for alert in alerts:
+        alert["matches"] = json.loads(alert["matches"])
+    return alerts
+
+
+def _geofence_row(row) -> dict:
+    fence = dict(row)
+    fence["polygon"] = json.loads(fence["polygon"])
+    fence["nodes"] = json.loads(fence["nodes"])
+    return fence
+
+
+async def get_geofences() -> List[dict]:
+    db = await get_db()
+    cursor = await db.execute("SELECT * FROM geofences ORDER BY id")
+    return [_geofence_row(row) for row in await cursor.fetchall()]
+
+
+async def save_geofence(name: str, polygon: list, nodes: List[str], fence_id: Optional[int] = None) -> Optional[dict]:
+    """Create a fence, or update fence_id; returns the stored fence (None if fence_id doesn't exist)"""
+    db = await get_db()
+    if fence_id is None:
         cursor = await db.execute(
-            "SELECT * FROM messages WHERE channel = ? ORDER BY timestamp DESC LIMIT ?",
-            (channel, limit),
+            "INSERT INTO geofences (name, polygon, nodes) VALUES (?, ?, ?)",
+            (name, json.dumps(polygon), json.dumps(nodes)),
         )
+        fence_id = cursor.lastrowid
     else:
         cursor = await db.execute(
-            "SELECT * FROM messages ORDER BY timestamp DESC LIMIT ?", (limit,)
+            """UPDATE geofences SET name = ?, polygon = ?, nodes = ?, updated = CURRENT_TIMESTAMP
+               WHERE id = ?""",
+            (name, json.dumps(polygon), json.dumps(nodes), fence_id),
         )
-    rows = await cursor.fetchall()
-    return [dict(row) for row in reversed(rows)]
+        if cursor.rowcount == 0:
+            return None
+    await db.commit()
+    cursor = await db.execute("SELECT * FROM geofences WHERE id = ?", (fence_id,))
+    return _geofence_row(await cursor.fetchone())
+
+
+async def delete_geofence(fence_id: int) -> bool:
+    db = await get_db()
+    cursor = await db.execute("DELETE FROM geofences WHERE id = ?", (fence_id,))
+    await db.commit()
+    return cursor.rowcount > 0
+
+
+async def get_waypoints() -> List[dict]:
+    """Waypoints that haven't expired (expire 0 means never)"""
+    db = await get_db()
+    cursor = await db.execute(
+        """
+        SELECT * FROM waypoints
+        WHERE expire = 0 OR expire > strftime('%s', 'now')
+        ORDER BY updated DESC
+        """
+    )
+    return [dict(row) for row in await cursor.fetchall()]
 
 
 async def save_setting(key: str, value: str):
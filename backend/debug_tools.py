@@ -0,0 +1,122 @@
+"""On-demand profiling and memory snapshots for /debug endpoints.
+
+Nothing here runs until a session is requested: the stack sampler is a thread
+that lives only for the requested duration, cProfile is enabled only while a
+profile is being taken, and tracemalloc traces only between an explicit start
+and stop. Only one profiling session runs at a time.
+"""
+import asyncio
+import cProfile
+import marshal
+import os
+import sys
+import threading
+import time
+import tracemalloc
+from collections import Counter
+from typing import Any, Dict, List, Optional
+
+# Frames kept per allocation traceback while tracemalloc is on
+TRACEMALLOC_FRAMES = 10
+
+_profile_lock = asyncio.Lock()
+_last_snapshot: Optional[tracemalloc.Snapshot] = None
+
+
+class SessionBusy(Exception):
+    pass
+
+
+def _frame_label(frame) -> str:
+    code = frame.f_code
+    return f"{code.co_name} ({os.path.basename(code.co_filename)}:{frame.f_lineno})"
+
+
+def _sample_stacks(seconds: float, interval: float) -> Counter:
+    """Sample every thread's stack; counts per collapsed stack ("thread;outer;...;inner")."""
+    me = threading.get_ident()
+    stacks: Counter = Counter()
+    deadline = time.monotonic() + seconds
+    while time.monotonic() < deadline:
+        names = {t.ident: t.name for t in threading.enumerate()}
+        for ident, frame in sys._current_frames().items():
+            if ident == me:
+                continue
+            labels = []
+            while frame is not None:
+                labels.append(_frame_label(frame))
+                frame = frame.f_back
+            labels.append(names.get(ident, str(ident)))
+            stacks[";".join(reversed(labels))] += 1
+        time.sleep(interval)
+    return stacks
+
+
+async def sample_profile(seconds: float, interval: float) -> str:
+    """Collapsed stacks of all threads (event loop, meshtastic reader, dispatcher), flamegraph.pl input."""
+    if _profile_lock.locked():
+        raise SessionBusy()
+    async with _profile_lock:
+        stacks = await asyncio.to_thread(_sample_stacks, seconds, interval)
+    return "".join(f"{stack} {count}\n" for stack, count in stacks.most_common())
+
+
+async def cprofile_event_loop(seconds: float) -> bytes:
+    """cProfile of the event loop thread for `seconds`, as a .pstats file (pstats.Stats can load it)."""
+    if _profile_lock.locked():
+        raise SessionBusy()
+    async with _profile_lock:
+        profile = cProfile.Profile()
+        profile.enable()
+        try:
+            await asyncio.sleep(seconds)
+        finally:
+            profile.disable()
+    profile.create_stats()
+    return marshal.dumps(profile.stats)
+
+
+def memory_snapshot(action: str, top: int) -> Dict[str, Any]:
+    """start / snapshot / stop tracemalloc; snapshots include the diff to the previous one."""
+    global _last_snapshot
+    if action == "stop":
+        tracemalloc.stop()
+        _last_snapshot = None
+        return {"tracing": False}
+    if not tracemalloc.is_tracing():
+        tracemalloc.start(TRACEMALLOC_FRAMES)
+        _last_snapshot = _take_snapshot()
+        return {"tracing": True, "started": True}
+    if action == "start":
+        return {"tracing": True, "started": False}
+
+    snapshot = _take_snapshot()
+    current, peak = tracemalloc.get_traced_memory()
+    result: Dict[str, Any] = {
+        "tracing": True,
+        "traced_bytes": current,
+        "peak_bytes": peak,
+        "top": _format_stats(snapshot.statistics("lineno")[:top]),
+        "diff": None,
+    }
+    if _last_snapshot is not None:
+        result["diff"] = _format_stats(snapshot.compare_to(_last_snapshot, "lineno")[:top])
+    _last_snapshot = snapshot
+    return result
+
+
+def _take_snapshot() -> tracemalloc.Snapshot:
+    # Leave out tracemalloc's own bookkeeping
+    return tracemalloc.take_snapshot().filter_traces([tracemalloc.Filter(False, tracemalloc.__file__)])
+
+
+def _format_stats(stats: List[Any]) -> List[Dict[str, Any]]:
+    rows = []
+    for stat in stats:
+        frame = stat.traceback[0]
+        row = {"location": f"{frame.filename}:{frame.lineno}", "size": stat.size, "count": stat.count}
+        if hasattr(stat, "size_diff"):
+            row["size_diff"] = stat.size_diff
+            row["count_diff"] = stat.count_diff
+        rows.append(row)
+    return rows
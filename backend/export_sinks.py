@@ -0,0 +1,410 @@
+"""Export of the decoded packet stream (and /ws events) to other systems.
+
+Sinks are configured with EXPORT_SINKS. A record is encoded to one NDJSON
+line once, then handed to every interested sink. Each sink owns a bounded
+queue and a delivery thread that writes batches; a full queue drops records
+according to the sink's overflow policy, so a slow or dead sink never holds
+up the packet dispatcher.
+"""
+import base64
+import errno
+import json
+import logging
+import os
+import select
+import socket
+import struct
+import threading
+import time
+from abc import ABC, abstractmethod
+from collections import deque
+from pathlib import Path
+from typing import Any, Deque, Dict, Iterator, List, Optional, Tuple
+
+from schemas import ExportSinkConfig
+from settings import settings
+
+logger = logging.getLogger(__name__)
+
+# Pause before reconnecting a sink whose last delivery failed
+RETRY_DELAY = 5.0
+
+
+def _jsonable(value: Any) -> Any:
+    """Packet dicts from meshtastic carry bytes and protobuf objects ("raw")."""
+    if isinstance(value, dict):
+        return {k: _jsonable(v) for k, v in value.items() if k != "raw"}
+    if isinstance(value, (list, tuple)):
+        return [_jsonable(v) for v in value]
+    if isinstance(value, bytes):
+        return base64.b64encode(value).decode("ascii")
+    if value is None or isinstance(value, (str, int, float, bool)):
+        return value
+    return str(value)
+
+
+def encode_record(stream: str, data: Dict[str, Any]) -> bytes:
+    record = {"stream": stream, "time": time.time(), "data": _jsonable(data)}
+    return (json.dumps(record, ensure_ascii=False, separators=(",", ":")) + "\n").encode("utf-8")
+
+
+# (stream, encoded NDJSON line)
+Record = Tuple[str, bytes]
+
+
+class Sink(ABC):
+    """Queue, batching and delivery thread; subclasses implement write_batch (and open / close)."""
+
+    def __init__(self, config: ExportSinkConfig, index: int):
+        self.config = config
+        self.name = config.name or f"{config.type}{index}"
+        self._queue: Deque[Record] = deque(maxlen=config.queue_size if config.overflow == "drop_oldest" else None)
+        self._cond = threading.Condition()
+        self._thread: Optional[threading.Thread] = None
+        self._running = False
+        self._connected = False
+        self._retry_at = 0.0
+
+        self.enqueued = 0
+        self.delivered = 0
+        self.dropped = 0
+        self.failed = 0
+        self.batches = 0
+        self.max_depth = 0
+        self.last_error: Optional[str] = None
+        self._busy_time = 0.0
+
+    # Called on the producer side (dispatcher thread / event loop)
+    def put(self, stream: str, line: bytes):
+        with self._cond:
+            queue = self._queue
+            if len(queue) >= self.config.queue_size:
+                self.dropped += 1
+                if self.config.overflow == "drop_newest":
+                    return
+                # drop_oldest: the deque's maxlen discards the head on append
+            queue.append((stream, line))
+            self.enqueued += 1
+            if len(queue) > self.max_depth:
+                self.max_depth = len(queue)
+            if len(queue) >= self.config.batch_size:
+                self._cond.notify()
+
+    def start(self):
+        with self._cond:
+            if self._running:
+                return
+            self._running = True
+        self._thread = threading.Thread(target=self._run, name=f"meshradar-export-{self.name}", daemon=True)
+        self._thread.start()
+
+    def stop(self, timeout: float = 5.0):
+        with self._cond:
+            self._running = False
+            self._cond.notify_all()
+        if self._thread:
+            self._thread.join(timeout)
+            self._thread = None
+
+    def _take_batch(self) -> List[Record]:
+        with self._cond:
+            if self._running and len(self._queue) < self.config.batch_size:
+                self._cond.wait(self.config.flush_interval)
+            count = min(len(self._queue), self.config.batch_size)
+            return [self._queue.popleft() for _ in range(count)]
+
+    def _run(self):
+        while True:
+            with self._cond:
+                if not self._running and not self._queue:
+                    break
+            batch = self._take_batch()
+            if batch:
+                self._deliver(batch)
+            else:
+                self._idle()
+        self._disconnect()
+
+    def _deliver(self, batch: List[Record]):
+        now = time.monotonic()
+        if not self._connected:
+            if now < self._retry_at:
+                self.failed += len(batch)
+                return
+            try:
+                self.open()
+                self._connected = True
+            except Exception as e:
+                self._fail(batch, e)
+                return
+        started = time.perf_counter()
+        try:
+            lost = self.write_batch(batch) or 0
+        except Exception as e:
+            self._disconnect()
+            self._fail(batch, e)
+            return
+        self._busy_time += time.perf_counter() - started
+        self.delivered += len(batch) - lost
+        self.failed += lost
+        self.batches += 1
+
+    def _fail(self, batch: List[Record], error: Exception):
+        self.failed += len(batch)
+        self._retry_at = time.monotonic() + RETRY_DELAY
+        if str(error) != self.last_error:
+            logger.warning(f"Export sink {self.name} failed: {error}")
+        self.last_error = str(error)
+
+    def _disconnect(self):
+        if self._connected:
+            self._connected = False
+            try:
+                self.close()
+            except Exception:
+                pass
+
+    def _idle(self):
+        """Called after an empty flush interval (keepalives)."""
+
+    def open(self):
+        pass
+
+    @abstractmethod
+    def write_batch(self, batch: List[Record]) -> Optional[int]:
+        """Deliver a batch, returns how many records were lost (None: all delivered)."""
+
+    def close(self):
+        pass
+
+    def get_stats(self) -> Dict[str, Any]:
+        return {
+            "type": self.config.type,
+            "streams": self.config.streams,
+            "connected": self._connected,
+            "depth": len(self._queue),
+            "max_depth": self.max_depth,
+            "enqueued": self.enqueued,
+            "delivered": self.delivered,
+            "dropped": self.dropped,
+            "failed": self.failed,
+            "batches": self.batches,
+            "avg_batch_ms": round(self._busy_time / self.batches * 1000, 3) if self.batches else None,
+            "last_error": self.last_error,
+        }
+
+
+class FileSink(Sink):
+    """Appends NDJSON, rotating to path.1 ... path.N once the file exceeds max_bytes."""
+
+    def open(self):
+        path = Path(self.config.path)
+        path.parent.mkdir(parents=True, exist_ok=True)
+        self._file = open(path, "ab")
+
+    def write_batch(self, batch: List[Record]):
+        self._file.write(b"".join(line for _, line in batch))
+        self._file.flush()
+        if self._file.tell() >= self.config.max_bytes:
+            self._rotate()
+
+    def _rotate(self):
+        self._file.close()
+        path = self.config.path
+        for i in range(self.config.backups - 1, 0, -1):
+            if os.path.exists(f"{path}.{i}"):
+                os.replace(f"{path}.{i}", f"{path}.{i + 1}")
+        if self.config.backups > 0:
+            os.replace(path, f"{path}.1")
+        else:
+            os.remove(path)
+        self._file = open(path, "ab")
+
+    def close(self):
+        self._file.close()
+
+
+class DatagramSink(Sink):
+    """UDP or Unix datagrams, each packing as many whole NDJSON lines as fit in max_datagram.
+
+    Sends don't block: a datagram the kernel won't take right now (a Unix
+    reader that fell behind) is counted as failed, like a lost UDP packet.
+    Delivery is counted per datagram, and a record too large to ever be sent
+    (EMSGSIZE on its own) is dropped and logged rather than failing the batch.
+    """
+
+    def open(self):
+        if self.config.type == "unix":
+            self._socket = socket.socket(socket.AF_UNIX, socket.SOCK_DGRAM)
+            self._address: Any = self.config.path
+        else:
+            self._socket = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
+            self._address = (self.config.host, self.config.port)
+        self._socket.setblocking(False)
+
+    def _pack(self, batch: List[Record]) -> Iterator[List[bytes]]:
+        lines: List[bytes] = []
+        size = 0
+        for _, line in batch:
+            if lines and size + len(line) > self.config.max_datagram:
+                yield lines
+                lines, size = [], 0
+            lines.append(line)
+            size += len(line)
+        if lines:
+            yield lines
+
+    def _send(self, lines: List[bytes]) -> int:
+        """Send lines as one datagram, returns how many of them were lost."""
+        try:
+            self._socket.sendto(b"".join(lines), self._address)
+        except BlockingIOError:
+            return len(lines)
+        except OSError as e:
+            if e.errno != errno.EMSGSIZE:
+                raise
+            if len(lines) > 1:
+                # Over what the socket takes: try the records one by one
+                return sum(self._send([line]) for line in lines)
+            error = f"dropped a record too large to send: {e}"
+            if error != self.last_error:
+                logger.warning(f"Export sink {self.name} {error}")
+            self.last_error = error
+            return 1
+        return 0
+
+    def write_batch(self, batch: List[Record]) -> int:
+        lost = sent = 0
+        for lines in self._pack(batch):
+            try:
+                missed = self._send(lines)
+            except OSError:
+                if not sent:
+                    raise
+                # Part of the batch is out already: only the rest is lost, the next batch backs off
+                return len(batch) - sent
+            sent += len(lines) - missed
+            lost += missed
+        return lost
+
+    def close(self):
+        self._socket.close()
+
+
+def _mqtt_string(value: str) -> bytes:
+    data = value.encode("utf-8")
+    return struct.pack("!H", len(data)) + data
+
+
+def _mqtt_packet(header: int, body: bytes) -> bytes:
+    """Fixed header with the variable-length remaining length."""
+    length = len(body)
+    encoded = bytearray()
+    while True:
+        byte, length = length % 128, length // 128
+        encoded.append(byte | (0x80 if length else 0))
+        if not length:
+            break
+    return bytes([header]) + bytes(encoded) + body
+
+
+class MqttSink(Sink):
+    """Minimal MQTT 3.1.1 publisher: CONNECT, QoS 0 PUBLISH, PINGREQ. One record per message."""
+
+    def open(self):
+        self._socket = socket.create_connection((self.config.host, self.config.port or 1883), timeout=10)
+        flags = 0x02  # clean session
+        payload = _mqtt_string(self.config.client_id or f"meshradar-{os.getpid()}")
+        if self.config.username:
+            flags |= 0x80
+            payload += _mqtt_string(self.config.username)
+            if self.config.password:
+                flags |= 0x40
+                payload += _mqtt_string(self.config.password)
+        body = _mqtt_string("MQTT") + bytes([4, flags]) + struct.pack("!H", self.config.keepalive) + payload
+        self._socket.sendall(_mqtt_packet(0x10, body))
+        connack = self._socket.recv(4)
+        if len(connack) < 4 or connack[0] != 0x20 or connack[3] != 0:
+            self._socket.close()
+            raise ConnectionError(f"MQTT broker refused the connection: {connack!r}")
+        self._last_send = time.monotonic()
+
+    def write_batch(self, batch: List[Record]):
+        # All PUBLISH packets of a batch go out in one write
+        out = bytearray()
+        for stream, line in batch:
+            topic = f"{self.config.topic_prefix}/{stream}"
+            out += _mqtt_packet(0x30, _mqtt_string(topic) + line.rstrip(b"\n"))
+        self._socket.sendall(out)
+        self._last_send = time.monotonic()
+        self._drain()
+
+    def _idle(self):
+        if self._connected and time.monotonic() - self._last_send > self.config.keepalive / 2:
+            try:
+                self._socket.sendall(b"\xc0\x00")  # PINGREQ
+                self._last_send = time.monotonic()
+                self._drain()
+            except OSError as e:
+                self._disconnect()
+                self.last_error = str(e)
+
+    def _drain(self):
+        """Discard PINGRESPs and anything else the broker sends back."""
+        while select.select([self._socket], [], [], 0)[0]:
+            if not self._socket.recv(4096):
+                raise ConnectionError("MQTT broker closed the connection")
+
+    def close(self):
+        try:
+            self._socket.sendall(b"\xe0\x00")  # DISCONNECT
+        finally:
+            self._socket.close()
+
+
+SINK_TYPES = {"file": FileSink, "udp": DatagramSink, "unix": DatagramSink, "mqtt": MqttSink}
+
+
+def load_sinks() -> List[Sink]:
+    configs = [ExportSinkConfig.model_validate(raw) for raw in settings.export_sinks]
+    return [SINK_TYPES[config.type](config, i) for i, config in enumerate(configs)]
+
+
+class ExportHub:
+    """Fans records out to the sinks that asked for their stream; free when none are configured."""
+
+    def __init__(self, sinks: Optional[List[Sink]] = None):
+        self.sinks = sinks or []
+        self._packet_sinks = [s for s in self.sinks if "packets" in s.config.streams]
+        self._event_sinks = [s for s in self.sinks if "events" in s.config.streams]
+        # Only the process that owns the radio exports, records are ignored until start()
+        self._running = False
+
+    @property
+    def wants_events(self) -> bool:
+        return bool(self._event_sinks)
+
+    def start(self):
+        self._running = True
+        for sink in self.sinks:
+            sink.start()
+
+    def stop(self):
+        self._running = False
+        for sink in self.sinks:
+            sink.stop()
+
+    def publish_packet(self, packet: Dict[str, Any]):
+        if self._running and self._packet_sinks:
+            line = encode_record("packets", packet)
+            for sink in self._packet_sinks:
+                sink.put("packets", line)
+
+    def publish_event(self, event: Dict[str, Any]):
+        if self._running and self._event_sinks:
+            line = encode_record("events", event)
+            for sink in self._event_sinks:
+                sink.put("events", line)
+
+    def get_stats(self) -> Dict[str, Any]:
+        return {sink.name: sink.get_stats() for sink in self.sinks}
@@ -0,0 +1,200 @@
+"""Polygon geofences with enter / exit detection on position packets.
+
+Fences are bucketed into a lat/lon grid, so a position is only tested against
+the fences whose bounding box touches its grid cell. Each node remembers which
+fences it was inside, and a new fix produces events only for the difference.
+"""
+import math
+import threading
+import time
+from typing import Any, Dict, List, Optional, Sequence, Set, Tuple
+
+# Grid cell size in degrees (~11 km of latitude)
+GRID_CELL_DEG = 0.1
+# Fences covering more cells than this skip the grid and are checked by bounding box
+MAX_INDEXED_CELLS = 4096
+
+
+def _cell(lat: float, lon: float) -> Tuple[int, int]:
+    return math.floor(lat / GRID_CELL_DEG), math.floor(lon / GRID_CELL_DEG)
+
+
+def point_in_polygon(lat: float, lon: float, polygon: Sequence[Tuple[float, float]]) -> bool:
+    """Ray casting with lon as x and lat as y (fences must not cross the antimeridian)."""
+    inside = False
+    j = len(polygon) - 1
+    for i in range(len(polygon)):
+        lat_i, lon_i = polygon[i]
+        lat_j, lon_j = polygon[j]
+        if (lat_i > lat) != (lat_j > lat):
+            if lon < (lon_j - lon_i) * (lat - lat_i) / (lat_j - lat_i) + lon_i:
+                inside = not inside
+        j = i
+    return inside
+
+
+class Fence:
+    __slots__ = ("id", "name", "polygon", "nodes", "min_lat", "max_lat", "min_lon", "max_lon", "cells")
+
+    def __init__(self, fence_id: int, name: str, polygon: List[Tuple[float, float]], nodes: List[str]):
+        self.id = fence_id
+        self.name = name
+        self.polygon = [tuple(point) for point in polygon]
+        # Empty: every node is tracked
+        self.nodes = frozenset(nodes)
+        lats = [p[0] for p in self.polygon]
+        lons = [p[1] for p in self.polygon]
+        self.min_lat, self.max_lat = min(lats), max(lats)
+        self.min_lon, self.max_lon = min(lons), max(lons)
+        (lat0, lon0), (lat1, lon1) = _cell(self.min_lat, self.min_lon), _cell(self.max_lat, self.max_lon)
+        count = (lat1 - lat0 + 1) * (lon1 - lon0 + 1)
+        self.cells = (
+            [(a, b) for a in range(lat0, lat1 + 1) for b in range(lon0, lon1 + 1)]
+            if count <= MAX_INDEXED_CELLS else None
+        )
+
+    def contains(self, node: str, lat: float, lon: float) -> bool:
+        if self.nodes and node not in self.nodes:
+            return False
+        if not (self.min_lat <= lat <= self.max_lat and self.min_lon <= lon <= self.max_lon):
+            return False
+        return point_in_polygon(lat, lon, self.polygon)
+
+    def to_dict(self) -> Dict[str, Any]:
+        return {"id": self.id, "name": self.name, "polygon": [list(p) for p in self.polygon], "nodes": sorted(self.nodes)}
+
+
+class GeofenceEngine:
+    """Thread-safe: positions come from the packet dispatcher thread, fence edits from the API.
+
+    A node's first fix only records where it is; events start with the
+    second, so a restart doesn't replay "enter" for everyone already inside.
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._fences: Dict[int, Fence] = {}
+        self._grid: Dict[Tuple[int, int], Set[int]] = {}
+        self._large: Set[int] = set()
+        # node -> (last position, fence ids it is inside)
+        self._nodes: Dict[str, Tuple[Tuple[float, float], Set[int]]] = {}
+        self.positions = 0
+        self.tests = 0
+        self.events = 0
+
+    def load(self, fences: List[Dict[str, Any]]):
+        for fence in fences:
+            self.set_fence(fence)
+
+    def set_fence(self, fence: Dict[str, Any]) -> List[Dict[str, Any]]:
+        """Add or replace a fence (id, name, polygon, nodes).
+
+        Tracked nodes are re-tested at their last position, returns the
+        enter / exit events the new shape causes.
+        """
+        new = Fence(fence["id"], fence["name"], fence["polygon"], fence.get("nodes") or [])
+        with self._lock:
+            self._unindex(new.id)
+            self._fences[new.id] = new
+            if new.cells is None:
+                self._large.add(new.id)
+            else:
+                for cell in new.cells:
+                    self._grid.setdefault(cell, set()).add(new.id)
+
+            now = time.time()
+            events = []
+            for node, ((lat, lon), inside) in self._nodes.items():
+                self.tests += 1
+                contains = new.contains(node, lat, lon)
+                if contains and new.id not in inside:
+                    inside.add(new.id)
+                    events.append(self._event("enter", new.id, node, lat, lon, now))
+                elif not contains and new.id in inside:
+                    inside.discard(new.id)
+                    events.append(self._event("exit", new.id, node, lat, lon, now))
+            self.events += len(events)
+            return events
+
+    def remove_fence(self, fence_id: int) -> bool:
+        with self._lock:
+            if fence_id not in self._fences:
+                return False
+            self._unindex(fence_id)
+            del self._fences[fence_id]
+            for _, inside in self._nodes.values():
+                inside.discard(fence_id)
+            return True
+
+    def _unindex(self, fence_id: int):
+        old = self._fences.get(fence_id)
+        if old is None:
+            return
+        self._large.discard(fence_id)
+        for cell in old.cells or ():
+            ids = self._grid.get(cell)
+            if ids is not None:
+                ids.discard(fence_id)
+                if not ids:
+                    del self._grid[cell]
+
+    def update(self, node: str, lat: float, lon: float) -> List[Dict[str, Any]]:
+        """Evaluate a new fix, returns enter / exit events."""
+        with self._lock:
+            self.positions += 1
+            previous = self._nodes.get(node)
+            if previous is not None and previous[0] == (lat, lon):
+                return []
+            # A fence the node is inside always has the node's cell indexed, so
+            # fences outside the candidate set can only be exits
+            candidates = self._grid.get(_cell(lat, lon), set()) | self._large
+            inside = set()
+            for fence_id in candidates:
+                self.tests += 1
+                if self._fences[fence_id].contains(node, lat, lon):
+                    inside.add(fence_id)
+            self._nodes[node] = ((lat, lon), inside)
+            if previous is None:
+                return []
+
+            now = time.time()
+            events = [
+                self._event("exit", fence_id, node, lat, lon, now) for fence_id in sorted(previous[1] - inside)
+            ] + [
+                self._event("enter", fence_id, node, lat, lon, now) for fence_id in sorted(inside - previous[1])
+            ]
+            self.events += len(events)
+            return events
+
+    def _event(self, kind: str, fence_id: int, node: str, lat: float, lon: float, now: float) -> Dict[str, Any]:
+        return {
+            "event": kind,
+            "fence_id": fence_id,
+            "fence": self._fences[fence_id].name,
+            "node": node,
+            "latitude": lat,
+            "longitude": lon,
+            "time": now,
+        }
+
+    def get_fences(self) -> List[Dict[str, Any]]:
+        with self._lock:
+            occupants: Dict[int, List[str]] = {}
+            for node, (_, inside) in self._nodes.items():
+                for fence_id in inside:
+                    occupants.setdefault(fence_id, []).append(node)
+            return [
+                {**fence.to_dict(), "inside": sorted(occupants.get(fence.id, []))}
+                for fence in self._fences.values()
+            ]
+
+    def get_stats(self) -> Dict[str, Any]:
+        return {
+            "fences": len(self._fences),
+            "grid_cells": len(self._grid),
+            "unindexed_fences": len(self._large),
+            "tracked_nodes": len(self._nodes),
+            "positions": self.positions,
+            "polygon_tests": self.tests,
+            "events": self.events,
+        }
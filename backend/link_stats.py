@@ -0,0 +1,146 @@
+"""Per-node link quality aggregates, updated on every received packet.
+
+Each node gets a few fixed-size arrays: EWMA mean/variance of SNR and RSSI,
+the packet rate, a hop-count histogram and a small ring of recent SNR
+samples for quantiles. An update is a handful of float operations, so it runs
+inline on the packet dispatcher thread.
+"""
+import math
+import threading
+import time
+from array import array
+from collections import OrderedDict
+from typing import Any, Dict, Optional
+
+# EWMA weight of a new sample (~ the last 1/ALPHA packets dominate)
+ALPHA = 0.1
+MAX_HOPS = 7
+SNR_RING_SIZE = 64
+# Least recently heard nodes are evicted beyond this
+MAX_NODES = 4096
+
+# Slots of NodeLinkStats.values
+SNR_MEAN, SNR_VAR, RSSI_MEAN, RSSI_VAR, INTERVAL_MEAN, LAST_RX, FIRST_RX = range(7)
+
+
+def _ewma(values: array, mean_slot: int, var_slot: int, sample: float, first: bool):
+    if first:
+        values[mean_slot] = sample
+        values[var_slot] = 0.0
+        return
+    diff = sample - values[mean_slot]
+    incr = ALPHA * diff
+    values[mean_slot] += incr
+    values[var_slot] = (1 - ALPHA) * (values[var_slot] + diff * incr)
+
+
+class NodeLinkStats:
+    __slots__ = ("values", "hops", "snr_ring", "packets", "snr_samples", "rssi_samples")
+
+    def __init__(self, now: float):
+        self.values = array("d", [0.0] * 7)
+        self.values[FIRST_RX] = now
+        self.values[LAST_RX] = now
+        self.hops = array("I", [0] * (MAX_HOPS + 2))  # last bucket: hop count unknown
+        self.snr_ring = array("f", [0.0] * SNR_RING_SIZE)
+        self.packets = 0
+        self.snr_samples = 0
+        self.rssi_samples = 0
+
+    def update(self, now: float, snr: Optional[float], rssi: Optional[float], hops: Optional[int]):
+        values = self.values
+        if self.packets:
+            interval = max(0.0, now - values[LAST_RX])
+            if self.packets == 1:
+                values[INTERVAL_MEAN] = interval
+            else:
+                values[INTERVAL_MEAN] += ALPHA * (interval - values[INTERVAL_MEAN])
+        values[LAST_RX] = now
+        self.packets += 1
+
+        if snr is not None:
+            _ewma(values, SNR_MEAN, SNR_VAR, snr, self.snr_samples == 0)
+            self.snr_ring[self.snr_samples % SNR_RING_SIZE] = snr
+            self.snr_samples += 1
+        if rssi is not None:
+            _ewma(values, RSSI_MEAN, RSSI_VAR, rssi, self.rssi_samples == 0)
+            self.rssi_samples += 1
+        if hops is not None and 0 <= hops <= MAX_HOPS:
+            self.hops[hops] += 1
+        else:
+            self.hops[MAX_HOPS + 1] += 1
+
+    def to_dict(self) -> Dict[str, Any]:
+        values = self.values
+        result: Dict[str, Any] = {
+            "packets": self.packets,
+            "first_rx": values[FIRST_RX],
+            "last_rx": values[LAST_RX],
+            "packets_per_minute": (
+                round(60 / values[INTERVAL_MEAN], 3) if self.packets > 1 and values[INTERVAL_MEAN] > 0 else None
+            ),
+            "snr": None,
+            "rssi": None,
+            "hops": {str(h): n for h, n in enumerate(self.hops[: MAX_HOPS + 1]) if n},
+            "hops_unknown": self.hops[MAX_HOPS + 1],
+        }
+        if self.snr_samples:
+            recent = sorted(self.snr_ring[: min(self.snr_samples, SNR_RING_SIZE)])
+            result["snr"] = {
+                "mean": round(values[SNR_MEAN], 2),
+                "stddev": round(math.sqrt(values[SNR_VAR]), 2),
+                "p10": round(recent[int(0.1 * (len(recent) - 1))], 2),
+                "p50": round(recent[int(0.5 * (len(recent) - 1))], 2),
+                "p90": round(recent[int(0.9 * (len(recent) - 1))], 2),
+                "samples": self.snr_samples,
+            }
+        if self.rssi_samples:
+            result["rssi"] = {
+                "mean": round(values[RSSI_MEAN], 1),
+                "stddev": round(math.sqrt(values[RSSI_VAR]), 1),
+                "samples": self.rssi_samples,
+            }
+        return result
+
+
+class LinkStats:
+    """Thread-safe: fed on the packet dispatcher thread, read from the API."""
+
+    def __init__(self, max_nodes: int = MAX_NODES):
+        self.max_nodes = max_nodes
+        self._nodes: "OrderedDict[str, NodeLinkStats]" = OrderedDict()
+        self._lock = threading.Lock()
+        self.packets = 0
+        self.evicted = 0
+
+    def observe(self, packet: Dict[str, Any]):
+        node = packet.get("fromId")
+        if not node:
+            return
+        hop_start = packet.get("hopStart")
+        hop_limit = packet.get("hopLimit")
+        hops = hop_start - hop_limit if hop_start is not None and hop_limit is not None else None
+        snr = packet.get("rxSnr")
+        rssi = packet.get("rxRssi")
+        now = time.time()
+
+        with self._lock:
+            stats = self._nodes.get(node)
+            if stats is None:
+                stats = self._nodes[node] = NodeLinkStats(now)
+                if len(self._nodes) > self.max_nodes:
+                    self._nodes.popitem(last=False)
+                    self.evicted += 1
+            else:
+                self._nodes.move_to_end(node)
+            # RSSI 0 means "not measured" (e.g. packets relayed over MQTT)
+            stats.update(now, snr, rssi if rssi else None, hops)
+            self.packets += 1
+
+    def get(self, node: str) -> Optional[Dict[str, Any]]:
+        with self._lock:
+            stats = self._nodes.get(node)
+            return {"node": node, **stats.to_dict()} if stats else None
+
+    def get_stats(self) -> Dict[str, Any]:
+        return {"nodes": len(self._nodes), "packets": self.packets, "evicted": self.evicted}
@@ -0,0 +1,93 @@
+import asyncio
+import gzip
+import logging
+import time
+from datetime import datetime, timezone
+from pathlib import Path
+from typing import Any, Dict, List, Optional
+
+import database as db
+from message_io import encode_ndjson
+from settings import settings, get_archive_dir
+
+logger = logging.getLogger(__name__)
+
+CHUNK_SIZE = 1000
+VACUUM_PAGES_PER_STEP = 256
+
+stats: Dict[str, Any] = {
+    "runs": 0,
+    "last_run": None,
+    "last_duration": None,
+    "deleted": 0,
+    "last_archive": None,
+    "errors": 0,
+}
+
+
+def retention_enabled() -> bool:
+    return settings.retention_days is not None or settings.retention_max_rows is not None
+
+
+def _append_archive(path: Path, rows: List[dict]):
+    path.parent.mkdir(parents=True, exist_ok=True)
+    # Each call appends a new gzip member, readers see one continuous stream
+    with gzip.open(path, "at", encoding="utf-8") as f:
+        f.write(encode_ndjson(rows))
+
+
+async def run_retention() -> Dict[str, Any]:
+    """Archive and delete expired messages, then reclaim the freed pages."""
+    started = time.monotonic()
+    archive_path: Optional[Path] = None
+    deleted = 0
+
+    await db.prepare_retention(settings.retention_max_rows)
+    after_id = 0
+    while True:
+        rows = await db.get_expired_messages(
+            max_age_days=settings.retention_days,
+            max_rows=settings.retention_max_rows,
+            after_id=after_id,
+            limit=CHUNK_SIZE,
+        )
+        if not rows:
+            break
+        after_id = rows[-1]["id"]
+        if archive_path is None:
+            stamp = datetime.now(timezone.utc).strftime("%Y%m%d-%H%M%S")
+            archive_path = get_archive_dir() / f"messages-{stamp}.ndjson.gz"
+        # Rows are deleted only after they hit the archive file
+        await asyncio.to_thread(_append_archive, archive_path, rows)
+        await db.delete_messages([row["id"] for row in rows])
+        deleted += len(rows)
+
+    # Small vacuum steps keep each write lock short
+    while await db.incremental_vacuum(VACUUM_PAGES_PER_STEP) > 0:
+        await asyncio.sleep(0)
+
+    stats["runs"] += 1
+    stats["last_run"] = datetime.now(timezone.utc).isoformat()
+    stats["last_duration"] = round(time.monotonic() - started, 3)
+    stats["deleted"] += deleted
+    if archive_path is not None:
+        stats["last_archive"] = str(archive_path)
+        logger.info(f"Retention archived {deleted} message(s) to {archive_path}")
+    return {"deleted": deleted, "archive": str(archive_path) if archive_path else None}
+
+
+async def maintenance_loop():
+    if await db.auto_vacuum_mode() != 2:
+        logger.warning(
+            "Database is not in incremental auto-vacuum mode: deleted messages free pages for reuse "
+            "but the file won't shrink. Stop MeshRadar and run `python main.py vacuum` once to convert it."
+        )
+    while True:
+        try:
+            await run_retention()
+        except asyncio.CancelledError:
+            raise
+        except Exception as e:
+            stats["errors"] += 1
+            logger.error(f"Retention run failed: {e}")
+        await asyncio.sleep(settings.retention_interval)
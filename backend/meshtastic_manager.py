@@ -1,31 +1,102 @@
 import asyncio
+import base64
 import logging
-from typing import Optional, Dict, Any, Set, List
+import time
+from typing import Optional, Dict, Any, Set, List, TYPE_CHECKING
 from concurrent.futures import Future
 from pubsub import pub
-import meshtastic
-import meshtastic.serial_interface
-import meshtastic.tcp_interface
-import meshtastic.ble_interface
 from google.protobuf.json_format import MessageToDict
 
 from websocket_manager import ws_manager
+from packet_dispatcher import PacketDispatcher
+from topology import TopologyGraph, PathMode
+from link_stats import LinkStats
+from packet_filters import PacketFilter, load_rules
+from packet_handlers import HandlerRegistry
+from alerts import AlertEngine
+from geofences import GeofenceEngine
+from presence import PresenceIndex, SWEEP_INTERVAL
+from node_store import NodeStore
+from export_sinks import ExportHub, load_sinks
+from packet_filters import packet_position
+from settings import settings
 import database as db
+import maintenance
+
+if TYPE_CHECKING:
+    from meshtastic.mesh_interface import MeshInterface
 
 logger = logging.getLogger(__name__)
 
 
 class MeshtasticManager:
     def __init__(self):
-        self.interface: Optional[meshtastic.mesh_interface.MeshInterface] = None
+        self.interface: Optional["MeshInterface"] = None
         self.connection_type: Optional[str] = None
         self.address: Optional[str] = None
         self._loop: Optional[asyncio.AbstractEventLoop] = None
         self._pending_tasks: Set[Future] = set()
+        self._dispatcher = PacketDispatcher(self._dispatch, maxlen=settings.dispatch_queue_size)
+        self.topology = TopologyGraph()
+        self.link_stats = LinkStats()
+        # Rules and export sinks are loaded by load_state, only in the process that owns the radio
+        self.packet_filter = PacketFilter()
+        self.alerts = AlertEngine()
+        self.geofences = GeofenceEngine()
+        self.presence = PresenceIndex(settings.presence_timeout)
+        self.node_store = NodeStore()
+        self.exports = ExportHub()
+        self.handlers = HandlerRegistry()
+        self.handlers.register("ROUTING_APP", self._handle_routing, persist=True)
+        self.handlers.register("TRACEROUTE_APP", self._handle_traceroute_response, persist=True)
+        self.handlers.register("TEXT_MESSAGE_APP", self._handle_text_message, persist=True)
+        # Persist: positions also drive geofence state, which headless ingest keeps too
+        self.handlers.register("POSITION_APP", self._handle_position, persist=True)
+        self.handlers.register("TELEMETRY_APP", self._handle_telemetry)
+        self.handlers.register("NEIGHBORINFO_APP", self._handle_neighbor_info, persist=True)
+        self.handlers.register("NODEINFO_APP", self._handle_node_info)
+        self.handlers.register("WAYPOINT_APP", self._handle_waypoint, persist=True)
+        self.handlers.register("RANGE_TEST_APP", self._handle_range_test)
+        self.handlers.register("STORE_FORWARD_APP", self._handle_store_forward)
 
     def set_loop(self, loop: asyncio.AbstractEventLoop):
         self._loop = loop
 
+    async def load_state(self):
+        """Restore state persisted by earlier runs. Called once the database is ready."""
+        try:
+            self.packet_filter = PacketFilter(load_rules())
+        except Exception as e:
+            logger.error(f"Packet filter rules not loaded, running without filters: {e}")
+        try:
+            self.alerts.reload()
+        except Exception as e:
+            # As on hot reload: the file is looked at again once it changes
+            logger.error(f"Alert rules not loaded, running without alerts: {e}")
+        try:
+            self.exports = ExportHub(load_sinks())
+        except Exception as e:
+            logger.error(f"Export sinks not loaded, running without exports: {e}")
+        if self.exports.wants_events:
+            ws_manager.add_listener(self.exports.publish_event)
+        self.topology.load(await db.get_topology_edges())
+        self.topology.prune()
+        self.geofences.load(await db.get_geofences())
+
+    async def presence_loop(self):
+        """Push offline transitions for nodes that went quiet."""
+        while True:
+            await asyncio.sleep(SWEEP_INTERVAL)
+            for event in self.presence.sweep():
+                await ws_manager.broadcast({"type": "presence", "data": event})
+
+    def _mark_heard(self, node_id: Optional[str], when: Optional[float] = None, announce: bool = True):
+        if not node_id:
+            return
+        event = self.presence.heard(node_id, when, announce)
+        if event:
+            ws_manager.broadcast_sync({"type": "presence", "data": event})
+
     def _run_async(self, coro):
         """Safely schedule coroutine from sync callback"""
         if self._loop and self._loop.is_running():
@@ -54,7 +125,10 @@ class MeshtasticManager:
         # Subscribe before opening interface to catch queued messages delivered immediately on connect
         self._setup_callbacks()
         try:
-            self.interface = meshtastic.serial_interface.SerialInterface(devPath=dev_path)
+            # Transports are imported on first use, BLE pulls in the whole bleak stack
+            from meshtastic.serial_interface import SerialInterface
+
+            self.interface = SerialInterface(devPath=dev_path)
             self.connection_type = "serial"
             self.address = dev_path
             return True
@@ -69,7 +143,9 @@ class MeshtasticManager:
         # Subscribe before opening interface to catch queued messages delivered immediately on connect
         self._setup_callbacks()
         try:
-            self.interface = meshtastic.tcp_interface.TCPInterface(hostname=hostname, portNumber=port)
+            from meshtastic.tcp_interface import TCPInterface
+
+            self.interface = TCPInterface(hostname=hostname, portNumber=port)
             self.connection_type = "tcp"
             self.address = f"{hostname}:{port}"
             return True
@@ -86,8 +162,10 @@ class MeshtasticManager:
             List of dicts with 'name' and 'address' keys
         """
         try:
+            from meshtastic.ble_interface import BLEInterface
+
             logger.info("Scanning for BLE devices (takes 10 seconds)...")
-            devices = meshtastic.ble_interface.BLEInterface.scan()
+            devices = BLEInterface.scan()
 
             results = []
             for device in devices:
@@ -115,7 +193,9 @@ class MeshtasticManager:
         # Subscribe before opening interface to catch queued messages delivered immediately on connect
         self._setup_callbacks()
         try:
-            self.interface = meshtastic.ble_interface.BLEInterface(address=address)
+            from meshtastic.ble_interface import BLEInterface
+
+            self.interface = BLEInterface(address=address)
             self.connection_type = "ble"
             self.address = address
             logger.info(f"Connected via BLE: {address}")
@@ -137,8 +217,19 @@ class MeshtasticManager:
             self.interface = None
             self.connection_type = None
             self.address = None
+            self.node_store.clear()
+
+    def shutdown(self):
+        self.disconnect()
+        self._dispatcher.stop()
+        self.exports.stop()
+
+    def get_dispatch_stats(self) -> dict:
+        return self._dispatcher.get_stats()
 
     def _setup_callbacks(self):
+        self._dispatcher.start()
+        self.exports.start()
         pub.subscribe(self._on_receive, "meshtastic.receive")
         pub.subscribe(self._on_connection, "meshtastic.connection.established")
         pub.subscribe(self._on_connection_lost, "meshtastic.connection.lost")
@@ -157,20 +248,39 @@ class MeshtasticManager:
             except Exception as e:
                 logger.debug(f"Unsubscribe {topic}: {e}")
 
+    # Pubsub callbacks run on meshtastic's reader thread: they only enqueue,
+    # the actual work happens in _dispatch on the dispatcher thread.
     def _on_receive(self, packet, interface):
-        decoded = packet.get("decoded", {})
-        portnum = decoded.get("portnum")
-
-        if portnum == "ROUTING_APP":
-            self._handle_routing(packet)
-        elif portnum == "TRACEROUTE_APP":
-            self._handle_traceroute_response(packet)
-        elif portnum == "TEXT_MESSAGE_APP":
-            self._handle_text_message(packet)
-        elif portnum == "POSITION_APP":
-            self._handle_position(packet)
-        elif portnum == "TELEMETRY_APP":
-            self._handle_telemetry(packet)
+        self._dispatcher.submit("receive", packet)
+
+    def _on_connection(self, interface, topic=pub.AUTO_TOPIC):
+        self._dispatcher.submit("connection", interface)
+
+    def _on_connection_lost(self, interface, topic=pub.AUTO_TOPIC):
+        self._dispatcher.submit("connection_lost", interface)
+
+    def _on_node_updated(self, node, interface):
+        self._dispatcher.submit("node_updated", node)
+
+    def _dispatch(self, kind: str, payload):
+        if kind == "receive":
+            self._handle_packet(payload)
+        elif kind == "node_updated":
+            self._handle_node_updated(payload)
+        elif kind == "connection":
+            self._handle_connection(payload)
+        elif kind == "connection_lost":
+            self._handle_connection_lost(payload)
+
+    def _handle_packet(self, packet):
+        # Link quality and presence count every packet heard, filters only gate storage and fan-out
+        self.link_stats.observe(packet)
+        self.node_store.observe(packet)
+        self._mark_heard(packet.get("fromId"))
+        if not self.packet_filter.accept(packet):
+            return
+        self.exports.publish_packet(packet)
+        self.handlers.dispatch(packet.get("decoded", {}).get("portnum"), packet)
 
     def _handle_routing(self, packet):
         request_id = packet.get("decoded", {}).get("requestId")
@@ -209,6 +319,13 @@ class MeshtasticManager:
         snr_towards = traceroute_data.get("snrTowards", [])
         snr_back = traceroute_data.get("snrBack", [])
 
+        # The graph needs the unfiltered legs to keep hops and SNR values aligned
+        if packet.get("from") is not None and self.my_node_num is not None:
+            self.topology.add_traceroute(
+                self.my_node_num, packet["from"], route, snr_towards, route_back, snr_back
+            )
+            self._save_topology()
+
         # Filter out invalid node IDs (0xFFFFFFFF = 4294967295 = unknown/encrypted nodes)
         if isinstance(route, list):
             route = [node for node in route if node != 4294967295 and node != 0]
@@ -252,7 +369,8 @@ class MeshtasticManager:
             text=text,
             is_outgoing=False,
             ack_status="received",
-            reply_id=reply_id
+            reply_id=reply_id,
+            rx_time=packet.get("rxTime")
         ))
 
         ws_manager.broadcast_sync({
@@ -270,6 +388,19 @@ class MeshtasticManager:
             }
         })
 
+        for alert in self.alerts.match(text, channel, sender):
+            alert.update({
+                "packet_id": packet_id,
+                "sender": sender,
+                "receiver": receiver if receiver != "^all" else None,
+                "channel": channel,
+                "text": text,
+                "rx_time_ms": int(packet["rxTime"] * 1000) if packet.get("rxTime") else db.now_ms(),
+            })
+            logger.info(f"Alert {alert['rule']}: {alert['matches']} from {sender}")
+            self._run_async(db.save_alert(alert))
+            ws_manager.broadcast_sync({"type": "alert", "data": alert})
+
     def _handle_position(self, packet):
         decoded = packet.get("decoded", {})
         position = decoded.get("position", {})
@@ -285,6 +416,15 @@ class MeshtasticManager:
             }
         })
 
+        point = packet_position(packet)
+        if point and packet.get("fromId"):
+            self._emit_geofence_events(self.geofences.update(packet["fromId"], *point))
+
+    def _emit_geofence_events(self, events: List[dict]):
+        for event in events:
+            logger.info(f"Geofence {event['event']}: {event['node']} {event['fence']}")
+            ws_manager.broadcast_sync({"type": "geofence", "data": event})
+
     def _handle_telemetry(self, packet):
         decoded = packet.get("decoded", {})
         telemetry = decoded.get("telemetry", {})
@@ -298,13 +438,111 @@ class MeshtasticManager:
             }
         })
 
-    def _on_connection(self, interface, topic=pub.AUTO_TOPIC):
+    def _handle_neighbor_info(self, packet):
+        neighbor_info = packet.get("decoded", {}).get("neighborinfo", {})
+        node = neighbor_info.get("nodeId") or packet.get("from")
+        neighbors = neighbor_info.get("neighbors", [])
+        if not node or not neighbors:
+            return
+        self.topology.add_neighbors(node, neighbors)
+        self._save_topology()
+
+        ws_manager.broadcast_sync({
+            "type": "neighbor_info",
+            "data": {
+                "from": packet.get("fromId"),
+                "neighbors": [
+                    {"id": f"!{n['nodeId']:08x}", "snr": n.get("snr")}
+                    for n in neighbors if n.get("nodeId")
+                ]
+            }
+        })
+
+    def _handle_node_info(self, packet):
+        user = packet.get("decoded", {}).get("user", {})
+
+        ws_manager.broadcast_sync({
+            "type": "node_info",
+            "data": {
+                "from": packet.get("fromId"),
+                "user": user
+            }
+        })
+
+    def _handle_waypoint(self, packet):
+        waypoint = packet.get("decoded", {}).get("waypoint", {})
+        if not waypoint.get("id"):
+            return
+
+        data = {
+            "id": waypoint["id"],
+            "from": packet.get("fromId"),
+            "name": waypoint.get("name"),
+            "description": waypoint.get("description"),
+            "icon": waypoint.get("icon"),
+            "latitude": waypoint.get("latitudeI", 0) * 1e-7,
+            "longitude": waypoint.get("longitudeI", 0) * 1e-7,
+            "expire": waypoint.get("expire", 0),
+            "locked_to": waypoint.get("lockedTo"),
+        }
+        self._run_async(db.save_waypoint(data))
+        ws_manager.broadcast_sync({"type": "waypoint", "data": data})
+
+    def _handle_range_test(self, packet):
+        ws_manager.broadcast_sync({
+            "type": "range_test",
+            "data": {
+                "from": packet.get("fromId"),
+                "text": packet.get("decoded", {}).get("text"),
+                "snr": packet.get("rxSnr"),
+                "rssi": packet.get("rxRssi"),
+                "hop_limit": packet.get("hopLimit"),
+                "timestamp": packet.get("rxTime")
+            }
+        })
+
+    def _handle_store_forward(self, packet):
+        store_forward = dict(packet.get("decoded", {}).get("storeforward", {}))
+        # Replayed text arrives as base64 bytes
+        if store_forward.get("text"):
+            try:
+                store_forward["text"] = base64.b64decode(store_forward["text"]).decode("utf-8")
+            except (ValueError, UnicodeDecodeError):
+                pass
+
+        ws_manager.broadcast_sync({
+            "type": "store_forward",
+            "data": {
+                "from": packet.get("fromId"),
+                "to": packet.get("toId"),
+                **store_forward
+            }
+        })
+
+    def _save_topology(self):
+        self.topology.prune()
+        self._run_async(db.save_topology_edges(self.topology.take_dirty(), settings.topology_edge_ttl))
+
+    def _handle_connection(self, interface):
+        # Rebuilt on every connect, the device may have a different node DB than the last one.
+        # Read from the event's interface: self.interface is only assigned once the
+        # constructor returns, after this event was queued during waitForConfig
+        nodes = list((getattr(interface, "nodes", None) or {}).values())
+        self.node_store.load(nodes)
+        # Seed presence from the device's node database without announcing everyone
+        for node in nodes:
+            if node.get("lastHeard"):
+                self._mark_heard(node.get("user", {}).get("id"), node["lastHeard"], announce=False)
         ws_manager.broadcast_sync({
             "type": "connection_status",
             "data": {"connected": True, "type": self.connection_type, "address": self.address}
         })
 
-    def _on_connection_lost(self, interface, topic=pub.AUTO_TOPIC):
+    def _handle_connection_lost(self, interface):
+        if interface is not self.interface:
+            # Stale event from an interface that was already replaced or closed
+            return
+
         logger.warning(f"Connection lost to {self.address}")
         ws_manager.broadcast_sync({
             "type": "connection_status",
@@ -322,6 +560,7 @@ class MeshtasticManager:
             except Exception:
                 pass
         self.interface = None
+        self.node_store.clear()
 
         # Attempt reconnection if it was TCP connection
         if saved_type == "tcp" and saved_address:
@@ -339,68 +578,36 @@ class MeshtasticManager:
                 self.connection_type = None
                 self.address = None
 
-    def _on_node_updated(self, node, interface):
+    def _handle_node_updated(self, node):
+        # Node DB updates also arrive for every node during the config download,
+        # only received packets announce a node coming online
+        if node.get("lastHeard"):
+            self._mark_heard(node.get("user", {}).get("id"), node["lastHeard"], announce=False)
+        record = self.node_store.update_node(node)
+        if record is None:
+            return
         ws_manager.broadcast_sync({
             "type": "node_update",
-            "data": self._format_node(node)
+            "data": record.to_dict()
         })
 
-    def _format_node(self, node: dict) -> dict:
-        # Convert protobuf objects to dicts for JSON serialization
-        user = node.get("user")
-        position = node.get("position")
-        device_metrics = node.get("deviceMetrics")
-
-        # Deep convert: check if converted dicts still have protobuf objects inside
-        def deep_convert(obj):
-            if obj is None:
-                return None
-            if hasattr(obj, 'DESCRIPTOR'):
-                obj = MessageToDict(obj)
-            if isinstance(obj, dict):
-                return {k: deep_convert(v) for k, v in obj.items()}
-            if isinstance(obj, list):
-                return [deep_convert(item) for item in obj]
-            return obj
-
-        # Check if node is favorite - can be stored in different ways depending on meshtastic version
-        is_favorite = False
-
-        # Debug: log available keys
-        node_id = node.get("user", {}).get("id") if user else None
-        logger.debug(f"Node {node_id} keys: {list(node.keys())}")
-
-        if "isFavorite" in node:
-            is_favorite = node.get("isFavorite", False)
-        # Also check for is_favorite (snake_case variant)
-        elif "is_favorite" in node:
-            is_favorite = node.get("is_favorite", False)
-
-        logger.debug(f"Node {node_id} isFavorite: {is_favorite}")
-
-        return {
-            "id": node.get("user", {}).get("id") if user else None,
-            "num": node.get("num"),
-            "user": deep_convert(user),
-            "position": deep_convert(position),
-            "snr": node.get("snr"),
-            "lastHeard": node.get("lastHeard"),
-            "deviceMetrics": deep_convert(device_metrics),
-            "isFavorite": is_favorite
-        }
-
     def get_nodes(self) -> list:
         if not self.interface or not self.interface.nodes:
             return []
-        return [self._format_node(n) for n in self.interface.nodes.values()]
+        return self.node_store.to_list()
+
+    def get_active_nodes(self, window: float) -> list:
+        """Nodes heard within `window` seconds, most recent first."""
+        active = []
+        for node_id, last_heard in self.presence.active(window):
+            node = self.node_store.get(node_id) or {"id": node_id}
+            active.append({**node, "lastHeard": int(last_heard)})
+        return active
 
     def get_node(self, node_id: str) -> Optional[dict]:
         if not self.interface or not self.interface.nodes:
             return None
-        for node in self.interface.nodes.values():
-            if node.get("user", {}).get("id") == node_id or str(node.get("num")) == node_id:
-                return self._format_node(node)
-        return None
+        return self.node_store.get(node_id)
 
     def get_channels(self) -> list:
         if not self.interface or not self.interface.localNode:
@@ -528,6 +735,7 @@ class MeshtasticManager:
                             node_data["isFavorite"] = is_favorite
                         logger.debug(f"Updated local cache for node {node_id}: isFavorite={is_favorite}")
                         break
+            self.node_store.set_favorite(node_hex, is_favorite)
 
             logger.info(f"Set favorite={is_favorite} for node {node_id}")
             return True
@@ -535,6 +743,51 @@ class MeshtasticManager:
             logger.error(f"Error setting favorite: {e}")
             return False
 
+    def get_topology(self) -> dict:
+        self.topology.prune()
+        return self.topology.snapshot()
+
+    def find_path(self, source: str, target: str, mode: PathMode = "shortest") -> dict:
+        return {"source": source, "target": target, "mode": mode, **self.topology.find_path(source, target, mode)}
+
+    def get_link_stats(self, node_id: str) -> Optional[dict]:
+        return self.link_stats.get(node_id)
+
+    def get_geofences(self) -> List[dict]:
+        return self.geofences.get_fences()
+
+    def set_geofence(self, fence: dict):
+        self._emit_geofence_events(self.geofences.set_fence(fence))
+
+    def remove_geofence(self, fence_id: int) -> bool:
+        return self.geofences.remove_fence(fence_id)
+
+    def get_alert_rules(self) -> List[dict]:
+        return self.alerts.get_rules()
+
+    def reload_alert_rules(self) -> dict:
+        try:
+            return {"success": True, "rules": self.alerts.reload()}
+        except Exception as e:
+            logger.error(f"Alert rules reload failed: {e}")
+            return {"success": False, "error": str(e)}
+
+    def get_engine_stats(self) -> dict:
+        return {
+            "topology": self.topology.get_stats(),
+            "link_stats": self.link_stats.get_stats(),
+            "filters": self.packet_filter.get_stats(),
+            "handlers": self.handlers.get_stats(),
+            "alerts": self.alerts.get_stats(),
+            "geofences": self.geofences.get_stats(),
+            "presence": self.presence.get_stats(),
+            "nodes": self.node_store.get_stats(),
+            "exports": self.exports.get_stats(),
+        }
+
+    def get_maintenance_stats(self) -> dict:
+        return maintenance.stats
+
     def get_status(self) -> dict:
         status = {
             "connected": self.connected,
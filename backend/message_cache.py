@@ -0,0 +1,134 @@
+"""LRU cache of the latest message page per conversation, in front of database.get_messages.
+
+Pages are kept current instead of being evicted on writes: saved messages are
+inserted in place and ack changes are applied to the cached rows. Lives on
+the event loop like the shared database connection, so it needs no lock.
+"""
+import bisect
+from collections import OrderedDict
+from typing import Any, Callable, Dict, List, Optional, Tuple
+
+# (channel, dm_partner, my_node_id) as passed to database.get_messages
+PageKey = Tuple[Optional[int], Optional[str], Optional[str]]
+
+# Rough per-row footprint of a message dict besides its strings
+ROW_OVERHEAD = 800
+
+
+def row_size(row: Dict[str, Any]) -> int:
+    return ROW_OVERHEAD + sum(len(v) for v in row.values() if isinstance(v, str))
+
+
+def _order(row: Dict[str, Any]) -> Tuple[int, int]:
+    return row["rx_time_ms"] or 0, row["id"]
+
+
+class CachedPage:
+    __slots__ = ("rows", "limit", "complete", "size")
+
+    def __init__(self, rows: List[Dict[str, Any]], limit: int):
+        self.rows = rows
+        self.limit = limit
+        # Fewer rows than requested: the page holds the whole conversation
+        self.complete = len(rows) < limit
+        self.size = sum(row_size(row) for row in rows)
+
+
+class MessagePageCache:
+    def __init__(self, max_bytes: int, matches: Callable[[PageKey, Dict[str, Any]], bool]):
+        self.max_bytes = max_bytes
+        self._matches = matches
+        self._pages: "OrderedDict[PageKey, CachedPage]" = OrderedDict()
+        self.size = 0
+        # Bumped on every write, a page read before a write is not stored
+        self.version = 0
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self.inserts = 0
+        self.ack_updates = 0
+
+    @property
+    def enabled(self) -> bool:
+        return self.max_bytes > 0
+
+    def get(self, key: PageKey, limit: int) -> Optional[List[Dict[str, Any]]]:
+        page = self._pages.get(key)
+        if page is None or (limit > page.limit and not page.complete):
+            self.misses += 1
+            return None
+        self._pages.move_to_end(key)
+        self.hits += 1
+        return page.rows[max(0, len(page.rows) - limit):]
+
+    def put(self, key: PageKey, limit: int, rows: List[Dict[str, Any]], version: int):
+        """Store a page read from the database while the cache was at `version`."""
+        if not self.enabled or version != self.version:
+            return
+        page = CachedPage(list(rows), limit)
+        if page.size > self.max_bytes:
+            return
+        old = self._pages.pop(key, None)
+        if old is not None:
+            self.size -= old.size
+        self._pages[key] = page
+        self.size += page.size
+        while self.size > self.max_bytes:
+            _, evicted = self._pages.popitem(last=False)
+            self.size -= evicted.size
+            self.evictions += 1
+
+    def begin_write(self):
+        """A row is about to be written: pages read from now on may already hold it."""
+        self.version += 1
+
+    def insert(self, message: Dict[str, Any]):
+        """A new row was saved: slot it into every cached page it belongs to."""
+        self.version += 1
+        order = _order(message)
+        for key, page in self._pages.items():
+            if not self._matches(key, message):
+                continue
+            rows = page.rows
+            index = bisect.bisect_right([_order(row) for row in rows], order)
+            if index == 0 and not page.complete and rows:
+                continue  # older than the cached page
+            if index and rows[index - 1]["id"] == message["id"]:
+                continue  # page was read after the INSERT and already has it
+            rows.insert(index, message)
+            page.size += row_size(message)
+            self.size += row_size(message)
+            if len(rows) > page.limit:
+                dropped = rows.pop(0)
+                page.size -= row_size(dropped)
+                self.size -= row_size(dropped)
+                page.complete = False
+            self.inserts += 1
+
+    def update_ack(self, packet_id: int, ack_status: str):
+        self.version += 1
+        for page in self._pages.values():
+            for row in page.rows:
+                if row["packet_id"] == packet_id:
+                    row["ack_status"] = ack_status
+                    self.ack_updates += 1
+
+    def clear(self):
+        self.version += 1
+        self._pages.clear()
+        self.size = 0
+
+    def get_stats(self) -> Dict[str, Any]:
+        lookups = self.hits + self.misses
+        return {
+            "enabled": self.enabled,
+            "pages": len(self._pages),
+            "bytes": self.size,
+            "max_bytes": self.max_bytes,
+            "hits": self.hits,
+            "misses": self.misses,
+            "hit_rate": round(self.hits / lookups, 4) if lookups else None,
+            "evictions": self.evictions,
+            "inserts": self.inserts,
+            "ack_updates": self.ack_updates,
+        }
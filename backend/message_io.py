@@ -0,0 +1,100 @@
+import csv
+import gzip
+import io
+import json
+import re
+import zlib
+from typing import AsyncIterator, BinaryIO, Iterable, Iterator, List, Literal, Sequence
+from urllib.parse import quote
+
+ExportFormat = Literal["ndjson", "csv"]
+
+MEDIA_TYPES = {
+    "ndjson": "application/x-ndjson",
+    "csv": "text/csv",
+}
+
+
+def content_disposition(filename: str) -> str:
+    """Attachment header with an ASCII-safe filename and the exact one as RFC 5987 filename*."""
+    fallback = re.sub(r"[^A-Za-z0-9._-]", "_", filename)
+    return f"attachment; filename=\"{fallback}\"; filename*=UTF-8''{quote(filename, safe='')}"
+
+
+def encode_ndjson(rows: Iterable[dict]) -> str:
+    return "".join(
+        json.dumps(row, default=str, ensure_ascii=False) + "\n" for row in rows
+    )
+
+
+def encode_csv(rows: List[dict], header: bool) -> str:
+    buffer = io.StringIO()
+    writer = csv.DictWriter(buffer, fieldnames=list(rows[0].keys()))
+    if header:
+        writer.writeheader()
+    writer.writerows(rows)
+    return buffer.getvalue()
+
+
+async def stream_export(
+    chunks: AsyncIterator[List[dict]],
+    fmt: ExportFormat = "ndjson",
+    compress: bool = False,
+) -> AsyncIterator[bytes]:
+    """Encode row chunks one at a time, optionally as a single gzip stream.
+
+    Only the current chunk is ever held in memory, whatever the export size.
+    """
+    compressor = zlib.compressobj(6, zlib.DEFLATED, 31) if compress else None
+    first = True
+    async for rows in chunks:
+        if fmt == "csv":
+            text = encode_csv(rows, header=first)
+        else:
+            text = encode_ndjson(rows)
+        first = False
+
+        data = text.encode("utf-8")
+        if compressor:
+            data = compressor.compress(data)
+        if data:
+            yield data
+
+    if compressor:
+        yield compressor.flush()
+
+
+def open_import_stream(fileobj: BinaryIO) -> io.TextIOWrapper:
+    """Wrap a seekable binary file, transparently decompressing gzip input."""
+    magic = fileobj.read(2)
+    fileobj.seek(0)
+    if magic == b"\x1f\x8b":
+        fileobj = gzip.GzipFile(fileobj=fileobj)
+    return io.TextIOWrapper(fileobj, encoding="utf-8")
+
+
+def iter_ndjson_batches(
+    stream: Iterable[str],
+    columns: Sequence[str],
+    batch_size: int = 50000,
+) -> Iterator[List[tuple]]:
+    """Parse NDJSON export lines into row tuples ordered like `columns`.
+
+    Blank lines and records without a sender or text are skipped.
+    """
+    batch: List[tuple] = []
+    for line in stream:
+        line = line.strip()
+        if not line:
+            continue
+        record = json.loads(line)
+        if not isinstance(record, dict):
+            raise ValueError(f"expected a JSON object per line, got {type(record).__name__}")
+        if not record.get("sender") or record.get("text") is None:
+            continue
+        batch.append(tuple(record.get(column) for column in columns))
+        if len(batch) >= batch_size:
+            yield batch
+            batch = []
+    if batch:
+        yield batch
@@ -0,0 +1,210 @@
+"""Compact per-node records behind the node API.
+
+meshtastic keeps every node as a nested dict in interface.nodes, and the API
+used to deep-copy that dict on each request. A NodeRecord holds only the
+fields the API exposes: strings are interned (hardware models and roles
+repeat across thousands of nodes) and the numeric fields share one float
+array, with NaN for "unknown". Records serialize straight to the API shape.
+"""
+import math
+import sys
+import threading
+import time
+from array import array
+from typing import Any, Dict, Iterable, List, Optional
+
+from google.protobuf.json_format import MessageToDict
+
+# Slots of NodeRecord.values
+(
+    LATITUDE, LONGITUDE, ALTITUDE, POSITION_TIME, SNR, LAST_HEARD,
+    BATTERY_LEVEL, VOLTAGE, CHANNEL_UTILIZATION, AIR_UTIL_TX, UPTIME_SECONDS,
+) = range(11)
+NAN = float("nan")
+_EMPTY = array("d", [NAN] * 11)
+
+# Source key -> slot for the nested dicts meshtastic hands us
+POSITION_FIELDS = {"latitude": LATITUDE, "longitude": LONGITUDE, "altitude": ALTITUDE, "time": POSITION_TIME}
+METRIC_FIELDS = {
+    "batteryLevel": BATTERY_LEVEL,
+    "voltage": VOLTAGE,
+    "channelUtilization": CHANNEL_UTILIZATION,
+    "airUtilTx": AIR_UTIL_TX,
+    "uptimeSeconds": UPTIME_SECONDS,
+}
+# Integral fields are reported as ints, like meshtastic does
+INT_SLOTS = frozenset({ALTITUDE, POSITION_TIME, LAST_HEARD, BATTERY_LEVEL, UPTIME_SECONDS})
+
+
+def _intern(value: Any) -> Optional[str]:
+    return sys.intern(value) if isinstance(value, str) else None
+
+
+def _as_dict(obj: Any) -> Optional[dict]:
+    if obj is None:
+        return None
+    if hasattr(obj, "DESCRIPTOR"):
+        return MessageToDict(obj)
+    return obj if isinstance(obj, dict) else None
+
+
+class NodeRecord:
+    __slots__ = ("num", "id", "long_name", "short_name", "hw_model", "role", "is_favorite", "values")
+
+    def __init__(self, num: int, node_id: Optional[str] = None):
+        self.num = num
+        self.id = _intern(node_id)
+        self.long_name: Optional[str] = None
+        self.short_name: Optional[str] = None
+        self.hw_model: Optional[str] = None
+        self.role: Optional[str] = None
+        self.is_favorite = False
+        self.values = array("d", _EMPTY)
+
+    def _set(self, fields: Dict[str, int], source: Optional[dict]):
+        if not source:
+            return
+        for key, slot in fields.items():
+            value = source.get(key)
+            if isinstance(value, (int, float)):
+                self.values[slot] = value
+
+    def update_from_node(self, node: dict):
+        """Merge a meshtastic node dict (interface.nodes entry or node.updated payload)."""
+        user = _as_dict(node.get("user"))
+        if user:
+            self.id = _intern(user.get("id")) or self.id
+            self.long_name = user.get("longName", self.long_name)
+            self.short_name = _intern(user.get("shortName")) or self.short_name
+            self.hw_model = _intern(user.get("hwModel")) or self.hw_model
+            self.role = _intern(user.get("role")) or self.role
+        self._set(POSITION_FIELDS, _as_dict(node.get("position")))
+        self._set(METRIC_FIELDS, _as_dict(node.get("deviceMetrics")))
+        for key, slot in (("snr", SNR), ("lastHeard", LAST_HEARD)):
+            if isinstance(node.get(key), (int, float)):
+                self.values[slot] = node[key]
+        # Stored as isFavorite or is_favorite depending on the meshtastic version
+        if "isFavorite" in node:
+            self.is_favorite = bool(node["isFavorite"])
+        elif "is_favorite" in node:
+            self.is_favorite = bool(node["is_favorite"])
+
+    def update_from_packet(self, packet: dict):
+        values = self.values
+        values[LAST_HEARD] = packet.get("rxTime") or time.time()
+        if packet.get("rxSnr") is not None:
+            values[SNR] = packet["rxSnr"]
+        decoded = packet.get("decoded") or {}
+        position = decoded.get("position")
+        if position and position.get("latitude") is not None:
+            self._set(POSITION_FIELDS, position)
+        self._set(METRIC_FIELDS, (decoded.get("telemetry") or {}).get("deviceMetrics"))
+
+    def _group(self, fields: Dict[str, int]) -> Optional[Dict[str, Any]]:
+        group = {}
+        for key, slot in fields.items():
+            value = self.values[slot]
+            if not math.isnan(value):
+                group[key] = int(value) if slot in INT_SLOTS else value
+        return group or None
+
+    def _value(self, slot: int) -> Any:
+        value = self.values[slot]
+        if math.isnan(value):
+            return None
+        return int(value) if slot in INT_SLOTS else value
+
+    def to_dict(self) -> Dict[str, Any]:
+        user = None
+        if self.id is not None:
+            user = {"id": self.id, "longName": self.long_name, "shortName": self.short_name, "hwModel": self.hw_model}
+            if self.role:
+                user["role"] = self.role
+        return {
+            "id": self.id,
+            "num": self.num,
+            "user": user,
+            "position": self._group(POSITION_FIELDS),
+            "snr": self._value(SNR),
+            "lastHeard": self._value(LAST_HEARD),
+            "deviceMetrics": self._group(METRIC_FIELDS),
+            "isFavorite": self.is_favorite,
+        }
+
+
+class NodeStore:
+    """Thread-safe: fed on the packet dispatcher thread, read by the API."""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._by_num: Dict[int, NodeRecord] = {}
+        self._by_id: Dict[str, NodeRecord] = {}
+
+    def __len__(self) -> int:
+        return len(self._by_num)
+
+    def _record(self, num: int, node_id: Optional[str] = None) -> NodeRecord:
+        record = self._by_num.get(num)
+        if record is None:
+            record = self._by_num[num] = NodeRecord(num, node_id)
+        return record
+
+    def _index(self, record: NodeRecord):
+        if record.id is not None:
+            self._by_id[record.id] = record
+
+    def load(self, nodes: Iterable[dict]):
+        """Replace everything with a fresh interface.nodes (on connect)."""
+        with self._lock:
+            self._by_num.clear()
+            self._by_id.clear()
+            for node in nodes:
+                if node.get("num") is not None:
+                    record = self._record(node["num"])
+                    record.update_from_node(node)
+                    self._index(record)
+
+    def clear(self):
+        """Forget all nodes (on disconnect)."""
+        with self._lock:
+            self._by_num.clear()
+            self._by_id.clear()
+
+    def update_node(self, node: dict) -> Optional[NodeRecord]:
+        if node.get("num") is None:
+            return None
+        with self._lock:
+            record = self._record(node["num"])
+            record.update_from_node(node)
+            self._index(record)
+            return record
+
+    def observe(self, packet: dict):
+        num = packet.get("from")
+        if num is None:
+            return
+        with self._lock:
+            record = self._record(num, packet.get("fromId"))
+            record.update_from_packet(packet)
+            self._index(record)
+
+    def set_favorite(self, node_id: str, is_favorite: bool):
+        with self._lock:
+            record = self._by_id.get(node_id)
+            if record is not None:
+                record.is_favorite = is_favorite
+
+    def get(self, node_id: str) -> Optional[Dict[str, Any]]:
+        """By id ("!12345678") or decimal node number."""
+        with self._lock:
+            record = self._by_id.get(node_id)
+            if record is None and node_id.isdigit():
+                record = self._by_num.get(int(node_id))
+            return record.to_dict() if record else None
+
+    def to_list(self) -> List[Dict[str, Any]]:
+        with self._lock:
+            return [record.to_dict() for record in self._by_num.values()]
+
+    def get_stats(self) -> Dict[str, Any]:
+        return {"nodes": len(self._by_num)}
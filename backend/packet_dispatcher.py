@@ -0,0 +1,118 @@
+import logging
+import threading
+import time
+from collections import deque
+from typing import Any, Callable, Deque, Dict, Optional, Tuple
+
+logger = logging.getLogger(__name__)
+
+# Never dropped on overflow, the oldest packet is evicted in their place
+CONTROL_KINDS = frozenset({"connection", "connection_lost"})
+
+
+class PacketDispatcher:
+    """Hands meshtastic callbacks off to a dedicated consumer thread.
+
+    The meshtastic reader thread only appends ``(kind, payload)`` items to a
+    bounded ring buffer. When the buffer is full the oldest packet is evicted
+    and counted as dropped, so a stalled consumer can never block radio reads.
+    Control items (connection established / lost) are never evicted.
+    """
+
+    def __init__(self, handler: Callable[[str, Any], None], maxlen: int = 1024):
+        self._handler = handler
+        self._maxlen = maxlen
+        self._buffer: Deque[Tuple[str, Any]] = deque()
+        self._cond = threading.Condition()
+        self._thread: Optional[threading.Thread] = None
+        self._running = False
+
+        self.enqueued = 0
+        self.processed = 0
+        self.dropped = 0
+        self.errors = 0
+        self.max_depth = 0
+        self._busy_time = 0.0
+
+    @property
+    def depth(self) -> int:
+        return len(self._buffer)
+
+    def start(self):
+        with self._cond:
+            if self._running:
+                return
+            self._running = True
+        self._thread = threading.Thread(
+            target=self._run, name="meshradar-dispatch", daemon=True
+        )
+        self._thread.start()
+
+    def stop(self, timeout: float = 5.0):
+        with self._cond:
+            self._running = False
+            self._cond.notify_all()
+        if self._thread and self._thread is not threading.current_thread():
+            self._thread.join(timeout)
+        self._thread = None
+
+    def submit(self, kind: str, payload: Any):
+        """Enqueue an item. Safe to call from any thread, never blocks."""
+        with self._cond:
+            if len(self._buffer) >= self._maxlen:
+                self._evict()
+            self._buffer.append((kind, payload))
+            self.enqueued += 1
+            depth = len(self._buffer)
+            if depth > self.max_depth:
+                self.max_depth = depth
+            self._cond.notify()
+
+    def _evict(self):
+        """Drop the oldest receive item, else the oldest non-control one.
+
+        With nothing evictable (a buffer of control items only) the buffer
+        grows past maxlen instead.
+        """
+        victim = None
+        for i, (kind, _) in enumerate(self._buffer):
+            if kind == "receive":
+                victim = i
+                break
+            if victim is None and kind not in CONTROL_KINDS:
+                victim = i
+        if victim is not None:
+            del self._buffer[victim]
+            self.dropped += 1
+
+    def _run(self):
+        while True:
+            with self._cond:
+                while self._running and not self._buffer:
+                    self._cond.wait()
+                if not self._running:
+                    return
+                kind, payload = self._buffer.popleft()
+
+            started = time.perf_counter()
+            try:
+                self._handler(kind, payload)
+            except Exception as e:
+                self.errors += 1
+                logger.exception(f"Dispatch handler failed for {kind}: {e}")
+            finally:
+                self._busy_time += time.perf_counter() - started
+                self.processed += 1
+
+    def get_stats(self) -> Dict[str, Any]:
+        return {
+            "running": self._running,
+            "depth": self.depth,
+            "capacity": self._maxlen,
+            "max_depth": self.max_depth,
+            "enqueued": self.enqueued,
+            "processed": self.processed,
+            "dropped": self.dropped,
+            "errors": self.errors,
+            "busy_seconds": round(self._busy_time, 3),
+        }
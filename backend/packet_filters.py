@@ -0,0 +1,143 @@
+"""Filter and sampling stage between packet decoding and persistence / fan-out.
+
+Rules come from PACKET_FILTERS (a JSON list) and PACKET_FILTERS_FILE, and are
+compiled once into predicates. The first matching rule decides; packets that
+match no rule are kept.
+"""
+import json
+import logging
+import math
+import threading
+import time
+from pathlib import Path
+from typing import Any, Callable, Dict, List, Optional, Tuple
+
+from schemas import PacketFilterRule
+from settings import settings
+
+logger = logging.getLogger(__name__)
+
+EARTH_RADIUS_M = 6371000.0
+
+
+def distance_m(a: Tuple[float, float], b: Tuple[float, float]) -> float:
+    """Haversine distance between two (lat, lon) points in meters."""
+    lat1, lon1 = map(math.radians, a)
+    lat2, lon2 = map(math.radians, b)
+    h = math.sin((lat2 - lat1) / 2) ** 2 + math.cos(lat1) * math.cos(lat2) * math.sin((lon2 - lon1) / 2) ** 2
+    return 2 * EARTH_RADIUS_M * math.asin(math.sqrt(h))
+
+
+def packet_position(packet: Dict[str, Any]) -> Optional[Tuple[float, float]]:
+    position = packet.get("decoded", {}).get("position") or {}
+    lat = position.get("latitude")
+    lon = position.get("longitude")
+    if lat is None and position.get("latitudeI") is not None:
+        lat = position["latitudeI"] * 1e-7
+        lon = position.get("longitudeI", 0) * 1e-7
+    if lat is None or lon is None:
+        return None
+    return lat, lon
+
+
+class CompiledRule:
+    def __init__(self, rule: PacketFilterRule, index: int):
+        self.rule = rule
+        self.name = rule.name or f"rule{index}"
+        self.action = rule.action
+        self.matched = 0
+        self.dropped = 0
+
+        # Only the conditions a rule actually sets end up in the predicate list
+        checks: List[Callable[[Dict[str, Any]], bool]] = []
+        if rule.portnums:
+            portnums = frozenset(rule.portnums)
+            checks.append(lambda p: p.get("decoded", {}).get("portnum") in portnums)
+        if rule.nodes:
+            nodes = frozenset(rule.nodes)
+            checks.append(lambda p: p.get("fromId") in nodes)
+        if rule.channels:
+            channels = frozenset(rule.channels)
+            checks.append(lambda p: p.get("channel", 0) in channels)
+        self._checks = tuple(checks)
+
+        # Per-node sampling state: (packets since last kept, last kept time, last kept position)
+        self._state: Dict[str, list] = {}
+
+    def matches(self, packet: Dict[str, Any]) -> bool:
+        for check in self._checks:
+            if not check(packet):
+                return False
+        return True
+
+    def _sample(self, packet: Dict[str, Any], now: float) -> bool:
+        rule = self.rule
+        state = self._state.setdefault(packet.get("fromId"), [0, None, None])
+        state[0] += 1
+        if rule.sample_every and state[0] < rule.sample_every:
+            return False
+        if rule.min_interval and state[1] is not None and now - state[1] < rule.min_interval:
+            return False
+        position = None
+        if rule.min_distance_m:
+            position = packet_position(packet)
+            if position and state[2] and distance_m(state[2], position) < rule.min_distance_m:
+                return False
+        state[0] = 0
+        state[1] = now
+        if position:
+            state[2] = position
+        return True
+
+    def accept(self, packet: Dict[str, Any], now: float) -> bool:
+        self.matched += 1
+        if self.action == "keep":
+            return True
+        if self.action == "sample" and self._sample(packet, now):
+            return True
+        self.dropped += 1
+        return False
+
+    def get_stats(self) -> Dict[str, Any]:
+        return {"name": self.name, "action": self.action, "matched": self.matched, "dropped": self.dropped}
+
+
+def load_rules() -> List[PacketFilterRule]:
+    raw = list(settings.packet_filters)
+    if settings.packet_filters_file:
+        raw += json.loads(Path(settings.packet_filters_file).read_text(encoding="utf-8"))
+    return [PacketFilterRule.model_validate(rule) for rule in raw]
+
+
+class PacketFilter:
+    """Thread-safe: runs on the packet dispatcher thread, stats are read from the API."""
+
+    def __init__(self, rules: Optional[List[PacketFilterRule]] = None):
+        self._lock = threading.Lock()
+        self.rules = [CompiledRule(rule, i) for i, rule in enumerate(rules or [])]
+        self.passed = 0
+        self.dropped = 0
+
+    def accept(self, packet: Dict[str, Any]) -> bool:
+        if not self.rules:
+            return True
+        now = time.monotonic()
+        with self._lock:
+            for rule in self.rules:
+                if rule.matches(packet):
+                    keep = rule.accept(packet, now)
+                    break
+            else:
+                keep = True
+            if keep:
+                self.passed += 1
+            else:
+                self.dropped += 1
+        return keep
+
+    def get_stats(self) -> Dict[str, Any]:
+        return {
+            "passed": self.passed,
+            "dropped": self.dropped,
+            "rules": [rule.get_stats() for rule in self.rules],
+        }
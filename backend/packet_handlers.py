@@ -0,0 +1,80 @@
+import logging
+import time
+from typing import Any, Callable, Dict
+
+logger = logging.getLogger(__name__)
+
+
+class PacketHandler:
+    __slots__ = ("portnum", "func", "persist", "broadcast", "calls", "errors", "busy_seconds", "max_seconds")
+
+    def __init__(self, portnum: str, func: Callable[[dict], None], persist: bool, broadcast: bool):
+        self.portnum = portnum
+        self.func = func
+        self.persist = persist
+        self.broadcast = broadcast
+        self.calls = 0
+        self.errors = 0
+        self.busy_seconds = 0.0
+        self.max_seconds = 0.0
+
+    def get_stats(self) -> Dict[str, Any]:
+        return {
+            "handler": self.func.__name__,
+            "persist": self.persist,
+            "broadcast": self.broadcast,
+            "calls": self.calls,
+            "errors": self.errors,
+            "busy_seconds": round(self.busy_seconds, 4),
+            "avg_ms": round(self.busy_seconds / self.calls * 1000, 3) if self.calls else None,
+            "max_ms": round(self.max_seconds * 1000, 3),
+        }
+
+
+class HandlerRegistry:
+    """Portnum -> handler lookup for decoded packets.
+
+    Handlers declare what they produce: database rows or engine state
+    (persist), client events (broadcast) or both. When nothing consumes
+    events (headless ingest) broadcast-only handlers are skipped. Runs on the dispatcher
+    thread only, so the counters need no lock.
+    """
+
+    def __init__(self):
+        self._handlers: Dict[str, PacketHandler] = {}
+        self.broadcast_enabled = True
+        self.unhandled: Dict[str, int] = {}
+        self.skipped = 0
+
+    def register(self, portnum: str, func: Callable[[dict], None], persist: bool = False, broadcast: bool = True):
+        self._handlers[portnum] = PacketHandler(portnum, func, persist, broadcast)
+
+    def dispatch(self, portnum: str, packet: dict):
+        handler = self._handlers.get(portnum)
+        if handler is None:
+            key = portnum or "UNKNOWN"
+            self.unhandled[key] = self.unhandled.get(key, 0) + 1
+            return
+        if not handler.persist and not self.broadcast_enabled:
+            self.skipped += 1
+            return
+
+        started = time.perf_counter()
+        try:
+            handler.func(packet)
+        except Exception as e:
+            handler.errors += 1
+            logger.exception(f"{portnum} handler failed: {e}")
+        finally:
+            elapsed = time.perf_counter() - started
+            handler.calls += 1
+            handler.busy_seconds += elapsed
+            if elapsed > handler.max_seconds:
+                handler.max_seconds = elapsed
+
+    def get_stats(self) -> Dict[str, Any]:
+        return {
+            "handlers": {portnum: h.get_stats() for portnum, h in self._handlers.items()},
+            "unhandled": dict(self.unhandled),
+            "skipped": self.skipped,
+        }
@@ -0,0 +1,87 @@
+"""Node presence ordered by last-heard time.
+
+Nodes are kept in two parallel lists sorted by last-heard time, so "heard in
+the last N seconds" is a bisect plus a slice, and the periodic offline sweep
+only looks at the nodes that crossed the timeout since the previous sweep.
+"""
+import bisect
+import threading
+import time
+from typing import Any, Dict, List, Optional, Set, Tuple
+
+# Seconds between offline sweeps
+SWEEP_INTERVAL = 30.0
+
+
+class PresenceIndex:
+    """Thread-safe: fed on the packet dispatcher thread, swept and queried on the event loop."""
+
+    def __init__(self, timeout: float):
+        # A node is online while it was heard within `timeout` seconds
+        self.timeout = timeout
+        self._lock = threading.Lock()
+        self._times: List[float] = []
+        self._ids: List[str] = []
+        self._last: Dict[str, float] = {}
+        self._online: Set[str] = set()
+        # Everything heard before this was already checked by a sweep
+        self._swept_until = 0.0
+        self.transitions = 0
+
+    def heard(self, node: str, when: Optional[float] = None, announce: bool = True) -> Optional[Dict[str, Any]]:
+        """Record a node as heard at `when`, returns an online event if it just came online."""
+        now = time.time()
+        when = min(when or now, now)
+        with self._lock:
+            old = self._last.get(node)
+            if old is not None:
+                if when <= old:
+                    return None
+                i = bisect.bisect_left(self._times, old)
+                while self._ids[i] != node:
+                    i += 1
+                del self._times[i]
+                del self._ids[i]
+            i = bisect.bisect_right(self._times, when)
+            self._times.insert(i, when)
+            self._ids.insert(i, node)
+            self._last[node] = when
+
+            if node in self._online or when < now - self.timeout:
+                return None
+            self._online.add(node)
+            if not announce:
+                return None
+            self.transitions += 1
+            return {"id": node, "status": "online", "last_heard": when}
+
+    def sweep(self, now: Optional[float] = None) -> List[Dict[str, Any]]:
+        """Offline events for nodes whose last packet is now older than the timeout."""
+        cutoff = (now or time.time()) - self.timeout
+        events = []
+        with self._lock:
+            start = bisect.bisect_left(self._times, self._swept_until)
+            end = bisect.bisect_left(self._times, cutoff)
+            for i in range(start, end):
+                node = self._ids[i]
+                if node in self._online:
+                    self._online.discard(node)
+                    events.append({"id": node, "status": "offline", "last_heard": self._times[i]})
+            self._swept_until = max(self._swept_until, cutoff)
+            self.transitions += len(events)
+        return events
+
+    def active(self, window: float, now: Optional[float] = None) -> List[Tuple[str, float]]:
+        """(node, last heard) for nodes heard within `window` seconds, most recent first."""
+        cutoff = (now or time.time()) - window
+        with self._lock:
+            start = bisect.bisect_left(self._times, cutoff)
+            return list(zip(reversed(self._ids[start:]), reversed(self._times[start:])))
+
+    def get_stats(self) -> Dict[str, Any]:
+        return {
+            "nodes": len(self._last),
+            "online": len(self._online),
+            "timeout": self.timeout,
+            "transitions": self.transitions,
+        }
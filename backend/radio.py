@@ -0,0 +1,120 @@
+import asyncio
+import logging
+from typing import Any, Dict
+
+from meshtastic_manager import mesh_manager
+from websocket_manager import ws_manager
+from bus import BusClient
+from settings import settings, get_bus_address
+import database as db
+
+logger = logging.getLogger(__name__)
+
+# MeshtasticManager methods the web layer may call, locally or over the bus
+REMOTE_METHODS = frozenset({
+    "get_status",
+    "get_nodes",
+    "get_node",
+    "get_active_nodes",
+    "get_channels",
+    "get_config",
+    "get_dispatch_stats",
+    "get_topology",
+    "find_path",
+    "get_link_stats",
+    "get_engine_stats",
+    "get_maintenance_stats",
+    "get_alert_rules",
+    "get_geofences",
+    "set_geofence",
+    "remove_geofence",
+    "reload_alert_rules",
+    "connect_serial",
+    "connect_tcp",
+    "connect_ble",
+    "disconnect",
+    "scan_ble_devices",
+    "send_message",
+    "send_traceroute",
+    "set_favorite",
+})
+
+# Methods that talk to the device and may block for seconds
+BLOCKING_METHODS = frozenset({
+    "connect_serial",
+    "connect_tcp",
+    "connect_ble",
+    "disconnect",
+    "scan_ble_devices",
+    "send_message",
+    "send_traceroute",
+    "set_favorite",
+})
+
+
+class LocalRadio:
+    """The radio is owned by this process (standalone mode and the radio owner)."""
+
+    async def call(self, method: str, *args) -> Any:
+        if method not in REMOTE_METHODS:
+            raise ValueError(f"Unknown radio method: {method}")
+        func = getattr(mesh_manager, method)
+        if method in BLOCKING_METHODS:
+            return await asyncio.to_thread(func, *args)
+        return func(*args)
+
+    def start(self):
+        pass
+
+    async def stop(self):
+        pass
+
+    def get_stats(self) -> Dict[str, Any]:
+        return {"role": settings.process_role}
+
+
+class RemoteRadio:
+    """The radio is owned by another process, reached over the event bus (workers)."""
+
+    def __init__(self):
+        self._client = BusClient(on_event=ws_manager.broadcast, on_hello=self._on_hello)
+
+    def _on_hello(self, frame: Dict[str, Any]):
+        ws_manager.adopt_epoch(frame["epoch"], frame["seq"])
+
+    async def call(self, method: str, *args) -> Any:
+        try:
+            return await self._client.call(method, *args)
+        except asyncio.TimeoutError:
+            raise ConnectionError("Radio owner did not respond")
+
+    def start(self):
+        self._client.start(get_bus_address())
+
+    async def stop(self):
+        await self._client.stop()
+
+    def get_stats(self) -> Dict[str, Any]:
+        return {"role": settings.process_role, "bus": self._client.get_stats()}
+
+
+radio = RemoteRadio() if settings.process_role == "worker" else LocalRadio()
+
+
+async def restore_connection():
+    """Auto-reconnect from saved settings"""
+    last_type = await db.get_setting("last_connection_type")
+    last_address = await db.get_setting("last_address")
+    if not (last_type and last_address):
+        return
+    try:
+        if last_type == "serial":
+            await radio.call("connect_serial", last_address)
+        elif last_type == "tcp":
+            parts = last_address.split(":")
+            host = parts[0]
+            port = int(parts[1]) if len(parts) > 1 else 4403
+            await radio.call("connect_tcp", host, port)
+        logger.info(f"Auto-reconnected to {last_type}://{last_address}")
+    except Exception as e:
+        logger.warning(f"Auto-reconnect failed: {e}")
@@ -1,5 +1,6 @@
-from pydantic import BaseModel
-from typing import Optional, Literal
+import re
+from pydantic import BaseModel, field_validator, model_validator
+from typing import Optional, Literal, List, Tuple
 from datetime import datetime
 
 
@@ -59,3 +60,111 @@ class TracerouteRequest(BaseModel):
 class WSMessage(BaseModel):
     type: str
     data: dict
+
+
+class PacketFilterRule(BaseModel):
+    """One rule of the packet filter stage (PACKET_FILTERS / PACKET_FILTERS_FILE).
+
+    Rules are checked in order and the first one that matches decides.
+    Empty match lists match everything.
+    """
+    name: Optional[str] = None
+    portnums: List[str] = []
+    nodes: List[str] = []
+    channels: List[int] = []
+    action: Literal["keep", "drop", "sample"] = "drop"
+    # sample: a matching packet is kept only if it passes every limit that is set (per node)
+    sample_every: Optional[int] = None
+    min_interval: Optional[float] = None
+    min_distance_m: Optional[float] = None
+
+
+class ExportSinkConfig(BaseModel):
+    """One packet / event export sink (EXPORT_SINKS).
+
+    Every sink has its own bounded queue and delivery thread. When the queue
+    is full, `overflow` decides which records are dropped, ingest never waits.
+    """
+    type: Literal["file", "udp", "unix", "mqtt"]
+    name: Optional[str] = None
+    # packets: decoded packets after the filter stage, events: what /ws clients receive
+    streams: List[Literal["packets", "events"]] = ["packets"]
+    queue_size: int = 10000
+    batch_size: int = 100
+    flush_interval: float = 1.0
+    overflow: Literal["drop_oldest", "drop_newest"] = "drop_oldest"
+    # file: rotating NDJSON
+    path: Optional[str] = None  # also the socket path for unix
+    max_bytes: int = 10 * 1024 * 1024
+    backups: int = 5
+    # udp / mqtt
+    host: str = "127.0.0.1"
+    port: Optional[int] = None
+    # udp / unix: NDJSON lines are packed into datagrams up to this size
+    max_datagram: int = 1400
+    # mqtt (3.1.1, QoS 0): records go to <topic_prefix>/<stream>
+    topic_prefix: str = "meshradar"
+    client_id: Optional[str] = None
+    username: Optional[str] = None
+    password: Optional[str] = None
+    keepalive: int = 60
+
+    @model_validator(mode="after")
+    def check_destination(self) -> "ExportSinkConfig":
+        if self.type in ("file", "unix") and not self.path:
+            raise ValueError(f"A {self.type} sink needs a path")
+        if self.type in ("udp", "mqtt") and not self.host:
+            raise ValueError(f"A {self.type} sink needs a host")
+        if self.type == "udp" and not self.port:
+            raise ValueError("A udp sink needs a port")
+        return self
+
+
+class GeofenceRequest(BaseModel):
+    name: str
+    # (latitude, longitude) vertices, the polygon closes itself
+    polygon: List[Tuple[float, float]]
+    # Nodes to track, empty for all
+    nodes: List[str] = []
+
+    @field_validator("polygon")
+    @classmethod
+    def check_polygon(cls, polygon: List[Tuple[float, float]]) -> List[Tuple[float, float]]:
+        if len(polygon) < 3:
+            raise ValueError("A polygon needs at least 3 points")
+        for lat, lon in polygon:
+            if not (-90 <= lat <= 90 and -180 <= lon <= 180):
+                raise ValueError(f"Invalid coordinates: {lat}, {lon}")
+        return polygon
+
+
+class AlertRule(BaseModel):
+    """One keyword / regex alert rule (ALERT_RULES / ALERT_RULES_FILE).
+
+    A rule fires when any of its keywords or its regex occurs in an incoming
+    text. Empty channels / nodes lists match every channel / sender.
+    """
+    name: Optional[str] = None
+    keywords: List[str] = []
+    regex: Optional[str] = None
+    case_sensitive: bool = False
+    whole_word: bool = True  # keywords only, use \b in regexes
+    channels: List[int] = []
+    nodes: List[str] = []
+    severity: Literal["info", "warning", "critical"] = "warning"
+
+    @field_validator("keywords")
+    @classmethod
+    def drop_empty_keywords(cls, keywords: List[str]) -> List[str]:
+        return [k for k in keywords if k]
+
+    @field_validator("regex")
+    @classmethod
+    def check_regex(cls, regex: Optional[str]) -> Optional[str]:
+        if regex:
+            try:
+                # Grouped like in the combined alert matcher, which rejects e.g. a global (?i)
+                re.compile(f"(?:{regex})")
+            except re.error as e:
+                raise ValueError(f"Invalid regex: {e}")
+        return regex or None
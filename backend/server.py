@@ -0,0 +1,527 @@
+import asyncio
+import hmac
+import logging
+import json
+import sys
+import os
+from pathlib import Path
+from typing import Literal
+from contextlib import asynccontextmanager
+from fastapi import FastAPI, WebSocket, WebSocketDisconnect, HTTPException, Query, UploadFile, File, Request
+from fastapi.middleware.cors import CORSMiddleware
+from fastapi.responses import StreamingResponse, JSONResponse, PlainTextResponse, Response
+
+from schemas import ConnectRequest, MessageRequest, TracerouteRequest, ConnectionStatus, GeofenceRequest
+from meshtastic_manager import mesh_manager
+from websocket_manager import ws_manager
+from radio import radio, restore_connection
+from settings import settings
+import database as db
+import maintenance
+from snapshot import snapshot_cache
+from ws_codec import WSFormat, WSCompression, JSON_CODEC, get_codec
+from topology import PathMode
+from static_manifest import StaticManifest
+import debug_tools
+from message_io import (
+    ExportFormat,
+    MEDIA_TYPES,
+    content_disposition,
+    stream_export,
+    open_import_stream,
+    iter_ndjson_batches,
+)
+
+logging.basicConfig(level=logging.INFO)
+logger = logging.getLogger(__name__)
+
+# Определяем базовую директорию и путь к статике
+if getattr(sys, "frozen", False):
+    # Запущено как exe
+    # sys._MEIPASS - это временная папка, куда PyInstaller распаковывает ресурсы
+    BUNDLE_DIR = Path(getattr(sys, "_MEIPASS", sys.executable))
+
+    # Сначала проверяем внешнюю папку static (рядом с exe)
+    # Это позволяет пользователю «подменить» интерфейс без пересборки
+    EXTERNAL_STATIC = Path(sys.executable).parent / "static"
+    if EXTERNAL_STATIC.exists():
+        STATIC_DIR = EXTERNAL_STATIC
+    else:
+        # Если внешней нет, используем упакованную внутри
+        STATIC_DIR = BUNDLE_DIR / "static"
+else:
+    # Запущено как скрипт
+    STATIC_DIR = Path(__file__).parent / "static"
+
+static_manifest = StaticManifest(STATIC_DIR)
+
+
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    loop = asyncio.get_event_loop()
+    ws_manager.set_loop(loop)
+    maintenance_task = None
+    presence_task = None
+
+    if STATIC_DIR.exists():
+        # Hashing and brotli take a moment, keep them off the event loop
+        await asyncio.to_thread(static_manifest.build)
+
+    if settings.process_role == "worker":
+        # The radio owner runs migrations and maintenance, workers only serve clients
+        radio.start()
+    else:
+        await db.init_db()
+        await mesh_manager.load_state()
+        mesh_manager.set_loop(loop)
+        await restore_connection()
+        presence_task = asyncio.create_task(mesh_manager.presence_loop())
+        if maintenance.retention_enabled():
+            maintenance_task = asyncio.create_task(maintenance.maintenance_loop())
+
+    yield
+
+    if maintenance_task:
+        maintenance_task.cancel()
+    if presence_task:
+        presence_task.cancel()
+    if settings.process_role == "worker":
+        await radio.stop()
+    else:
+        mesh_manager.shutdown()
+    await ws_manager.cleanup()
+    await db.close_db()
+
+
+app = FastAPI(title="MeshRadar", lifespan=lifespan)
+
+app.add_middleware(
+    CORSMiddleware,
+    allow_origins=[
+        "http://localhost:5173",
+        "http://localhost:8000",
+        "http://127.0.0.1:5173",
+        "http://127.0.0.1:8000",
+    ],
+    allow_credentials=True,
+    allow_methods=["*"],
+    allow_headers=["*"],
+)
+
+
+@app.exception_handler(ConnectionError)
+async def radio_unavailable(request, exc: ConnectionError):
+    return JSONResponse(status_code=503, content={"detail": str(exc)})
+
+
+async def require_connected() -> dict:
+    status = await radio.call("get_status")
+    if not status.get("connected"):
+        raise HTTPException(status_code=400, detail="Not connected")
+    return status
+
+
+async def get_my_node_id():
+    return (await radio.call("get_status")).get("my_node_id")
+
+
+@app.websocket("/ws")
+async def websocket_endpoint(
+    websocket: WebSocket,
+    snapshot: Literal["json", "gzip"] | None = None,
+    format: WSFormat = "json",
+    compress: WSCompression = "none",
+    epoch: str | None = None,
+    last_seq: int | None = None,
+):
+    # Plain JSON text frames stay the default, binary framing is opt-in
+    codec = get_codec(format, compress)
+    await ws_manager.connect(websocket, codec)
+    try:
+        since_seq = None
+        if last_seq is not None and ws_manager.can_resume(epoch, last_seq):
+            # Reconnect within the event log window: only replay missed events
+            await ws_manager.send(
+                websocket, {"type": "resumed", "data": {"epoch": ws_manager.epoch, "seq": last_seq}}
+            )
+            since_seq = last_seq
+        else:
+            if last_seq is not None:
+                await ws_manager.send(
+                    websocket,
+                    {"type": "resync", "data": {"epoch": ws_manager.epoch, "seq": ws_manager.seq}},
+                )
+            # With ?snapshot= the client gets its whole initial state in one frame
+            # instead of fetching status, nodes, channels and messages over REST
+            if snapshot:
+                current = await snapshot_cache.get()
+                if codec is not JSON_CODEC:
+                    await websocket.send_bytes(current.frame(codec))
+                elif snapshot == "gzip":
+                    await websocket.send_bytes(current.gzip)
+                else:
+                    await websocket.send_text(current.text)
+                since_seq = current.seq
+            else:
+                await ws_manager.send(
+                    websocket, {"type": "connection_status", "data": await radio.call("get_status")}
+                )
+        await ws_manager.activate(websocket, since_seq)
+
+        while True:
+            try:
+                command = await asyncio.wait_for(websocket.receive_text(), timeout=30)
+                await ws_manager.handle_command(websocket, command)
+            except asyncio.TimeoutError:
+                await ws_manager.send(websocket, {"type": "ping"})
+    except WebSocketDisconnect:
+        ws_manager.disconnect(websocket)
+    except Exception:
+        ws_manager.disconnect(websocket)
+
+
+@app.post("/api/connect")
+async def connect(request: ConnectRequest):
+    success = False
+
+    if request.type == "serial":
+        success = await radio.call("connect_serial", request.address)
+    elif request.type == "tcp":
+        parts = request.address.split(":")
+        host = parts[0]
+        try:
+            port = int(parts[1]) if len(parts) > 1 else 4403
+        except ValueError:
+            raise HTTPException(status_code=400, detail="Invalid port number")
+        success = await radio.call("connect_tcp", host, port)
+    elif request.type == "ble":
+        success = await radio.call("connect_ble", request.address)
+
+    if success:
+        await db.save_setting("last_connection_type", request.type)
+        await db.save_setting("last_address", request.address)
+        return {"success": True, "status": await radio.call("get_status")}
+
+    raise HTTPException(status_code=400, detail="Connection failed")
+
+
+@app.post("/api/disconnect")
+async def disconnect():
+    await radio.call("disconnect")
+    return {"success": True}
+
+
+@app.get("/api/ble-scan")
+async def scan_ble_devices():
+    """Scan for available BLE Meshtastic devices."""
+    devices = await radio.call("scan_ble_devices")
+    return {"devices": devices}
+
+
+@app.get("/api/status", response_model=ConnectionStatus)
+async def get_status():
+    status = await radio.call("get_status")
+    return ConnectionStatus(
+        connected=status.get("connected", False),
+        connection_type=status.get("connection_type"),
+        address=status.get("address"),
+        my_node_id=status.get("my_node_id"),
+        my_node_num=status.get("my_node_num"),
+    )
+
+
+@app.get("/api/nodes")
+async def get_nodes():
+    await require_connected()
+    return await radio.call("get_nodes")
+
+
+@app.get("/api/nodes/active")
+async def get_active_nodes(window: int = Query(default=None, gt=0)):
+    """Nodes heard within `window` seconds (default PRESENCE_TIMEOUT), most recent first."""
+    return await radio.call("get_active_nodes", window or settings.presence_timeout)
+
+
+@app.get("/api/node/{node_id}")
+async def get_node(node_id: str):
+    await require_connected()
+    node = await radio.call("get_node", node_id)
+    if not node:
+        raise HTTPException(status_code=404, detail="Node not found")
+    return node
+
+
+@app.get("/api/topology")
+async def get_topology():
+    """Mesh graph learned from traceroutes and neighbor info."""
+    return await radio.call("get_topology")
+
+
+@app.get("/api/topology/path")
+async def get_topology_path(target: str, source: str = None, mode: PathMode = "shortest"):
+    """Shortest (fewest hops) or most reliable known path, without a new traceroute."""
+    source = source or await get_my_node_id()
+    if not source:
+        raise HTTPException(status_code=400, detail="source is required when not connected")
+    return await radio.call("find_path", source, target, mode)
+
+
+@app.get("/api/node/{node_id}/link-stats")
+async def get_link_stats(node_id: str):
+    """Rolling SNR/RSSI, hop and packet rate aggregates for packets heard from a node."""
+    stats = await radio.call("get_link_stats", node_id)
+    if not stats:
+        raise HTTPException(status_code=404, detail="No packets heard from this node")
+    return stats
+
+
+@app.get("/api/waypoints")
+async def get_waypoints():
+    return await db.get_waypoints()
+
+
+@app.get("/api/alerts")
+async def get_alerts(limit: int = 100):
+    """Latest keyword / regex alert hits, newest first."""
+    return await db.get_alerts(limit)
+
+
+@app.get("/api/alerts/rules")
+async def get_alert_rules():
+    return await radio.call("get_alert_rules")
+
+
+@app.post("/api/alerts/reload")
+async def reload_alert_rules():
+    """Re-read ALERT_RULES / ALERT_RULES_FILE without a restart."""
+    result = await radio.call("reload_alert_rules")
+    if not result["success"]:
+        raise HTTPException(status_code=400, detail=result["error"])
+    return result
+
+
+@app.get("/api/geofences")
+async def get_geofences():
+    """Fences with the nodes currently inside each."""
+    return await radio.call("get_geofences")
+
+
+@app.post("/api/geofences")
+async def create_geofence(request: GeofenceRequest):
+    fence = await db.save_geofence(request.name, request.polygon, request.nodes)
+    await radio.call("set_geofence", fence)
+    return fence
+
+
+@app.put("/api/geofences/{fence_id}")
+async def update_geofence(fence_id: int, request: GeofenceRequest):
+    fence = await db.save_geofence(request.name, request.polygon, request.nodes, fence_id)
+    if fence is None:
+        raise HTTPException(status_code=404, detail="Geofence not found")
+    await radio.call("set_geofence", fence)
+    return fence
+
+
+@app.delete("/api/geofences/{fence_id}")
+async def delete_geofence(fence_id: int):
+    if not await db.delete_geofence(fence_id):
+        raise HTTPException(status_code=404, detail="Geofence not found")
+    await radio.call("remove_geofence", fence_id)
+    return {"success": True}
+
+
+@app.get("/api/channels")
+async def get_channels():
+    await require_connected()
+    return await radio.call("get_channels")
+
+
+@app.get("/api/config")
+async def get_config():
+    await require_connected()
+    return await radio.call("get_config")
+
+
+@app.post("/api/message")
+async def send_message(request: MessageRequest):
+    await require_connected()
+
+    packet_id = await radio.call(
+        "send_message",
+        request.text,
+        request.destination_id,
+        request.channel_index,
+        request.reply_id,
+    )
+
+    if packet_id is None:
+        raise HTTPException(status_code=500, detail="Failed to send message")
+
+    return {"success": True, "packet_id": packet_id}
+
+
+@app.post("/api/traceroute/{node_id}")
+async def traceroute(node_id: str, request: TracerouteRequest = TracerouteRequest()):
+    await require_connected()
+
+    logger.info(f"Traceroute request for {node_id}")
+
+    success = await radio.call(
+        "send_traceroute",
+        node_id,
+        request.hop_limit,
+        request.channel_index,
+    )
+
+    if not success:
+        raise HTTPException(status_code=500, detail="Failed to send traceroute")
+
+    return {"success": True, "message": "Traceroute initiated"}
+
+
+@app.post("/api/node/{node_id}/favorite")
+async def set_favorite(node_id: str, is_favorite: bool = Query(...)):
+    """Set favorite status for a node."""
+    await require_connected()
+
+    success = await radio.call("set_favorite", node_id, is_favorite)
+
+    if not success:
+        raise HTTPException(status_code=500, detail="Failed to set favorite")
+
+    return {"success": True, "node_id": node_id, "is_favorite": is_favorite}
+
+
+@app.get("/api/metrics")
+async def get_metrics():
+    return {
+        "radio": radio.get_stats(),
+        "dispatch": await radio.call("get_dispatch_stats"),
+        "engines": await radio.call("get_engine_stats"),
+        # Retention runs in the radio owner, not in web workers
+        "maintenance": await radio.call("get_maintenance_stats"),
+        "snapshot": snapshot_cache.get_stats(),
+        "message_cache": db.message_cache.get_stats(),
+    }
+
+
+@app.get("/api/messages")
+async def get_messages(channel: int = None, dm_partner: str = None, limit: int = 100, parents: bool = False):
+    my_node_id = await get_my_node_id() if dm_partner else None
+    messages = await db.get_messages(
+        channel=channel, dm_partner=dm_partner, my_node_id=my_node_id, limit=limit, with_parents=parents
+    )
+    return messages
+
+
+@app.get("/api/messages/{packet_id}/thread")
+async def get_message_thread(packet_id: int):
+    """Reply chain containing the message: its root and every reply below it."""
+    thread = await db.get_thread(packet_id)
+    if not thread:
+        raise HTTPException(status_code=404, detail="Message not found")
+    return thread
+
+
+@app.get("/api/conversations")
+async def get_conversations(client_id: str = "default"):
+    """Every channel / DM with its last message and unread count for this client."""
+    return await db.get_conversations(client_id)
+
+
+@app.post("/api/conversations/{key}/read")
+async def mark_conversation_read(key: str, client_id: str = "default"):
+    if not await db.mark_conversation_read(client_id, key):
+        raise HTTPException(status_code=404, detail="Conversation not found")
+    return {"success": True}
+
+
+@app.get("/api/messages/export")
+async def export_messages(
+    channel: int = None,
+    dm_partner: str = None,
+    format: ExportFormat = "ndjson",
+    gzip: bool = False,
+):
+    """Stream message history as NDJSON or CSV without loading it into memory."""
+    my_node_id = await get_my_node_id() if dm_partner else None
+    chunks = db.iter_messages(channel=channel, dm_partner=dm_partner, my_node_id=my_node_id)
+    if dm_partner:
+        name = f"messages-dm-{dm_partner.lstrip('!')}"
+    elif channel is not None:
+        name = f"messages-channel-{channel}"
+    else:
+        name = "messages"
+    filename = f"{name}.{format}" + (".gz" if gzip else "")
+    return StreamingResponse(
+        stream_export(chunks, format, compress=gzip),
+        media_type="application/gzip" if gzip else MEDIA_TYPES[format],
+        headers={"Content-Disposition": content_disposition(filename)},
+    )
+
+
+@app.post("/api/messages/import")
+async def import_messages(file: UploadFile = File(...)):
+    """Import an NDJSON message export (plain or gzip), skipping duplicates."""
+    try:
+        stream = open_import_stream(file.file)
+        result = await db.import_messages(iter_ndjson_batches(stream, db.IMPORT_COLUMNS))
+    except (ValueError, OSError) as e:
+        raise HTTPException(status_code=400, detail=f"Invalid import file: {e}")
+    return {"success": True, **result}
+
+
+def require_debug_token(request: Request):
+    """Debug endpoints answer 404 unless DEBUG_TOKEN is set and presented."""
+    token = request.headers.get("X-Debug-Token") or request.query_params.get("token") or ""
+    if not settings.debug_token or not hmac.compare_digest(token.encode(), settings.debug_token.encode()):
+        raise HTTPException(status_code=404, detail="Not Found")
+
+
+@app.get("/debug/profile")
+async def debug_profile(
+    request: Request,
+    seconds: float = Query(default=10, gt=0, le=300),
+    mode: Literal["sample", "cprofile"] = "sample",
+    interval: float = Query(default=0.005, ge=0.001, le=1),
+):
+    """Profile this process for `seconds`.
+
+    sample: stack samples of every thread as collapsed stacks (flamegraph.pl input).
+    cprofile: deterministic profile of the event loop thread as a .pstats download.
+    """
+    require_debug_token(request)
+    try:
+        if mode == "cprofile":
+            stats = await debug_tools.cprofile_event_loop(seconds)
+            return Response(
+                stats,
+                media_type="application/octet-stream",
+                headers={"Content-Disposition": 'attachment; filename="meshradar.pstats"'},
+            )
+        return PlainTextResponse(await debug_tools.sample_profile(seconds, interval))
+    except debug_tools.SessionBusy:
+        raise HTTPException(status_code=409, detail="A profiling session is already running")
+
+
+@app.get("/debug/memory")
+async def debug_memory(
+    request: Request,
+    action: Literal["start", "snapshot", "stop"] = "snapshot",
+    top: int = Query(default=25, gt=0, le=500),
+):
+    """tracemalloc: the first call starts tracing, later ones return top-N and the diff to the previous call."""
+    require_debug_token(request)
+    return await asyncio.to_thread(debug_tools.memory_snapshot, action, top)
+
+
+# Отдаём статические файлы (React build) из манифеста в памяти
+if STATIC_DIR.exists():
+
+    @app.get("/{path:path}")
+    async def serve_spa(path: str, request: Request):
+        # Для SPA: если файла нет в манифесте - отдаём index.html
+        asset = static_manifest.lookup(path)
+        if asset is None:
+            raise HTTPException(status_code=404, detail="Not found")
+        return asset.response(request)
@@ -1,6 +1,6 @@
 import sys
 from pathlib import Path
-from typing import Optional
+from typing import Any, Dict, List, Literal, Optional
 
 from pydantic_settings import BaseSettings, SettingsConfigDict
 
@@ -14,6 +14,53 @@ class Settings(BaseSettings):
 
     database_path: Optional[str] = None
 
+    # Capacity of the ring buffer between meshtastic's reader thread and the packet consumer
+    dispatch_queue_size: int = 1024
+
+    # standalone: one process owns the radio and serves the web app
+    # radio: headless radio owner publishing to the event bus (python main.py radio)
+    # worker: web worker without a radio, talks to the owner over the bus
+    process_role: Literal["standalone", "radio", "worker"] = "standalone"
+    bus_address: Optional[str] = None  # Unix socket path or host:port
+
+    # Packet filter / sampling rules (JSON list, see schemas.PacketFilterRule),
+    # inline and/or from a file; rules from the file come after the inline ones
+    packet_filters: List[Dict[str, Any]] = []
+    packet_filters_file: Optional[str] = None
+
+    # Export sinks for the packet / event stream (JSON list, see schemas.ExportSinkConfig)
+    export_sinks: List[Dict[str, Any]] = []
+
+    # Keyword / regex alert rules (JSON list, see schemas.AlertRule), inline and/or
+    # from a file that is re-read when it changes
+    alert_rules: List[Dict[str, Any]] = []
+    alert_rules_file: Optional[str] = None
+
+    # Recent /ws events kept for reconnecting clients to catch up from
+    event_log_size: int = 1000
+
+    # Memory cap of the latest-page-per-conversation cache in front of /api/messages,
+    # 0 disables it (always off for workers, the radio owner writes the messages)
+    message_cache_bytes: int = 4 * 1024 * 1024
+
+    # A node counts as online while it was heard within this many seconds
+    presence_timeout: int = 900
+
+    # Mesh topology graph: edge reliability halves every topology_half_life seconds,
+    # edges unseen for topology_edge_ttl seconds are dropped
+    topology_half_life: int = 6 * 3600
+    topology_edge_ttl: int = 3 * 86400
+
+    # Enables /debug/profile and /debug/memory for requests carrying this token
+    # (X-Debug-Token header or ?token=); the endpoints don't exist without it
+    debug_token: Optional[str] = None
+
+    # Message history retention (disabled when both limits are unset)
+    retention_days: Optional[int] = None
+    retention_max_rows: Optional[int] = None  # per channel / DM conversation
+    retention_interval: int = 3600  # seconds between maintenance runs
+    archive_dir: Optional[str] = None
+
 
 settings = Settings()
 
@@ -38,3 +85,25 @@ def get_db_path() -> Path:
 
 
 DB_PATH = get_db_path()
+
+
+def get_archive_dir() -> Path:
+    """
+    Возвращает папку для архивов удалённых сообщений.
+    По умолчанию - папка archive рядом с базой данных.
+    """
+    if settings.archive_dir is not None:
+        return Path(settings.archive_dir).expanduser().resolve()
+    return DB_PATH.parent / "archive"
+
+
+def get_bus_address() -> str:
+    """
+    Адрес шины событий между процессом-владельцем радио и веб-воркерами.
+    По умолчанию - Unix-сокет рядом с базой, на Windows - TCP на localhost.
+    """
+    if settings.bus_address is not None:
+        return settings.bus_address
+    if sys.platform == "win32":
+        return "127.0.0.1:47800"
+    return str(DB_PATH.parent / "meshradar.sock")
@@ -0,0 +1,109 @@
+import asyncio
+import gzip
+import json
+import logging
+import time
+from typing import Dict, Optional, Union
+
+from radio import radio
+from ws_codec import WSCodec
+from websocket_manager import ws_manager
+import database as db
+
+logger = logging.getLogger(__name__)
+
+# How long a built snapshot is shared between connecting clients
+SNAPSHOT_TTL = 2.0
+MESSAGES_PER_CONVERSATION = 100
+MAX_DM_CONVERSATIONS = 20
+
+
+class Snapshot:
+    def __init__(self, data: dict):
+        self.data = data
+        # Events after this sequence number are replayed on top of the snapshot
+        self.seq = data["data"]["seq"]
+        self.text = json.dumps(data, default=str)
+        self.created = time.monotonic()
+        self._gzip: Optional[bytes] = None
+        self._frames: Dict[WSCodec, Union[str, bytes]] = {}
+
+    @property
+    def gzip(self) -> bytes:
+        if self._gzip is None:
+            self._gzip = gzip.compress(self.text.encode("utf-8"), compresslevel=6)
+        return self._gzip
+
+    def frame(self, codec: WSCodec) -> Union[str, bytes]:
+        if codec not in self._frames:
+            self._frames[codec] = codec.encode(self.data)
+        return self._frames[codec]
+
+
+class SnapshotCache:
+    """Builds the initial /ws state once and shares it for SNAPSHOT_TTL seconds.
+
+    Clients that connect while a build is running wait for it instead of
+    starting their own, so a reconnect storm costs a single build.
+    """
+
+    def __init__(self, ttl: float = SNAPSHOT_TTL):
+        self.ttl = ttl
+        self._snapshot: Optional[Snapshot] = None
+        self._lock = asyncio.Lock()
+        self.builds = 0
+        self.hits = 0
+
+    async def get(self) -> Snapshot:
+        snapshot = self._snapshot
+        if snapshot and time.monotonic() - snapshot.created < self.ttl:
+            self.hits += 1
+            return snapshot
+
+        async with self._lock:
+            snapshot = self._snapshot
+            if snapshot and time.monotonic() - snapshot.created < self.ttl:
+                self.hits += 1
+                return snapshot
+            snapshot = Snapshot(await self._build())
+            self._snapshot = snapshot
+            self.builds += 1
+            return snapshot
+
+    async def _build(self) -> dict:
+        seq = ws_manager.seq
+        status = await radio.call("get_status")
+        connected = status.get("connected")
+        nodes = await radio.call("get_nodes") if connected else []
+        channels = await radio.call("get_channels") if connected else []
+        my_node_id = status.get("my_node_id")
+
+        # Keys match the frontend chat keys, lists match /api/messages?parents=true responses
+        messages = {}
+        for channel in channels:
+            messages[f"channel:{channel['index']}"] = await db.get_messages(
+                channel=channel["index"], limit=MESSAGES_PER_CONVERSATION, with_parents=True
+            )
+        for partner in await db.get_dm_partners(MAX_DM_CONVERSATIONS):
+            messages[f"dm:{partner}"] = await db.get_messages(
+                dm_partner=partner, my_node_id=my_node_id, limit=MESSAGES_PER_CONVERSATION,
+                with_parents=True,
+            )
+
+        return {
+            "type": "snapshot",
+            "data": {
+                "status": status,
+                "nodes": nodes,
+                "channels": channels,
+                "messages": messages,
+                "epoch": ws_manager.epoch,
+                "seq": seq,
+            },
+        }
+
+    def get_stats(self) -> dict:
+        return {"builds": self.builds, "hits": self.hits}
+
+
+snapshot_cache = SnapshotCache()
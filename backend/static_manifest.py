@@ -0,0 +1,156 @@
+"""In-memory manifest of the built frontend (STATIC_DIR).
+
+Built once at startup: every file gets an ETag and, for text types, gzip and
+brotli variants. Requests are answered from memory without touching the
+filesystem, which matters for the portable build where nothing sits in front
+of the backend.
+"""
+import gzip
+import hashlib
+import logging
+import mimetypes
+import os
+import re
+from pathlib import Path
+from typing import Dict, Optional
+
+from starlette.requests import Request
+from starlette.responses import FileResponse, Response
+
+try:
+    import brotli
+except ImportError:  # Brotli is optional, gzip is always available
+    brotli = None
+
+logger = logging.getLogger(__name__)
+
+# Vite output names look like index-4f3a9c1b.js / index-BqZ3x_7k.css
+HASHED_ASSET = re.compile(r"^assets/.+-[A-Za-z0-9_-]{8}\.[a-z0-9]+$")
+IMMUTABLE = "public, max-age=31536000, immutable"
+REVALIDATE = "no-cache"
+COMPRESSIBLE = ("text/", "application/javascript", "application/json", "image/svg+xml")
+# Bigger files (videos, large images) are streamed from disk
+MAX_INLINE_SIZE = 4 * 1024 * 1024
+MIN_COMPRESS_SIZE = 256
+
+
+def accepted_encodings(header: str) -> Dict[str, float]:
+    """Accept-Encoding as coding -> q-value (q=0 means refused)."""
+    weights: Dict[str, float] = {}
+    for part in header.split(","):
+        coding, _, params = part.partition(";")
+        coding = coding.strip().lower()
+        if not coding:
+            continue
+        q = 1.0
+        for param in params.split(";"):
+            name, _, value = param.partition("=")
+            if name.strip().lower() == "q":
+                try:
+                    q = float(value)
+                except ValueError:
+                    q = 0.0
+        weights[coding] = q
+    return weights
+
+
+class StaticAsset:
+    def __init__(self, path: Path, rel: str):
+        self.path = path
+        self.stat = path.stat()
+        self.media_type = mimetypes.guess_type(rel)[0] or "application/octet-stream"
+        self.cache_control = IMMUTABLE if HASHED_ASSET.match(rel) else REVALIDATE
+        self.body: Optional[bytes] = None
+        # encoding -> (body, etag)
+        self.variants: Dict[str, tuple] = {}
+
+        if self.stat.st_size > MAX_INLINE_SIZE:
+            digest = f"{self.stat.st_mtime_ns:x}-{self.stat.st_size:x}"
+        else:
+            self.body = path.read_bytes()
+            digest = hashlib.sha1(self.body).hexdigest()[:16]
+            if self.media_type.startswith(COMPRESSIBLE) and len(self.body) >= MIN_COMPRESS_SIZE:
+                self._add_variant("gzip", path.with_name(path.name + ".gz"), digest)
+                self._add_variant("br", path.with_name(path.name + ".br"), digest)
+        self.etag = f'"{digest}"'
+
+    def _add_variant(self, encoding: str, prebuilt: Path, digest: str):
+        # Prefer files precompressed by the frontend build, if it made any
+        if prebuilt.is_file():
+            data = prebuilt.read_bytes()
+        elif encoding == "gzip":
+            data = gzip.compress(self.body, compresslevel=9, mtime=0)
+        elif brotli is not None:
+            data = brotli.compress(self.body, quality=11)
+        else:
+            return
+        if len(data) < len(self.body):
+            self.variants[encoding] = (data, f'"{digest}-{encoding}"')
+
+    def matches(self, if_none_match: str) -> bool:
+        tags = {tag.strip().removeprefix("W/") for tag in if_none_match.split(",")}
+        if "*" in tags or self.etag in tags:
+            return True
+        return any(etag in tags for _, etag in self.variants.values())
+
+    def response(self, request: Request) -> Response:
+        headers = {"Cache-Control": self.cache_control, "ETag": self.etag}
+        if self.variants:
+            headers["Vary"] = "Accept-Encoding"
+
+        body = self.body
+        if self.variants:
+            weights = accepted_encodings(request.headers.get("accept-encoding", ""))
+            best, best_q = None, 0.0
+            # On equal q brotli wins, it is the smaller variant
+            for encoding in ("br", "gzip"):
+                q = weights.get(encoding, weights.get("*", 0.0))
+                if encoding in self.variants and q > best_q:
+                    best, best_q = encoding, q
+            if best is not None:
+                body, headers["ETag"] = self.variants[best]
+                headers["Content-Encoding"] = best
+
+        if self.matches(request.headers.get("if-none-match", "")):
+            headers.pop("Content-Encoding", None)
+            return Response(status_code=304, headers=headers)
+        if body is None:
+            return FileResponse(self.path, media_type=self.media_type, headers=headers, stat_result=self.stat)
+        return Response(body, media_type=self.media_type, headers=headers)
+
+
+class StaticManifest:
+    def __init__(self, root: Path):
+        self.root = root
+        self.assets: Dict[str, StaticAsset] = {}
+
+    def build(self):
+        assets = {}
+        inline_bytes = 0
+        for dirpath, _, filenames in os.walk(self.root):
+            for filename in filenames:
+                if filename.endswith((".gz", ".br")):
+                    continue
+                path = Path(dirpath) / filename
+                rel = path.relative_to(self.root).as_posix()
+                asset = StaticAsset(path, rel)
+                assets[rel] = asset
+                inline_bytes += len(asset.body or b"") + sum(len(v[0]) for v in asset.variants.values())
+        self.assets = assets
+        logger.info(f"Static manifest: {len(assets)} files, {inline_bytes // 1024} KiB in memory")
+
+    @property
+    def index(self) -> Optional[StaticAsset]:
+        return self.assets.get("index.html")
+
+    def lookup(self, path: str) -> Optional[StaticAsset]:
+        """Asset for a request path; unknown paths fall back to index.html (SPA routing).
+
+        Missing files under assets/ are real misses (a stale hashed bundle name)
+        and get None, answering index.html there would break the caller's parse.
+        """
+        path = path.lstrip("/")
+        asset = self.assets.get(path)
+        if asset is None and not path.startswith("assets/"):
+            asset = self.index
+        return asset
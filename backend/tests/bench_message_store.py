@@ -0,0 +1,135 @@
+"""History query time and index size, text timestamps vs integer epoch columns.
+
+    python tests/bench_message_store.py [rows]
+
+Builds a database with the old schema (DATETIME text timestamps, indexes on
+channel and sender/receiver), measures it, migrates it with init_db and
+measures again: fetching the latest 100 messages of one channel, the size of
+each index (dbstat) and one retention pass over the migrated table.
+"""
+import asyncio
+import os
+import random
+import sqlite3
+import sys
+import tempfile
+import time
+from pathlib import Path
+
+DB_FILE = Path(tempfile.mkdtemp(prefix="meshradar-bench-")) / "meshtastic.db"
+# database reads DATABASE_PATH on import
+os.environ["DATABASE_PATH"] = str(DB_FILE)
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
+
+import database as db  # noqa: E402
+
+CHANNELS = 8
+PAGE = 100
+QUERIES = 200
+
+LEGACY_SCHEMA = """
+    CREATE TABLE messages (
+        id INTEGER PRIMARY KEY AUTOINCREMENT,
+        packet_id INTEGER,
+        sender TEXT NOT NULL,
+        receiver TEXT,
+        channel INTEGER DEFAULT 0,
+        text TEXT NOT NULL,
+        timestamp DATETIME DEFAULT CURRENT_TIMESTAMP,
+        ack_status TEXT DEFAULT 'pending',
+        is_outgoing INTEGER DEFAULT 0,
+        reply_id INTEGER
+    );
+    CREATE INDEX idx_messages_channel ON messages(channel);
+    CREATE INDEX idx_messages_sender_receiver ON messages(sender, receiver);
+    CREATE INDEX idx_messages_packet_id ON messages(packet_id);
+    CREATE INDEX idx_messages_reply_id ON messages(reply_id);
+"""
+
+
+def build_legacy(rows: int):
+    rng = random.Random(1)
+    conn = sqlite3.connect(DB_FILE)
+    conn.executescript(LEGACY_SCHEMA)
+    start = 1700000000
+    conn.executemany(
+        "INSERT INTO messages (packet_id, sender, channel, text, timestamp, ack_status) VALUES (?, ?, ?, ?, ?, 'received')",
+        (
+            (
+                rng.randrange(2**32), f"!{rng.randrange(300):08x}", rng.randrange(CHANNELS), f"message {i}",
+                time.strftime("%Y-%m-%d %H:%M:%S", time.gmtime(start + i * 5)),
+            )
+            for i in range(rows)
+        ),
+    )
+    conn.commit()
+    conn.close()
+
+
+def index_sizes() -> dict:
+    conn = sqlite3.connect(DB_FILE)
+    try:
+        rows = conn.execute(
+            """SELECT name, SUM(pgsize) FROM dbstat
+               WHERE name IN (SELECT name FROM sqlite_master WHERE type = 'index' AND tbl_name = 'messages')
+               GROUP BY name ORDER BY name"""
+        ).fetchall()
+    finally:
+        conn.close()
+    return dict(rows)
+
+
+def query_time(sql: str) -> tuple:
+    """Average seconds per query and whether the plan needs a temp sort."""
+    conn = sqlite3.connect(DB_FILE)
+    try:
+        plan = " ".join(row[-1] for row in conn.execute(f"EXPLAIN QUERY PLAN {sql}", (3, PAGE)))
+        started = time.perf_counter()
+        for _ in range(QUERIES):
+            conn.execute(sql, (3, PAGE)).fetchall()
+        return (time.perf_counter() - started) / QUERIES, "TEMP B-TREE" in plan
+    finally:
+        conn.close()
+
+
+def report(label: str, sql: str):
+    seconds, sorts = query_time(sql)
+    print(f"{label}: latest {PAGE} of one channel {seconds * 1000:.2f} ms/query"
+          f"{' (temp B-tree sort)' if sorts else ' (in index order)'}")
+    for name, size in index_sizes().items():
+        print(f"    {name:<40} {size / 1024 / 1024:>6.1f} MB")
+
+
+async def migrate_and_measure(rows: int):
+    started = time.perf_counter()
+    await db.init_db()
+    print(f"\ninit_db migration of {rows} rows: {time.perf_counter() - started:.1f} s\n")
+    await db.close_db()
+    report(
+        "rx_time_ms",
+        "SELECT * FROM messages WHERE channel = ? ORDER BY rx_time_ms DESC, id DESC LIMIT ?",
+    )
+
+    started = time.perf_counter()
+    await db.prepare_retention(PAGE)
+    expired, after_id = 0, 0
+    while True:
+        batch = await db.get_expired_messages(max_rows=PAGE, after_id=after_id)
+        if not batch:
+            break
+        expired += len(batch)
+        after_id = batch[-1]["id"]
+    print(f"\nretention scan (keep {PAGE} per conversation): {expired} expired rows found in "
+          f"{time.perf_counter() - started:.2f} s")
+    await db.close_db()
+
+
+def main():
+    rows = int(sys.argv[1]) if len(sys.argv) > 1 else 200000
+    build_legacy(rows)
+    report("text timestamp", "SELECT * FROM messages WHERE channel = ? ORDER BY timestamp DESC LIMIT ?")
+    asyncio.run(migrate_and_measure(rows))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,99 @@
+"""Memory and /api/nodes serialization time, interface.nodes vs NodeStore.
+
+    python tests/bench_node_store.py [nodes]
+
+Builds a synthetic interface.nodes (default 10000 nodes, shaped like what
+meshtastic keeps after the config download) and measures what it retains
+(tracemalloc), then what a NodeStore loaded from it retains once the source
+dicts are gone. Serialization compares the old per-request path (a deep copy
+of every node dict, as get_nodes did before NodeStore) with NodeStore.to_list.
+"""
+import gc
+import sys
+import time
+import tracemalloc
+from pathlib import Path
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
+sys.path.insert(0, str(Path(__file__).resolve().parent))
+
+from google.protobuf.json_format import MessageToDict  # noqa: E402
+
+from node_store import NodeStore  # noqa: E402
+from synthetic import make_nodes  # noqa: E402
+
+ROUNDS = 10
+
+
+def _deep_convert(obj):
+    if obj is None:
+        return None
+    if hasattr(obj, "DESCRIPTOR"):
+        obj = MessageToDict(obj)
+    if isinstance(obj, dict):
+        return {k: _deep_convert(v) for k, v in obj.items()}
+    if isinstance(obj, list):
+        return [_deep_convert(item) for item in obj]
+    return obj
+
+
+def format_node(node: dict) -> dict:
+    """MeshtasticManager._format_node before NodeStore, minus its debug logging."""
+    user = node.get("user")
+    return {
+        "id": user.get("id") if user else None,
+        "num": node.get("num"),
+        "user": _deep_convert(user),
+        "position": _deep_convert(node.get("position")),
+        "snr": node.get("snr"),
+        "lastHeard": node.get("lastHeard"),
+        "deviceMetrics": _deep_convert(node.get("deviceMetrics")),
+        "isFavorite": node.get("isFavorite", node.get("is_favorite", False)),
+    }
+
+
+def retained(build) -> tuple:
+    """(result, bytes still allocated after build() returns)."""
+    gc.collect()
+    tracemalloc.start()
+    try:
+        result = build()
+        gc.collect()
+        return result, tracemalloc.get_traced_memory()[0]
+    finally:
+        tracemalloc.stop()
+
+
+def best_time(func) -> float:
+    best = float("inf")
+    for _ in range(ROUNDS):
+        started = time.perf_counter()
+        func()
+        best = min(best, time.perf_counter() - started)
+    return best
+
+
+def _load_store(count: int) -> NodeStore:
+    store = NodeStore()
+    # The source dicts are dropped on return, only what the store keeps counts
+    store.load(make_nodes(count).values())
+    return store
+
+
+def main():
+    count = int(sys.argv[1]) if len(sys.argv) > 1 else 10000
+    nodes, nodes_bytes = retained(lambda: make_nodes(count))
+    store, store_bytes = retained(lambda: _load_store(count))
+    print(f"{count} nodes retained:")
+    print(f"    interface.nodes {nodes_bytes / 1024 / 1024:>7.1f} MB")
+    print(f"    NodeStore       {store_bytes / 1024 / 1024:>7.1f} MB")
+
+    old = best_time(lambda: [format_node(node) for node in nodes.values()])
+    new = best_time(store.to_list)
+    print(f"\n/api/nodes serialization, best of {ROUNDS}:")
+    print(f"    deep copy of interface.nodes {old * 1000:>7.1f} ms")
+    print(f"    NodeStore.to_list            {new * 1000:>7.1f} ms")
+
+
+if __name__ == "__main__":
+    main()
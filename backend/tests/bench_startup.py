@@ -0,0 +1,58 @@
+"""Import time of the headless and web entry points, each in a fresh interpreter.
+
+    python tests/bench_startup.py [rounds]
+
+daemon is what `main.py --ingest-only` / `main.py radio` load, server is the
+web app. The best of `rounds` runs (default 5) is reported, with the slowest
+modules the entry point imports directly (-X importtime of the last run).
+"""
+import os
+import subprocess
+import sys
+import tempfile
+import time
+from pathlib import Path
+
+BACKEND = Path(__file__).resolve().parent.parent
+MODES = {"headless (daemon)": "daemon", "web (server)": "server"}
+SLOWEST = 5
+
+
+def _run(module: str, env: dict) -> tuple:
+    started = time.perf_counter()
+    result = subprocess.run(
+        [sys.executable, "-X", "importtime", "-c", f"import {module}"],
+        cwd=BACKEND, env=env, capture_output=True, text=True, check=True,
+    )
+    return time.perf_counter() - started, result.stderr
+
+
+def _direct_imports(importtime: str) -> list:
+    """(cumulative us, module) of the entry point's own imports in -X importtime output."""
+    rows = []
+    for line in importtime.splitlines():
+        if not line.startswith("import time:") or "cumulative" in line:
+            continue
+        _, cumulative, name = line[len("import time:"):].split("|")
+        # One space for top-level imports, two more per nesting level
+        if name.startswith("   ") and not name.startswith("     "):
+            rows.append((int(cumulative), name.strip()))
+    return sorted(rows, reverse=True)[:SLOWEST]
+
+
+def main():
+    rounds = int(sys.argv[1]) if len(sys.argv) > 1 else 5
+    env = {**os.environ, "DATABASE_PATH": str(Path(tempfile.mkdtemp()) / "meshtastic.db")}
+    # Warm the bytecode cache first, so every round measures the same thing
+    for module in MODES.values():
+        _run(module, env)
+    for label, module in MODES.items():
+        runs = [_run(module, env) for _ in range(rounds)]
+        best = min(seconds for seconds, _ in runs)
+        print(f"{label}: best of {rounds} {best * 1000:.0f} ms")
+        for cumulative, name in _direct_imports(runs[-1][1]):
+            print(f"    {cumulative / 1000:>7.1f} ms  {name}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,90 @@
+"""Size and encode time of /ws events per codec.
+
+    python tests/bench_ws_codec.py [events.ndjson]
+
+Reads a recorded event stream, one event per line: an export sink with
+"streams": ["events"] writes exactly that, plain /ws events work too.
+Without a file a synthetic stream of 5000 events is used. A snapshot
+(300 nodes, 8 chats x 100 messages) is measured separately.
+"""
+import json
+import sys
+import time
+from collections import defaultdict
+from pathlib import Path
+from typing import Any, Dict, Iterable, List
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
+sys.path.insert(0, str(Path(__file__).resolve().parent))
+
+from synthetic import make_event_stream, make_snapshot  # noqa: E402
+from ws_codec import get_codec  # noqa: E402
+
+CODECS = [("json", "none"), ("json", "deflate"), ("msgpack", "none"), ("msgpack", "deflate")]
+SNAPSHOT_ROUNDS = 20
+
+
+def load_events(path: str) -> List[Dict[str, Any]]:
+    events = []
+    with open(path, encoding="utf-8") as f:
+        for line in f:
+            if line.strip():
+                record = json.loads(line)
+                events.append(record["data"] if "stream" in record else record)
+    return events
+
+
+def measure(events: Iterable[Dict[str, Any]], rounds: int = 1) -> Dict[tuple, Dict[str, float]]:
+    """(format, compression) -> total bytes and encode seconds, per event type."""
+    events = list(events)
+    results: Dict[tuple, Dict[str, float]] = {}
+    for codec_key in CODECS:
+        codec = get_codec(*codec_key)
+        sizes: Dict[str, float] = defaultdict(float)
+        seconds: Dict[str, float] = defaultdict(float)
+        for event in events:
+            started = time.perf_counter()
+            for _ in range(rounds):
+                frame = codec.encode(event)
+            seconds[event["type"]] += (time.perf_counter() - started) / rounds
+            sizes[event["type"]] += len(frame.encode("utf-8") if isinstance(frame, str) else frame)
+        results[codec_key] = {"sizes": sizes, "seconds": seconds}
+    return results
+
+
+def _report(title: str, results: Dict[tuple, Dict[str, Any]], counts: Dict[str, int]):
+    print(title)
+    header = "".join(f"{f'{fmt}+{comp}' if comp != 'none' else fmt:>22}" for fmt, comp in CODECS)
+    print(f"{'event':<14}{'count':>7}{header}")
+    for kind in sorted(counts) + ["total"]:
+        cells = []
+        for codec_key in CODECS:
+            sizes, seconds = results[codec_key]["sizes"], results[codec_key]["seconds"]
+            if kind == "total":
+                size, secs, count = sum(sizes.values()), sum(seconds.values()), sum(counts.values())
+                cells.append(f"{size / 1024:>9.1f} KB {secs * 1000:>7.1f} ms")
+            else:
+                count = counts[kind]
+                cells.append(f"{sizes[kind] / count:>9.0f} B {seconds[kind] / count * 1e6:>7.1f} us")
+        print(f"{kind:<14}{counts.get(kind, sum(counts.values())):>7}" + "".join(f"{c:>22}" for c in cells))
+    print()
+
+
+def main():
+    events = load_events(sys.argv[1]) if len(sys.argv) > 1 else list(make_event_stream(5000))
+    counts: Dict[str, int] = defaultdict(int)
+    for event in events:
+        counts[event["type"]] += 1
+    source = sys.argv[1] if len(sys.argv) > 1 else "synthetic stream"
+    _report(f"Per event (average size and encode time), {source}:", measure(events), counts)
+
+    snapshot = make_snapshot()
+    _report(
+        f"Snapshot (300 nodes, 8 chats x 100 messages), average of {SNAPSHOT_ROUNDS} encodes:",
+        measure([snapshot], SNAPSHOT_ROUNDS),
+        {"snapshot": 1},
+    )
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,8 @@
+import os
+import sys
+import tempfile
+from pathlib import Path
+
+# Backend modules import each other by bare name, and read DATABASE_PATH on import
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
+os.environ["DATABASE_PATH"] = str(Path(tempfile.mkdtemp(prefix="meshradar-tests-")) / "meshtastic.db")
@@ -0,0 +1,113 @@
+"""Synthetic mesh data for the benchmarks, shaped like what meshtastic hands us."""
+import base64
+import random
+from typing import Any, Dict, Iterator
+
+HW_MODELS = ["TBEAM", "HELTEC_V3", "RAK4631", "T_ECHO", "TLORA_V2_1_1P6", "STATION_G2"]
+ROLES = ["CLIENT", "CLIENT_MUTE", "ROUTER", "TRACKER"]
+
+
+def node_id(i: int) -> str:
+    return f"!{0x10000000 + i:08x}"
+
+
+def make_node(i: int, rng: random.Random) -> Dict[str, Any]:
+    """An interface.nodes entry as meshtastic keeps it after the config download."""
+    return {
+        "num": 0x10000000 + i,
+        "user": {
+            "id": node_id(i),
+            "longName": f"Node {i} {rng.choice(['Base', 'Mobile', 'Hilltop', 'Car'])}",
+            "shortName": f"N{i % 1000:03d}",
+            "macaddr": base64.b64encode(rng.randbytes(6)).decode(),
+            "hwModel": rng.choice(HW_MODELS),
+            "publicKey": base64.b64encode(rng.randbytes(32)).decode(),
+            "role": rng.choice(ROLES),
+        },
+        "position": {
+            "latitudeI": 550000000 + rng.randrange(10**7),
+            "longitudeI": 370000000 + rng.randrange(10**7),
+            "altitude": rng.randrange(100, 300),
+            "time": 1700000000 + rng.randrange(10**6),
+            "latitude": 55 + rng.random(),
+            "longitude": 37 + rng.random(),
+            "locationSource": "LOC_INTERNAL",
+        },
+        "snr": rng.choice([-7.25, -2.5, 3.0, 5.25, 9.75]),
+        "lastHeard": 1700000000 + rng.randrange(10**6),
+        "deviceMetrics": {
+            "batteryLevel": rng.randrange(101),
+            "voltage": round(3.3 + rng.random(), 3),
+            "channelUtilization": round(rng.random() * 30, 2),
+            "airUtilTx": round(rng.random() * 5, 2),
+            "uptimeSeconds": rng.randrange(10**6),
+        },
+        "hopsAway": rng.randrange(4),
+        "isFavorite": False,
+    }
+
+
+def make_nodes(count: int, seed: int = 1) -> Dict[int, Dict[str, Any]]:
+    rng = random.Random(seed)
+    nodes = (make_node(i, rng) for i in range(count))
+    return {node["num"]: node for node in nodes}
+
+
+def make_message(i: int, rng: random.Random, node_count: int = 300) -> Dict[str, Any]:
+    """A stored message row as /api/messages returns it."""
+    rx_time_ms = 1700000000000 + i * 1000
+    return {
+        "id": i + 1,
+        "packet_id": rng.randrange(2**32),
+        "sender": node_id(rng.randrange(node_count)),
+        "receiver": None,
+        "channel": rng.randrange(8),
+        "text": " ".join(rng.choice(["hello", "mesh", "radio", "ok", "check", "copy", "test"]) for _ in range(rng.randrange(2, 12))),
+        "timestamp": "2023-11-14 22:13:20",
+        "ack_status": "received",
+        "is_outgoing": 0,
+        "reply_id": None,
+        "rx_time_ms": rx_time_ms,
+        "inserted_ms": rx_time_ms,
+    }
+
+
+def api_node(node: Dict[str, Any]) -> Dict[str, Any]:
+    """The /api/nodes and node_update shape of an interface.nodes entry."""
+    return {
+        "id": node["user"]["id"], "num": node["num"],
+        "user": {k: node["user"][k] for k in ("id", "longName", "shortName", "hwModel", "role")},
+        "position": {k: node["position"][k] for k in ("latitude", "longitude", "altitude", "time")},
+        "snr": node["snr"], "lastHeard": node["lastHeard"],
+        "deviceMetrics": node["deviceMetrics"], "isFavorite": False,
+    }
+
+
+def make_event_stream(count: int, node_count: int = 300, seed: int = 1) -> Iterator[Dict[str, Any]]:
+    """/ws events in roughly the mix a busy mesh produces."""
+    rng = random.Random(seed)
+    nodes = list(make_nodes(node_count, seed).values())
+    for i in range(count):
+        node = rng.choice(nodes)
+        kind = rng.random()
+        if kind < 0.25:
+            yield {"type": "message", "data": make_message(i, rng, node_count)}
+        elif kind < 0.55:
+            yield {"type": "node_update", "data": api_node(node)}
+        elif kind < 0.8:
+            yield {"type": "telemetry", "data": {
+                "from": node["user"]["id"], "device_metrics": node["deviceMetrics"], "environment_metrics": None,
+            }}
+        else:
+            position = node["position"]
+            yield {"type": "position", "data": {
+                "from": node["user"]["id"], "latitude": position["latitude"], "longitude": position["longitude"],
+                "altitude": position["altitude"], "time": position["time"],
+            }}
+
+
+def make_snapshot(node_count: int = 300, chats: int = 8, per_chat: int = 100, seed: int = 1) -> Dict[str, Any]:
+    rng = random.Random(seed)
+    nodes = [api_node(node) for node in make_nodes(node_count, seed).values()]
+    messages = {f"channel:{c}": [make_message(c * per_chat + i, rng, node_count) for i in range(per_chat)] for c in range(chats)}
+    return {"type": "snapshot", "data": {"status": {"connected": True}, "nodes": nodes, "channels": [], "messages": messages}}
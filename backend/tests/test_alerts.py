@@ -0,0 +1,66 @@
+import random
+import re
+import time
+
+from alerts import CompiledAlerts
+from schemas import AlertRule
+
+
+PATTERNS = [
+    r"(alarm\d|code\d)\s+\d+", "fire", "fire at dawn", r"(SOS|MAYDAY)", r"\d+\.\d+", r"(\w+) \1",
+    "ab?c", r"(?i:x)yz", r"foo(?=bar)", r"[abc]+xyz{2,}", r"(?P<word>help)+ me", r"s+o+s+", r"[0-9]{3}",
+]
+WORDS = ["node", "battery", "check", "copy", "weather", "route", "north", "signal", "hello", "moving", "camp"]
+
+
+def _rules(patterns, case_sensitive=False):
+    return [AlertRule(name=f"r{i}", regex=p, case_sensitive=case_sensitive) for i, p in enumerate(patterns)]
+
+
+def _matches(compiled: CompiledAlerts, text: str) -> dict:
+    return {alert["rule"]: alert["matches"] for alert in compiled.match(text, 0, None)}
+
+
+def test_overlapping_and_grouped_rules_all_fire():
+    compiled = CompiledAlerts(_rules(["fire", "fire at dawn", r"(SOS|MAYDAY)", r"\d+", r"(\w+) \1"]))
+    assert _matches(compiled, "Fire at dawn, MAYDAY 42 42") == {
+        "r0": ["Fire"],
+        "r1": ["Fire at dawn"],
+        "r2": ["MAYDAY"],
+        "r3": ["42"],
+        "r4": ["42 42"],
+    }
+
+
+def test_same_terms_as_each_rule_on_its_own():
+    rng = random.Random(3)
+    alphabet = list("abcfiorexyzSOMAYDhelpmtkK ſ.0123456789é") + ["fire ", "alarm1 ", "foobar", "help me ", "xyzz"]
+    for case_sensitive in (True, False):
+        compiled = CompiledAlerts(_rules(PATTERNS, case_sensitive))
+        flags = 0 if case_sensitive else re.IGNORECASE
+        for _ in range(3000):
+            text = "".join(rng.choice(alphabet) for _ in range(rng.randrange(1, 30)))
+            expected = {}
+            for i, pattern in enumerate(PATTERNS):
+                terms = {m.group() for m in re.finditer(pattern, text, flags) if m.group()}
+                if terms:
+                    expected[f"r{i}"] = terms
+            assert {rule: set(terms) for rule, terms in _matches(compiled, text).items()} == expected, text
+
+
+def _seconds_per_text(rule_count: int, text: str) -> float:
+    compiled = CompiledAlerts(_rules([rf"(alarm{i}|code{i})\s+\d+" for i in range(rule_count)]))
+    best = float("inf")
+    for _ in range(5):
+        started = time.perf_counter()
+        for _ in range(100):
+            compiled.match(text, 0, None)
+        best = min(best, (time.perf_counter() - started) / 100)
+    return best
+
+
+def test_cost_stays_flat_as_rules_are_added():
+    text = " ".join(random.Random(1).choice(WORDS) for _ in range(40))
+    few, many = _seconds_per_text(20, text), _seconds_per_text(1000, text)
+    # 50x the rules: the literals share one automaton pass, no regex runs on this text
+    assert many < few * 2, (few, many)
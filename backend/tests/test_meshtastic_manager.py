@@ -0,0 +1,23 @@
+import time
+from types import SimpleNamespace
+
+from meshtastic_manager import MeshtasticManager
+from synthetic import make_nodes, node_id
+
+
+def test_connection_event_loads_nodes_before_interface_is_assigned():
+    manager = MeshtasticManager()
+    nodes = make_nodes(20, seed=1)
+    now = time.time()
+    for i, node in enumerate(nodes.values()):
+        node["lastHeard"] = now - i
+    # An API connect: the event is queued during waitForConfig, before the constructor returns
+    interface = SimpleNamespace(nodes=nodes)
+    assert manager.interface is None
+
+    manager._dispatch("connection", interface)
+    manager.interface = interface
+
+    assert len(manager.get_nodes()) == 20
+    assert manager.node_store.get(node_id(7))["id"] == node_id(7)
+    assert {node for node, _ in manager.presence.active(3600)} == {node_id(i) for i in range(20)}
@@ -0,0 +1,51 @@
+import asyncio
+import tracemalloc
+
+import database as db
+from message_io import stream_export
+
+
+FORMATS = (("ndjson", False), ("csv", False), ("ndjson", True))
+
+
+async def _fill(start: int, count: int):
+    conn = await db.get_db()
+    await conn.executemany(
+        "INSERT INTO messages (packet_id, sender, receiver, channel, text, rx_time_ms) VALUES (?, ?, NULL, 0, ?, ?)",
+        [(i, "!00000001", f"message {i} " + "x" * 100, 1700000000000 + i) for i in range(start, start + count)],
+    )
+    await conn.commit()
+
+
+async def _export_peak(fmt: str, compress: bool) -> tuple:
+    """Bytes exported and tracemalloc peak while streaming the whole table."""
+    size = 0
+    tracemalloc.start()
+    try:
+        async for data in stream_export(db.iter_messages(channel=0), fmt, compress=compress):
+            size += len(data)
+        return size, tracemalloc.get_traced_memory()[1]
+    finally:
+        tracemalloc.stop()
+
+
+def test_export_memory_does_not_grow_with_history():
+    async def run():
+        await db.init_db()
+        try:
+            await _fill(0, 5000)
+            small = {args: await _export_peak(*args) for args in FORMATS}
+            await _fill(5000, 45000)
+            large = {args: await _export_peak(*args) for args in FORMATS}
+        finally:
+            await db.close_db()
+        for args in small:
+            small_size, small_peak = small[args]
+            large_size, large_peak = large[args]
+            assert large_size > 9 * small_size
+            # 10x the rows, same peak: only one chunk is held at a time
+            assert large_peak < small_peak * 1.5, (args, small_peak, large_peak)
+        # The 50k-row NDJSON export itself is ~18 MB
+        assert max(peak for _, peak in large.values()) < 4 * 1024 * 1024
+
+    asyncio.run(run())
@@ -0,0 +1,263 @@
+"""Mesh topology graph built from traceroutes and neighbor info.
+
+Vertices are node ids, directed edges are observed RF hops (transmitter ->
+receiver) with the SNR measured at the receiver. Edges fade with age and are
+dropped after settings.topology_edge_ttl, so the graph follows the mesh as it
+changes without new traceroutes.
+"""
+import heapq
+import math
+import threading
+import time
+from collections import deque
+from typing import Any, Dict, Iterable, List, Literal, Optional, Tuple
+
+from settings import settings
+
+PathMode = Literal["shortest", "reliable"]
+
+# Node numbers that stand for "unknown" in traceroute routes
+UNKNOWN_NODES = {0, 0xFFFFFFFF}
+# Traceroute SNR values are dB * 4, INT8_MIN means "not measured"
+SNR_UNKNOWN = -128
+# Link success estimate: logistic curve over SNR, 50% at SNR_MIDPOINT dB
+SNR_MIDPOINT = -10.0
+SNR_SCALE = 3.0
+# Path queries are cached until the graph changes shape or this many seconds pass
+PATH_CACHE_TTL = 30.0
+PATH_CACHE_SIZE = 256
+# SNR smoothing for repeated observations of the same hop
+SNR_ALPHA = 0.3
+
+
+def node_id(num: int) -> str:
+    return f"!{num:08x}"
+
+
+class Edge:
+    __slots__ = ("snr", "last_seen", "observations")
+
+    def __init__(self, snr: Optional[float], last_seen: float, observations: int = 1):
+        self.snr = snr
+        self.last_seen = last_seen
+        self.observations = observations
+
+    def reliability(self, now: float) -> float:
+        """Probability estimate that the hop still works: SNR quality times freshness."""
+        if self.snr is None:
+            quality = 0.5
+        else:
+            quality = 1 / (1 + math.exp(-(self.snr - SNR_MIDPOINT) / SNR_SCALE))
+        age = max(0.0, now - self.last_seen)
+        return quality * 0.5 ** (age / settings.topology_half_life)
+
+
+class TopologyGraph:
+    """Thread-safe: updated on the packet dispatcher thread, queried from the API."""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._edges: Dict[Tuple[str, str], Edge] = {}
+        self._out: Dict[str, Dict[str, Edge]] = {}
+        # Bumped when edges appear or disappear, invalidates cached paths
+        self.version = 0
+        self._path_cache: Dict[tuple, Tuple[float, int, Dict[str, Any]]] = {}
+        self._dirty: Dict[Tuple[str, str], Edge] = {}
+        self.cache_hits = 0
+        self.cache_misses = 0
+
+    def load(self, rows: Iterable[tuple]):
+        """Restore persisted edges (source, target, snr, last_seen, observations)."""
+        with self._lock:
+            for source, target, snr, last_seen, observations in rows:
+                self._set_edge(source, target, Edge(snr, last_seen, observations))
+            self.version += 1
+
+    def _set_edge(self, source: str, target: str, edge: Edge):
+        self._edges[(source, target)] = edge
+        self._out.setdefault(source, {})[target] = edge
+
+    def observe(self, source: str, target: str, snr: Optional[float], now: Optional[float] = None):
+        now = now or time.time()
+        with self._lock:
+            edge = self._edges.get((source, target))
+            if edge is None:
+                edge = Edge(snr, now)
+                self._set_edge(source, target, edge)
+                self.version += 1
+            else:
+                if snr is not None:
+                    edge.snr = snr if edge.snr is None else edge.snr + SNR_ALPHA * (snr - edge.snr)
+                edge.last_seen = now
+                edge.observations += 1
+            self._dirty[(source, target)] = edge
+
+    def add_route(self, hops: List[str], snrs: List[Any], now: Optional[float] = None):
+        """Record consecutive hops of a traceroute leg. snrs[i] is measured at hops[i + 1]."""
+        for i in range(len(hops) - 1):
+            raw = snrs[i] if i < len(snrs) else SNR_UNKNOWN
+            snr = None if raw is None or raw == SNR_UNKNOWN else raw / 4
+            self.observe(hops[i], hops[i + 1], snr, now)
+
+    def add_traceroute(
+        self,
+        origin: int,
+        dest: int,
+        route: List[int],
+        snr_towards: List[Any],
+        route_back: List[int],
+        snr_back: List[Any],
+    ):
+        """Both legs of a traceroute reply; a leg with unknown relays is skipped as a whole."""
+        now = time.time()
+        forward = [origin, *route, dest]
+        if not UNKNOWN_NODES & set(forward):
+            self.add_route([node_id(n) for n in forward], snr_towards, now)
+        # route_back is only filled in when the reply actually carried it
+        if snr_back:
+            back = [dest, *route_back, origin]
+            if not UNKNOWN_NODES & set(back):
+                self.add_route([node_id(n) for n in back], snr_back, now)
+
+    def add_neighbors(self, node: int, neighbors: List[Dict[str, Any]]):
+        """NEIGHBORINFO_APP: `node` heard each neighbor with the given SNR."""
+        now = time.time()
+        receiver = node_id(node)
+        for neighbor in neighbors:
+            num = neighbor.get("nodeId")
+            if not num or num in UNKNOWN_NODES:
+                continue
+            self.observe(node_id(num), receiver, neighbor.get("snr"), now)
+
+    def prune(self, now: Optional[float] = None) -> int:
+        """Drop edges not seen for settings.topology_edge_ttl seconds."""
+        cutoff = (now or time.time()) - settings.topology_edge_ttl
+        with self._lock:
+            stale = [key for key, edge in self._edges.items() if edge.last_seen < cutoff]
+            for source, target in stale:
+                del self._edges[(source, target)]
+                out = self._out[source]
+                del out[target]
+                if not out:
+                    del self._out[source]
+                self._dirty.pop((source, target), None)
+            if stale:
+                self.version += 1
+        return len(stale)
+
+    def take_dirty(self) -> List[tuple]:
+        """Edges changed since the last call, as rows for persistence."""
+        with self._lock:
+            dirty, self._dirty = self._dirty, {}
+        return [
+            (source, target, edge.snr, edge.last_seen, edge.observations)
+            for (source, target), edge in dirty.items()
+        ]
+
+    def snapshot(self) -> Dict[str, Any]:
+        now = time.time()
+        with self._lock:
+            edges = [
+                {
+                    "source": source,
+                    "target": target,
+                    "snr": edge.snr,
+                    "last_seen": edge.last_seen,
+                    "observations": edge.observations,
+                    "reliability": round(edge.reliability(now), 4),
+                }
+                for (source, target), edge in self._edges.items()
+            ]
+        nodes = sorted({e["source"] for e in edges} | {e["target"] for e in edges})
+        return {"nodes": nodes, "edges": edges, "version": self.version}
+
+    def find_path(self, source: str, target: str, mode: PathMode = "shortest") -> Dict[str, Any]:
+        key = (source, target, mode)
+        now = time.monotonic()
+        cached = self._path_cache.get(key)
+        if cached and cached[1] == self.version and now - cached[0] < PATH_CACHE_TTL:
+            self.cache_hits += 1
+            return cached[2]
+
+        self.cache_misses += 1
+        with self._lock:
+            if mode == "reliable":
+                path = self._most_reliable(source, target)
+            else:
+                path = self._shortest(source, target)
+            result = self._describe(path)
+            version = self.version
+
+        if len(self._path_cache) >= PATH_CACHE_SIZE:
+            self._path_cache.clear()
+        self._path_cache[key] = (now, version, result)
+        return result
+
+    def _shortest(self, source: str, target: str) -> Optional[List[str]]:
+        """Fewest hops (BFS)."""
+        previous: Dict[str, Optional[str]] = {source: None}
+        queue = deque([source])
+        while queue:
+            node = queue.popleft()
+            if node == target:
+                return self._unwind(previous, target)
+            for neighbor in self._out.get(node, {}):
+                if neighbor not in previous:
+                    previous[neighbor] = node
+                    queue.append(neighbor)
+        return None
+
+    def _most_reliable(self, source: str, target: str) -> Optional[List[str]]:
+        """Highest product of hop reliabilities (Dijkstra over -log p)."""
+        now = time.time()
+        best = {source: 0.0}
+        previous: Dict[str, Optional[str]] = {source: None}
+        heap = [(0.0, source)]
+        while heap:
+            cost, node = heapq.heappop(heap)
+            if node == target:
+                return self._unwind(previous, target)
+            if cost > best[node]:
+                continue
+            for neighbor, edge in self._out.get(node, {}).items():
+                p = edge.reliability(now)
+                if p <= 0:
+                    continue
+                candidate = cost - math.log(p)
+                if candidate < best.get(neighbor, math.inf):
+                    best[neighbor] = candidate
+                    previous[neighbor] = node
+                    heapq.heappush(heap, (candidate, neighbor))
+        return None
+
+    @staticmethod
+    def _unwind(previous: Dict[str, Optional[str]], target: str) -> List[str]:
+        path = [target]
+        while previous[path[-1]] is not None:
+            path.append(previous[path[-1]])
+        return path[::-1]
+
+    def _describe(self, path: Optional[List[str]]) -> Dict[str, Any]:
+        if path is None:
+            return {"path": None, "hops": None, "reliability": 0.0, "snr": []}
+        now = time.time()
+        reliability = 1.0
+        snrs = []
+        for hop in zip(path, path[1:]):
+            edge = self._edges[hop]
+            reliability *= edge.reliability(now)
+            snrs.append(edge.snr)
+        return {
+            "path": path,
+            "hops": len(path) - 1,
+            "reliability": round(reliability, 4),
+            "snr": snrs,
+        }
+
+    def get_stats(self) -> Dict[str, Any]:
+        return {
+            "edges": len(self._edges),
+            "version": self.version,
+            "path_cache_hits": self.cache_hits,
+            "path_cache_misses": self.cache_misses,
+        }
@@ -1,32 +1,164 @@
-from fastapi import WebSocket
-from typing import Dict, Any, Set
-import json
+from typing import Dict, Any, Set, Union, Optional, Deque, Tuple, Callable, List, TYPE_CHECKING
+from collections import deque
 import asyncio
+import json
 import logging
+import secrets
+
+from ws_codec import WSCodec, JSON_CODEC
+from ws_subscriptions import SubscriptionIndex, parse_selection
+from settings import settings
+
+if TYPE_CHECKING:
+    # Only annotations need it, headless modes never load the web stack
+    from fastapi import WebSocket
 
 logger = logging.getLogger(__name__)
 
 
 class WebSocketManager:
     def __init__(self):
-        self.connections: list[WebSocket] = []
+        self.connections: list["WebSocket"] = []
+        self._codecs: Dict["WebSocket", WSCodec] = {}
+        self.subscriptions = SubscriptionIndex()
+        # Clients without subscription filters receive every event
+        self._unfiltered: Set["WebSocket"] = set()
         self._loop: asyncio.AbstractEventLoop | None = None
         self._pending_futures: Set[asyncio.Future] = set()
 
-    async def connect(self, websocket: WebSocket):
+        # Ring of recent events for resumable streams. Sequence numbers only
+        # make sense within one epoch, a new epoch starts with every restart.
+        self.epoch = secrets.token_hex(8)
+        self.seq = 0
+        self._log: Deque[Tuple[int, Dict[str, Any]]] = deque(maxlen=settings.event_log_size)
+        # Called with every recorded event, e.g. to publish it on the event bus
+        self._listeners: List[Callable[[Dict[str, Any]], None]] = []
+
+    def add_listener(self, listener: Callable[[Dict[str, Any]], None]):
+        self._listeners.append(listener)
+
+    def adopt_epoch(self, epoch: str, seq: int):
+        """Continue the radio owner's event sequence (worker processes)"""
+        if epoch != self.epoch:
+            self.epoch = epoch
+            self._log.clear()
+        self.seq = seq
+
+    async def connect(self, websocket: "WebSocket", codec: WSCodec = JSON_CODEC):
+        """Accept the socket. It joins broadcasts only once activate() is called."""
         await websocket.accept()
+        self._codecs[websocket] = codec
+        if codec is not JSON_CODEC:
+            await websocket.send_json(codec.hello())
+        await self.send(websocket, {"type": "hello", "data": {"epoch": self.epoch, "seq": self.seq}})
+
+    def can_resume(self, epoch: Optional[str], last_seq: int) -> bool:
+        """Whether every event after last_seq is still in the log"""
+        if epoch != self.epoch or last_seq > self.seq:
+            return False
+        oldest = self._log[0][0] if self._log else self.seq + 1
+        return last_seq >= oldest - 1
+
+    async def activate(self, websocket: "WebSocket", since_seq: Optional[int] = None):
+        """Replay events after since_seq, then start receiving live broadcasts"""
+        while since_seq is not None and since_seq < self.seq:
+            missed = [message for seq, message in self._log if seq > since_seq]
+            if not missed:
+                break
+            filters = self.subscriptions.get(websocket)
+            for message in missed:
+                # Replays respect subscriptions like live events do
+                if filters is None or websocket in self.subscriptions.match(message):
+                    await self.send(websocket, message)
+            since_seq = missed[-1]["seq"]
+        # No await between the last catch-up check and joining, so nothing is missed
         self.connections.append(websocket)
+        self._unfiltered.add(websocket)
 
-    def disconnect(self, websocket: WebSocket):
+    def disconnect(self, websocket: "WebSocket"):
         if websocket in self.connections:
             self.connections.remove(websocket)
+        self._codecs.pop(websocket, None)
+        self._unfiltered.discard(websocket)
+        self.subscriptions.reset(websocket)
+
+    @staticmethod
+    async def _send_frame(websocket: "WebSocket", frame: Union[str, bytes]):
+        if isinstance(frame, bytes):
+            await websocket.send_bytes(frame)
+        else:
+            await websocket.send_text(frame)
+
+    async def send(self, websocket: "WebSocket", message: Dict[str, Any]):
+        """Send a single event to one client using its negotiated codec"""
+        codec = self._codecs.get(websocket, JSON_CODEC)
+        await self._send_frame(websocket, codec.encode(message))
+
+    async def handle_command(self, websocket: "WebSocket", raw: str):
+        """Apply a subscribe / unsubscribe / reset command sent by a client"""
+        try:
+            command = json.loads(raw)
+        except ValueError:
+            return
+        if not isinstance(command, dict):
+            return
+
+        try:
+            selection = parse_selection(command)
+        except ValueError as e:
+            # Rejected as a whole, the current filters stay in place
+            filters = self.subscriptions.get(websocket)
+            await self.send(websocket, {"type": "subscription", "data": {**(filters or {}), "error": str(e)}})
+            return
+        action = command.get("action")
+        if action == "subscribe":
+            self.subscriptions.subscribe(websocket, selection)
+        elif action == "unsubscribe":
+            self.subscriptions.unsubscribe(websocket, selection)
+        elif action == "reset":
+            self.subscriptions.reset(websocket)
+        else:
+            return
+
+        filters = self.subscriptions.get(websocket)
+        if filters is None:
+            self._unfiltered.add(websocket)
+        else:
+            self._unfiltered.discard(websocket)
+        await self.send(websocket, {"type": "subscription", "data": filters or {}})
+
+    def _targets(self, message: Dict[str, Any]) -> Set["WebSocket"]:
+        if not self.subscriptions.has_filters:
+            return set(self.connections)
+        return self._unfiltered | self.subscriptions.match(message)
+
+    def _record(self, message: Dict[str, Any]) -> Dict[str, Any]:
+        if "seq" not in message:
+            self.seq += 1
+            message = {**message, "seq": self.seq}
+        else:
+            # Sequenced upstream by the radio owner
+            self.seq = max(self.seq, message["seq"])
+        self._log.append((message["seq"], message))
+        for listener in self._listeners:
+            try:
+                listener(message)
+            except Exception as e:
+                logger.error(f"Event listener failed: {e}")
+        return message
 
     async def broadcast(self, message: Dict[str, Any]):
-        data = json.dumps(message, default=str)
+        message = self._record(message)
+        # Encode once per codec in use rather than once per client
+        frames: Dict[WSCodec, Union[str, bytes]] = {}
         disconnected = []
-        for conn in self.connections:
+        for conn in self._targets(message):
+            codec = self._codecs.get(conn, JSON_CODEC)
+            frame = frames.get(codec)
+            if frame is None:
+                frame = frames[codec] = codec.encode(message)
             try:
-                await conn.send_text(data)
+                await self._send_frame(conn, frame)
             except Exception:
                 disconnected.append(conn)
         for conn in disconnected:
@@ -0,0 +1,129 @@
+import json
+import zlib
+from typing import Any, Dict, Literal, Union
+
+import msgpack
+
+WSFormat = Literal["json", "msgpack"]
+WSCompression = Literal["none", "deflate"]
+
+# Long field names that repeat in every event, mapped to short keys for
+# MessagePack framing. Values must stay unique and must not clash with any
+# key that is left unmapped. Sent to msgpack clients in the "codec" frame.
+# Only the envelope, the keys of `data` and the keys of the NESTED_OBJECTS
+# inside it are mapped; anything deeper (packet payloads, configs) is sent
+# as is, so arbitrary keys there can't be renamed by accident.
+SHORT_KEYS: Dict[str, str] = {
+    "type": "t",
+    "data": "d",
+    "packet_id": "pi",
+    "request_id": "rq",
+    "sender": "s",
+    "receiver": "r",
+    "channel": "c",
+    "text": "x",
+    "timestamp": "ts",
+    "reply_id": "ri",
+    "hop_limit": "hl",
+    "snr": "sr",
+    "from": "fr",
+    "user": "u",
+    "longName": "ln",
+    "shortName": "sn",
+    "hwModel": "hw",
+    "role": "rl",
+    "publicKey": "pk",
+    "macaddr": "mac",
+    "position": "p",
+    "latitude": "la",
+    "longitude": "lo",
+    "altitude": "al",
+    "latitudeI": "lai",
+    "longitudeI": "loi",
+    "time": "tm",
+    "locationSource": "ls",
+    "deviceMetrics": "dm",
+    "device_metrics": "dms",
+    "environment_metrics": "ems",
+    "batteryLevel": "bl",
+    "voltage": "v",
+    "channelUtilization": "cu",
+    "airUtilTx": "au",
+    "uptimeSeconds": "us",
+    "lastHeard": "lh",
+    "isFavorite": "fv",
+    "hopsAway": "ha",
+    "route": "rt",
+    "route_back": "rb",
+    "snr_towards": "st",
+    "snr_back": "sb",
+    "status": "ss",
+    "error": "e",
+    "connected": "cn",
+}
+
+
+# Fields of `data` holding known objects (node user / position / metrics)
+NESTED_OBJECTS = frozenset({"user", "position", "deviceMetrics", "device_metrics", "environment_metrics"})
+
+
+def _shorten(obj: Dict[str, Any]) -> Dict[str, Any]:
+    return {SHORT_KEYS.get(k, k): v for k, v in obj.items()}
+
+
+def shorten_keys(message: Dict[str, Any]) -> Dict[str, Any]:
+    """Short keys for the envelope, `data` and its NESTED_OBJECTS only."""
+    message = _shorten(message)
+    data = message.get("d")
+    if isinstance(data, dict):
+        message["d"] = {
+            SHORT_KEYS.get(k, k): _shorten(v) if k in NESTED_OBJECTS and isinstance(v, dict) else v
+            for k, v in data.items()
+        }
+    return message
+
+
+class WSCodec:
+    """Encodes events for one (format, compression) combination.
+
+    Broadcasts encode each event once per codec in use, not once per client.
+    """
+
+    def __init__(self, format: WSFormat = "json", compression: WSCompression = "none"):
+        self.format = format
+        self.compression = compression
+        self.binary = format == "msgpack" or compression != "none"
+
+    def encode(self, message: Dict[str, Any]) -> Union[str, bytes]:
+        if self.format == "msgpack":
+            data = msgpack.packb(shorten_keys(message), default=str)
+        else:
+            text = json.dumps(message, default=str)
+            if self.compression == "none":
+                return text
+            data = text.encode("utf-8")
+        if self.compression == "deflate":
+            # Raw deflate, decodable in browsers with DecompressionStream("deflate-raw")
+            compressor = zlib.compressobj(6, zlib.DEFLATED, -15)
+            data = compressor.compress(data) + compressor.flush()
+        return data
+
+    def hello(self) -> Dict[str, Any]:
+        data: Dict[str, Any] = {"format": self.format, "compression": self.compression}
+        if self.format == "msgpack":
+            data["keys"] = SHORT_KEYS
+            data["nested"] = sorted(NESTED_OBJECTS)
+        return {"type": "codec", "data": data}
+
+
+_codecs: Dict[tuple, WSCodec] = {}
+
+
+def get_codec(format: WSFormat = "json", compression: WSCompression = "none") -> WSCodec:
+    key = (format, compression)
+    if key not in _codecs:
+        _codecs[key] = WSCodec(format, compression)
+    return _codecs[key]
+
+
+JSON_CODEC = get_codec()
@@ -0,0 +1,138 @@
+from typing import Any, Dict, Hashable, Iterable, List, Optional, Set
+
+# Subscription dimensions a client can filter on
+DIMENSIONS = ("types", "channels", "dm_partners", "nodes")
+
+
+def _channel(value: Any) -> int:
+    # bool is an int subclass, but true/false is not a channel
+    if isinstance(value, int) and not isinstance(value, bool):
+        return value
+    if isinstance(value, float) and value.is_integer():
+        return int(value)
+    if isinstance(value, str):
+        try:
+            return int(value.strip())
+        except ValueError:
+            pass
+    raise ValueError(f"Invalid channel: {value!r}")
+
+
+def parse_selection(command: Dict[str, Any]) -> Dict[str, List[Any]]:
+    """Filter values per dimension from a subscribe / unsubscribe command.
+
+    Events carry channels as ints, so channels are converted ("0" -> 0);
+    a channel that isn't a number raises ValueError.
+    """
+    selection: Dict[str, List[Any]] = {}
+    for dim in DIMENSIONS:
+        values = command.get(dim)
+        if not isinstance(values, list):
+            continue
+        if dim == "channels":
+            selection[dim] = [_channel(v) for v in values]
+        else:
+            selection[dim] = [v for v in values if isinstance(v, (str, int))]
+    return selection
+
+
+def event_keys(message: Dict[str, Any]) -> Dict[str, Any]:
+    """Routing attributes of an event, one value per dimension it carries.
+
+    A dimension an event doesn't carry never filters that event out, e.g. a
+    channel subscription doesn't hide node updates unless types are filtered too.
+    """
+    keys: Dict[str, Any] = {"types": message.get("type")}
+    data = message.get("data")
+    if not isinstance(data, dict):
+        return keys
+
+    if message.get("type") == "message":
+        receiver = data.get("receiver")
+        if receiver and receiver != "^all":
+            keys["dm_partners"] = data.get("sender")
+        else:
+            keys["channels"] = data.get("channel", 0)
+
+    node = data.get("sender") or data.get("from") or data.get("id")
+    if node:
+        keys["nodes"] = node
+    return keys
+
+
+class SubscriptionIndex:
+    """Inverted index from (dimension, value) to subscribed clients.
+
+    Clients without any filter receive everything and are kept in a separate
+    set, so routing only touches the index entries of an event's own values.
+    """
+
+    def __init__(self):
+        self._filters: Dict[Hashable, Dict[str, Set[Any]]] = {}
+        self._index: Dict[str, Dict[Any, Set[Hashable]]] = {dim: {} for dim in DIMENSIONS}
+        # Filtered clients that don't constrain a given dimension
+        self._open: Dict[str, Set[Hashable]] = {dim: set() for dim in DIMENSIONS}
+
+    @property
+    def has_filters(self) -> bool:
+        return bool(self._filters)
+
+    def get(self, client: Hashable) -> Optional[Dict[str, List[Any]]]:
+        filters = self._filters.get(client)
+        if filters is None:
+            return None
+        return {dim: sorted(values, key=str) for dim, values in filters.items()}
+
+    def _remove_from_index(self, client: Hashable):
+        filters = self._filters.pop(client, None)
+        if filters is None:
+            return
+        for dim in DIMENSIONS:
+            self._open[dim].discard(client)
+            for value in filters.get(dim, ()):
+                clients = self._index[dim].get(value)
+                if clients is not None:
+                    clients.discard(client)
+                    if not clients:
+                        del self._index[dim][value]
+
+    def _add_to_index(self, client: Hashable, filters: Dict[str, Set[Any]]):
+        if not filters:
+            return
+        self._filters[client] = filters
+        for dim in DIMENSIONS:
+            if dim not in filters:
+                self._open[dim].add(client)
+                continue
+            for value in filters[dim]:
+                self._index[dim].setdefault(value, set()).add(client)
+
+    def subscribe(self, client: Hashable, selection: Dict[str, Iterable[Any]]):
+        filters = {dim: set(values) for dim, values in self._filters.get(client, {}).items()}
+        for dim in DIMENSIONS:
+            if selection.get(dim) is not None:
+                filters.setdefault(dim, set()).update(selection[dim])
+        self._remove_from_index(client)
+        self._add_to_index(client, filters)
+
+    def unsubscribe(self, client: Hashable, selection: Dict[str, Iterable[Any]]):
+        filters = {dim: set(values) for dim, values in self._filters.get(client, {}).items()}
+        for dim in DIMENSIONS:
+            if selection.get(dim) is not None and dim in filters:
+                # An emptied dimension matches nothing; use reset to receive everything again
+                filters[dim].difference_update(selection[dim])
+        self._remove_from_index(client)
+        self._add_to_index(client, filters)
+
+    def reset(self, client: Hashable):
+        self._remove_from_index(client)
+
+    def match(self, message: Dict[str, Any]) -> Set[Hashable]:
+        """Filtered clients that should receive the event."""
+        result: Optional[Set[Hashable]] = None
+        for dim, value in event_keys(message).items():
+            matched = self._open[dim] | self._index[dim].get(value, set())
+            result = matched if result is None else result & matched
+            if not result:
+                return set()
+        return result or set()
@@ -1,5 +1,13 @@
 #!/bin/sh
 
-uvicorn main:app --host 0.0.0.0 --port 8000 &
+WORKERS=${WORKERS:-1}
+
+if [ "$WORKERS" -gt 1 ]; then
+    # One process owns the radio, uvicorn workers reach it over the event bus
+    python main.py radio &
+    PROCESS_ROLE=worker uvicorn main:app --host 0.0.0.0 --port 8000 --workers "$WORKERS" &
+else
+    uvicorn main:app --host 0.0.0.0 --port 8000 &
+fi
 
 exec nginx -g 'daemon off;'
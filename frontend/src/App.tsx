@@ -5,6 +5,7 @@ import { NodeInfoPanel } from '@/components/NodeInfoPanel'
 import { useWebSocket } from '@/hooks/useWebSocket'
 import { useMeshStore } from '@/store'
 import { useTitleNotifications } from '@/hooks/useTitleNotifications'
+import { useConversations } from '@/hooks/useApi'
 
 const queryClient = new QueryClient({
   defaultOptions: {
@@ -18,6 +19,7 @@ const queryClient = new QueryClient({
 function AppContent() {
   useWebSocket()
   useTitleNotifications()
+  useConversations()
   const selectedNode = useMeshStore((s) => s.selectedNode)
   const isNetworkMapOpen = useMeshStore((s) => s.isNetworkMapOpen)
 
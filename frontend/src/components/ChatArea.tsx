@@ -8,7 +8,7 @@ import { MessageBubble } from './MessageBubble'
 import { ChatTabs } from './ChatTabs'
 import { DateDivider } from './DateDivider'
 import { useMeshStore } from '@/store'
-import { useSendMessage, useMessages } from '@/hooks/useApi'
+import { useSendMessage, useMessages, markConversationRead } from '@/hooks/useApi'
 import { cn } from '@/lib/utils'
 import { isSameDay } from 'date-fns'
 import type { Message } from '@/types'
@@ -80,6 +80,7 @@ export function ChatArea() {
     if (!chatKey || !isPageActive) return
 
     resetUnreadForChat(chatKey)
+    markConversationRead(chatKey)
   }, [chatKey, isPageActive, resetUnreadForChat])
 
   // Filter messages for current chat
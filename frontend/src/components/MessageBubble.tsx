@@ -18,9 +18,9 @@ export function MessageBubble({ message, onReply, isGroupStart = true, isGroupEn
   const isOutgoing = message.is_outgoing || message.sender === status.my_node_id
   const senderNode = nodes.find((n) => n.id === message.sender)
 
-  // Find message being replied to
+  // Find message being replied to; the server embeds it when it's off the loaded page
   const repliedMessage = message.reply_id
-    ? messages.find(m => m.packet_id === message.reply_id || m.id === message.reply_id)
+    ? messages.find(m => m.packet_id === message.reply_id || m.id === message.reply_id) ?? message.reply_to
     : null
 
   const repliedSenderNode = repliedMessage
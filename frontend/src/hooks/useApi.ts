@@ -1,7 +1,7 @@
-import { useQuery, useMutation, useQueryClient } from '@tanstack/react-query'
+import { useQuery, useMutation, useQueryClient, type QueryClient } from '@tanstack/react-query'
 import { useEffect } from 'react'
 import { useMeshStore } from '@/store'
-import type { Node, Channel, Message } from '@/types'
+import type { Node, Channel, Message, Conversation } from '@/types'
 
 const API_BASE = '/api'
 
@@ -17,13 +17,32 @@ async function fetchApi<T>(endpoint: string, options?: RequestInit): Promise<T>
   return res.json()
 }
 
+// Identifies this browser for server-side read markers
+const CLIENT_ID_KEY = 'meshradar-client-id'
+
+function getClientId(): string {
+  let id = localStorage.getItem(CLIENT_ID_KEY)
+  if (!id) {
+    // crypto.randomUUID needs a secure context, the UI is often opened over plain http on the LAN
+    id = Math.random().toString(36).slice(2) + Date.now().toString(36)
+    localStorage.setItem(CLIENT_ID_KEY, id)
+  }
+  return id
+}
+
+// Seeded from the WebSocket snapshot, so don't refetch right after it arrives
+const SNAPSHOT_STALE_TIME = 10000
+
 export function useNodes() {
   const setNodes = useMeshStore((s) => s.setNodes)
+  const snapshotReady = useMeshStore((s) => s.snapshotReady)
 
   const query = useQuery({
     queryKey: ['nodes'],
     queryFn: () => fetchApi<Node[]>('/nodes'),
     refetchInterval: 30000,
+    staleTime: SNAPSHOT_STALE_TIME,
+    enabled: snapshotReady,
   })
 
   useEffect(() => {
@@ -37,10 +56,13 @@ export function useNodes() {
 
 export function useChannels() {
   const setChannels = useMeshStore((s) => s.setChannels)
+  const snapshotReady = useMeshStore((s) => s.snapshotReady)
 
   const query = useQuery({
     queryKey: ['channels'],
     queryFn: () => fetchApi<Channel[]>('/channels'),
+    staleTime: SNAPSHOT_STALE_TIME,
+    enabled: snapshotReady,
   })
 
   useEffect(() => {
@@ -52,18 +74,40 @@ export function useChannels() {
   return query
 }
 
+export function messagesQueryKey(channel?: number, dmPartner?: string) {
+  return ['messages', channel, dmPartner]
+}
+
+// Pages stay cached while fresh, so live messages and acks go into them too:
+// reopening a chat must not bring back a page without them
+export function addCachedMessage(queryClient: QueryClient, queryKey: unknown[], message: Message) {
+  queryClient.setQueryData<Message[]>(queryKey, (old) =>
+    old && !old.some((m) => m.packet_id === message.packet_id) ? [...old, message] : old
+  )
+}
+
+export function updateCachedAck(queryClient: QueryClient, packetId: number, status: Message['ack_status']) {
+  queryClient.setQueriesData<Message[]>({ queryKey: ['messages'] }, (old) =>
+    old?.some((m) => m.packet_id === packetId)
+      ? old.map((m) => (m.packet_id === packetId ? { ...m, ack_status: status } : m))
+      : old
+  )
+}
+
 export function useMessages(channel?: number, dmPartner?: string) {
   const setMessages = useMeshStore((s) => s.setMessages)
 
   const query = useQuery({
-    queryKey: ['messages', channel, dmPartner],
+    queryKey: messagesQueryKey(channel, dmPartner),
     queryFn: async () => {
       const params = new URLSearchParams()
       if (typeof channel === 'number') params.set('channel', channel.toString())
       if (dmPartner) params.set('dm_partner', dmPartner)
+      params.set('parents', 'true')
 
       return fetchApi<Message[]>(`/messages?${params}`)
     },
+    staleTime: SNAPSHOT_STALE_TIME,
     enabled: typeof channel === 'number' || !!dmPartner,
   })
 
@@ -76,6 +120,41 @@ export function useMessages(channel?: number, dmPartner?: string) {
   return query
 }
 
+// Unread counters survive page reloads: they are kept per client on the server
+export function useConversations() {
+  const setUnreadPerChat = useMeshStore((s) => s.setUnreadPerChat)
+  const snapshotReady = useMeshStore((s) => s.snapshotReady)
+
+  const query = useQuery({
+    queryKey: ['conversations'],
+    queryFn: () =>
+      fetchApi<Conversation[]>(`/conversations?client_id=${encodeURIComponent(getClientId())}`),
+    enabled: snapshotReady,
+    staleTime: Infinity,
+  })
+
+  useEffect(() => {
+    if (query.data) {
+      const counts: Record<string, number> = {}
+      for (const conversation of query.data) {
+        if (conversation.unread > 0) counts[conversation.key] = conversation.unread
+      }
+      setUnreadPerChat(counts)
+    }
+  }, [query.data, setUnreadPerChat])
+
+  return query
+}
+
+export function markConversationRead(chatKey: string) {
+  fetchApi(
+    `/conversations/${encodeURIComponent(chatKey)}/read?client_id=${encodeURIComponent(getClientId())}`,
+    { method: 'POST' }
+  ).catch(() => {
+    // No messages stored for this chat yet
+  })
+}
+
 export function useConfig() {
   return useQuery({
     queryKey: ['config'],
@@ -108,6 +187,7 @@ export function useDisconnect() {
 }
 
 export function useSendMessage() {
+  const queryClient = useQueryClient()
   const addMessage = useMeshStore((s) => s.addMessage)
   const status = useMeshStore((s) => s.status)
 
@@ -123,7 +203,7 @@ export function useSendMessage() {
         body: JSON.stringify(data),
       })
 
-      addMessage({
+      const message: Message = {
         id: res.packet_id,
         packet_id: res.packet_id,
         sender: status.my_node_id || 'local',
@@ -134,7 +214,15 @@ export function useSendMessage() {
         ack_status: 'pending',
         is_outgoing: true,
         reply_id: data.reply_id,
-      })
+      }
+      addMessage(message)
+      addCachedMessage(
+        queryClient,
+        data.destination_id
+          ? messagesQueryKey(undefined, data.destination_id)
+          : messagesQueryKey(message.channel, undefined),
+        message
+      )
 
       return res
     },
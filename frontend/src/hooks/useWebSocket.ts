@@ -1,14 +1,35 @@
 import { useEffect, useRef } from 'react'
+import { useQueryClient } from '@tanstack/react-query'
 import { useMeshStore } from '@/store'
-import type { Message, Node, ConnectionStatus, TracerouteResult } from '@/types'
+import { markConversationRead, messagesQueryKey, addCachedMessage, updateCachedAck } from '@/hooks/useApi'
+import type { Message, Node, ConnectionStatus, TracerouteResult, Snapshot, Alert, PresenceEvent } from '@/types'
 
 const NOTIFICATION_SOUND = 'data:audio/wav;base64,UklGRnoGAABXQVZFZm10IBAAAAABAAEAQB8AAEAfAAABAAgAZGF0YQoGAACBhYqFbF1fdJivrJBhNjVgodDbq2EcBj+a2teleQ0bXpPT5LyNMx06hbnU2JBFKTE5fLTIxoM/NTU7e7PEwHs2NS89fLPCu3U1Nz0+frLBt3E2OT5Bf7K/tG84O0BBgbK9sW05PEFDg7K7rmw6PUJFQ4Owuqtq'
 
+// Fall back to REST loading if the snapshot doesn't arrive in time
+const SNAPSHOT_TIMEOUT = 3000
+
+const supportsGzip = typeof DecompressionStream !== 'undefined'
+
+async function decodeFrame(data: string | Blob) {
+  if (typeof data === 'string') return JSON.parse(data)
+  // Binary frames carry gzip-compressed JSON (the initial snapshot)
+  const stream = data.stream().pipeThrough(new DecompressionStream('gzip'))
+  return JSON.parse(await new Response(stream).text())
+}
+
 export function useWebSocket() {
+  const queryClient = useQueryClient()
   const wsRef = useRef<WebSocket | null>(null)
   const reconnectRef = useRef<ReturnType<typeof setTimeout>>()
   const reconnectAttempts = useRef(0)
   const audioRef = useRef<HTMLAudioElement | null>(null)
+  const snapshotTimeoutRef = useRef<ReturnType<typeof setTimeout>>()
+  // Frames are decoded asynchronously, chain them to keep their order
+  const frameQueueRef = useRef<Promise<void>>(Promise.resolve())
+  // Position in the server event log, used to resume after a reconnect
+  const epochRef = useRef<string>()
+  const lastSeqRef = useRef<number>()
 
   // Use refs to avoid stale closures
   const storeRef = useRef(useMeshStore.getState())
@@ -31,7 +52,17 @@ export function useWebSocket() {
     if (wsRef.current?.readyState === WebSocket.OPEN) return
 
     const protocol = window.location.protocol === 'https:' ? 'wss:' : 'ws:'
-    const ws = new WebSocket(`${protocol}//${window.location.host}/ws`)
+    const params = new URLSearchParams({ snapshot: supportsGzip ? 'gzip' : 'json' })
+    if (epochRef.current && lastSeqRef.current !== undefined) {
+      params.set('epoch', epochRef.current)
+      params.set('last_seq', lastSeqRef.current.toString())
+    }
+    const ws = new WebSocket(`${protocol}//${window.location.host}/ws?${params}`)
+
+    clearTimeout(snapshotTimeoutRef.current)
+    snapshotTimeoutRef.current = setTimeout(() => {
+      storeRef.current.setSnapshotReady(true)
+    }, SNAPSHOT_TIMEOUT)
 
     ws.onopen = () => {
       console.log('WebSocket connected')
@@ -39,11 +70,54 @@ export function useWebSocket() {
     }
 
     ws.onmessage = (event) => {
+      frameQueueRef.current = frameQueueRef.current.then(() => handleFrame(event.data))
+    }
+
+    const handleFrame = async (data: string | Blob) => {
       try {
-        const msg = JSON.parse(event.data)
+        const msg = await decodeFrame(data)
         const store = storeRef.current
+        if (typeof msg.seq === 'number') {
+          lastSeqRef.current = msg.seq
+        }
 
         switch (msg.type) {
+          case 'hello':
+            epochRef.current = msg.data.epoch as string
+            break
+
+          case 'resumed':
+            // Missed events follow as regular frames, no reload needed
+            clearTimeout(snapshotTimeoutRef.current)
+            store.setSnapshotReady(true)
+            break
+
+          case 'resync':
+            // Event log rolled over or the server restarted: a fresh snapshot follows
+            lastSeqRef.current = undefined
+            queryClient.invalidateQueries({ queryKey: ['messages'] })
+            break
+
+          case 'snapshot': {
+            const snapshot = msg.data as Snapshot
+            lastSeqRef.current = snapshot.seq
+            store.setStatus(snapshot.status)
+            store.setNodes(snapshot.nodes)
+            store.setChannels(snapshot.channels)
+            queryClient.setQueryData(['nodes'], snapshot.nodes)
+            queryClient.setQueryData(['channels'], snapshot.channels)
+            for (const [chatKey, messages] of Object.entries(snapshot.messages)) {
+              const id = chatKey.slice(chatKey.indexOf(':') + 1)
+              const queryKey = chatKey.startsWith('channel:')
+                ? messagesQueryKey(Number(id), undefined)
+                : messagesQueryKey(undefined, id)
+              queryClient.setQueryData(queryKey, messages)
+            }
+            clearTimeout(snapshotTimeoutRef.current)
+            store.setSnapshotReady(true)
+            break
+          }
+
           case 'connection_status':
             store.setStatus(msg.data as ConnectionStatus)
             break
@@ -61,7 +135,7 @@ export function useWebSocket() {
               reply_id?: number
             }
 
-            store.addMessage({
+            const message: Message = {
               id: data.packet_id || Date.now(),
               packet_id: data.packet_id,
               sender: data.sender,
@@ -74,12 +148,18 @@ export function useWebSocket() {
               ack_status: 'received',
               is_outgoing: false,
               reply_id: data.reply_id,
-            })
+            }
+            store.addMessage(message)
 
             const currentChat = store.currentChat
 
             const isDM =
               data.receiver && data.receiver !== '^all' && data.receiver !== 'broadcast'
+            addCachedMessage(
+              queryClient,
+              isDM ? messagesQueryKey(undefined, data.sender) : messagesQueryKey(data.channel, undefined),
+              message
+            )
             const chatKey = isDM ? `dm:${data.sender}` : `channel:${data.channel}`
             const isCurrentChat =
               (isDM &&
@@ -101,6 +181,9 @@ export function useWebSocket() {
 
             if (!isFromSelf && shouldMarkUnread) {
               store.incrementUnreadForChat(chatKey)
+            } else if (!isFromSelf) {
+              // Seen right away in the open chat, keep the server read marker in step
+              markConversationRead(chatKey)
             }
 
             // Auto-create tab for new messages
@@ -135,6 +218,7 @@ export function useWebSocket() {
               msg.data.packet_id as number,
               msg.data.status as Message['ack_status']
             )
+            updateCachedAck(queryClient, msg.data.packet_id as number, msg.data.status as Message['ack_status'])
             break
 
           case 'node_update':
@@ -145,6 +229,17 @@ export function useWebSocket() {
             store.setTracerouteResult(msg.data as TracerouteResult)
             break
 
+          case 'presence': {
+            const presence = msg.data as PresenceEvent
+            store.updateNode({ id: presence.id, lastHeard: Math.floor(presence.last_heard) } as Node)
+            break
+          }
+
+          case 'alert':
+            store.addAlert(msg.data as Alert)
+            playNotification()
+            break
+
           case 'position':
           case 'telemetry':
             if (msg.data.from) {
@@ -164,6 +259,8 @@ export function useWebSocket() {
     ws.onclose = () => {
       console.log('WebSocket disconnected')
       wsRef.current = null
+      clearTimeout(snapshotTimeoutRef.current)
+      storeRef.current.setSnapshotReady(true)
 
       // Exponential backoff with max 30s
       const delay = Math.min(1000 * Math.pow(2, reconnectAttempts.current), 30000)
@@ -186,6 +283,7 @@ export function useWebSocket() {
     connect()
     return () => {
       clearTimeout(reconnectRef.current)
+      clearTimeout(snapshotTimeoutRef.current)
       wsRef.current?.close()
     }
     // eslint-disable-next-line react-hooks/exhaustive-deps
@@ -1,6 +1,6 @@
 import { create } from 'zustand'
 import { persist } from 'zustand/middleware'
-import type { Node, Channel, Message, ConnectionStatus, ChatTarget, TracerouteResult, OpenTab } from '@/types'
+import type { Node, Channel, Message, ConnectionStatus, ChatTarget, TracerouteResult, OpenTab, Alert } from '@/types'
 
 // Helper to generate tab id from ChatTarget
 export function getChatKey(target: ChatTarget): string {
@@ -12,6 +12,10 @@ interface MeshState {
   status: ConnectionStatus
   setStatus: (status: ConnectionStatus) => void
 
+  // Initial state handshake: REST loads wait until the WS snapshot arrived (or failed)
+  snapshotReady: boolean
+  setSnapshotReady: (ready: boolean) => void
+
   // Nodes
   nodes: Node[]
   setNodes: (nodes: Node[]) => void
@@ -35,6 +39,10 @@ interface MeshState {
   tracerouteResult: TracerouteResult | null
   setTracerouteResult: (result: TracerouteResult | null) => void
 
+  // Keyword alerts received this session, newest first
+  alerts: Alert[]
+  addAlert: (alert: Alert) => void
+
   // Selected node for info panel
   selectedNode: Node | null
   setSelectedNode: (node: Node | null) => void
@@ -53,6 +61,7 @@ interface MeshState {
   incrementUnreadForChat: (chatKey: string) => void
   resetUnreadForChat: (chatKey: string) => void
   getUnreadForChat: (chatKey: string) => number
+  setUnreadPerChat: (counts: Record<string, number>) => void
 
   // Open tabs (persisted in localStorage)
   openTabs: OpenTab[]
@@ -67,6 +76,9 @@ export const useMeshStore = create<MeshState>()(
       status: { connected: false },
       setStatus: (status) => set({ status }),
 
+      snapshotReady: false,
+      setSnapshotReady: (ready) => set({ snapshotReady: ready }),
+
       nodes: [],
       setNodes: (nodes) => set({ nodes }),
       updateNode: (node) =>
@@ -121,6 +133,9 @@ export const useMeshStore = create<MeshState>()(
       tracerouteResult: null,
       setTracerouteResult: (result) => set({ tracerouteResult: result }),
 
+      alerts: [],
+      addAlert: (alert) => set((state) => ({ alerts: [alert, ...state.alerts].slice(0, 100) })),
+
       selectedNode: null,
       setSelectedNode: (node) => set({ selectedNode: node }),
 
@@ -155,6 +170,11 @@ export const useMeshStore = create<MeshState>()(
       getUnreadForChat: (chatKey: string): number => {
         return get().unreadPerChat[chatKey] || 0
       },
+      setUnreadPerChat: (counts) =>
+        set({
+          unreadPerChat: counts,
+          unreadCount: Object.values(counts).reduce((sum, n) => sum + n, 0),
+        }),
 
       // Tabs management
       openTabs: [],
@@ -42,6 +42,22 @@ export interface Message {
   is_outgoing?: boolean
   reactions?: Record<string, string[]> // emoji -> [senderIds]
   reply_id?: number
+  reply_to?: Pick<Message, 'id' | 'packet_id' | 'sender' | 'text' | 'timestamp' | 'is_outgoing'> | null // with ?parents=true
+  depth?: number // thread responses only
+}
+
+export interface Conversation {
+  key: string // "channel:0" or "dm:!abc123"
+  last_message_id: number | null
+  last_packet_id: number | null
+  last_sender: string | null
+  last_text: string | null
+  last_timestamp: string | null
+  last_ack_status: Message['ack_status'] | null
+  last_is_outgoing: number
+  message_count: number
+  unread: number
+  last_read_id: number | null
 }
 
 export interface ConnectionStatus {
@@ -61,9 +77,57 @@ export interface TracerouteResult {
   snr_back: number[]
 }
 
+export interface Alert {
+  id?: number // set on alerts loaded from /api/alerts
+  rule: string
+  severity: 'info' | 'warning' | 'critical'
+  matches: string[]
+  packet_id?: number
+  sender: string
+  receiver?: string | null
+  channel: number
+  text: string
+  rx_time_ms: number
+}
+
+export interface Geofence {
+  id: number
+  name: string
+  polygon: [number, number][] // [latitude, longitude]
+  nodes: string[] // tracked nodes, empty for all
+  inside?: string[] // nodes currently inside (GET /api/geofences)
+}
+
+export interface GeofenceEvent {
+  event: 'enter' | 'exit'
+  fence_id: number
+  fence: string
+  node: string
+  latitude: number
+  longitude: number
+  time: number
+}
+
+export interface PresenceEvent {
+  id: string
+  status: 'online' | 'offline'
+  last_heard: number // epoch seconds
+}
+
+export interface Snapshot {
+  status: ConnectionStatus
+  nodes: Node[]
+  channels: Channel[]
+  messages: Record<string, Message[]> // keyed like chat tabs: "channel:0" or "dm:!abc123"
+  epoch: string
+  seq: number
+}
+
 export interface WSMessage {
-  type: 'message' | 'ack' | 'node_update' | 'connection_status' | 'traceroute' | 'position' | 'telemetry'
+  type: 'hello' | 'snapshot' | 'resumed' | 'resync' | 'message' | 'ack' | 'node_update' | 'connection_status' | 'traceroute' | 'position' | 'telemetry'
+    | 'node_info' | 'neighbor_info' | 'waypoint' | 'range_test' | 'store_forward'
   data: Record<string, unknown>
+  seq?: number
 }
 
 export type ChatTarget =